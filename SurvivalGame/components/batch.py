@@ -0,0 +1,30 @@
+from collections.abc import Hashable
+from SurvivalGame.components.abstract import AbstractEntity
+from typing import Any
+
+class PathBatch:
+    """
+    Collect the path searches requested during a frame and run them in batches at the end of the frame.
+
+    A component requesting a search provides get_batch_key(request), the requests with the same
+    component type and key are passed together to the run_batch(key, requests) of that type
+    """
+    def __init__(self):
+        self.pending: dict[Any, tuple[AbstractEntity, Any]] = {}
+        self.searched = 0
+
+    def request(self, component: Any, entity: AbstractEntity, request: Any):
+        self.pending[component] = (entity, request)
+
+    def cancel(self, entity: AbstractEntity):
+        for component in [component for component, (owner, _) in self.pending.items() if owner is entity]:
+            del self.pending[component]
+
+    def update(self):
+        groups: dict[tuple[type, Hashable], list[tuple[Any, AbstractEntity, Any]]] = {}
+        for component, (entity, request) in self.pending.items():
+            groups.setdefault((type(component), component.get_batch_key(request)), []).append((component, entity, request))
+        self.pending.clear()
+        for (comp_type, key), requests in groups.items():
+            comp_type.run_batch(key, requests)
+            self.searched += len(requests)
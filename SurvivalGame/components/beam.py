@@ -0,0 +1,88 @@
+from SurvivalGame.components.navgraph import NavGraph, NavQuery
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+import numpy as np
+
+def beam_search(graph: NavGraph, queries: list[NavQuery], beam_width: int, max_depth: int) -> list[list[Point] | None]:
+    """
+    Run the beam searches of many queries on the same graph together, one depth at a time.
+    A path is in order from the end to the first step, None when the end wasn't reached within max_depth
+    """
+    count, size = len(queries), graph.node_count + 2
+    rows = np.arange(count)
+    start_ids = np.array([query.start_id for query in queries], dtype=np.intp)
+    end_ids = np.array([query.end_id for query in queries], dtype=np.intp)
+    ends = np.array([query.end for query in queries], dtype=np.float64).reshape(-1, 2)
+    coords = np.zeros((size, 2))
+    coords[:graph.node_count] = graph.coords
+    # The nodes in sight of each end, they get an extra edge to it
+    sees_end = np.zeros((count, size), dtype=bool)
+    for row, query in enumerate(queries):
+        sees_end[row, query.end_from] = True
+    visited = np.zeros((count, size), dtype=bool)
+    visited[rows, start_ids] = True
+    came_from = np.full((count, size), -1, dtype=np.intp)
+    results: list[list[Point] | None] = [None] * count
+    # The start is expanded alone on the first depth, every query has its own neighbours for it
+    beam = start_ids[:, None]
+    for depth in range(max_depth):
+        reached = (beam == end_ids[:, None]).any(axis=1)
+        for row in np.flatnonzero(reached).tolist():
+            results[row] = get_path(queries[row], came_from[row])
+        beam = np.where(reached[:, None], -1, beam)
+        # -- Expand every beam at once --
+        if depth == 0:
+            cand_rows = np.repeat(rows, [len(query.start_neighbours) for query in queries])
+            cand = np.array([node for query in queries for node in query.start_neighbours], dtype=np.intp)
+            parents = start_ids[cand_rows]
+            searching = ~reached[cand_rows]
+            cand_rows, cand, parents = cand_rows[searching], cand[searching], parents[searching]
+        else:
+            beam_rows, beam_cols = np.nonzero(beam >= 0)
+            nodes = beam[beam_rows, beam_cols]
+            on_graph, to_end = nodes < graph.node_count, sees_end[beam_rows, nodes]
+            graph_rows, graph_nodes = beam_rows[on_graph], nodes[on_graph]
+            counts = graph.indptr[graph_nodes + 1] - graph.indptr[graph_nodes]
+            firsts = np.repeat(graph.indptr[graph_nodes] - np.cumsum(counts) + counts, counts)
+            cand_rows = np.concatenate([np.repeat(graph_rows, counts), beam_rows[to_end]])
+            cand = np.concatenate([graph.indices[firsts + np.arange(counts.sum())], end_ids[beam_rows[to_end]]])
+            parents = np.concatenate([np.repeat(graph_nodes, counts), nodes[to_end]])
+            # Keep the candidates in the order of the beam, the edge to the end after the other edges of a node
+            order = np.argsort(np.concatenate([np.repeat(np.flatnonzero(on_graph), counts), np.flatnonzero(to_end)]), kind='stable')
+            cand_rows, cand, parents = cand_rows[order], cand[order], parents[order]
+        # A node is claimed by the first beam node reaching it
+        fresh = ~visited[cand_rows, cand]
+        cand_rows, cand, parents = cand_rows[fresh], cand[fresh], parents[fresh]
+        _, first = np.unique(cand_rows * size + cand, return_index=True)
+        first.sort()
+        cand_rows, cand, parents = cand_rows[first], cand[first], parents[first]
+        visited[cand_rows, cand] = True
+        came_from[cand_rows, cand] = parents
+        if len(cand) == 0:
+            break
+        # -- Keep the beam_width candidates closest to the end of each query --
+        scores = np.hypot(*(coords[cand] - ends[cand_rows]).T)
+        scores[cand == end_ids[cand_rows]] = 0.0
+        counts = np.bincount(cand_rows, minlength=count)
+        offsets = np.cumsum(counts) - counts
+        width = int(counts.max())
+        table = np.full((count, width), INF)
+        nodes = np.full((count, width), -1, dtype=np.intp)
+        cols = np.arange(len(cand)) - offsets[cand_rows]
+        table[cand_rows, cols] = scores
+        nodes[cand_rows, cols] = cand
+        if width > beam_width:
+            keep = np.argpartition(table, beam_width - 1, axis=1)[:, :beam_width]
+            table, nodes = np.take_along_axis(table, keep, axis=1), np.take_along_axis(nodes, keep, axis=1)
+        ranked = np.argsort(table, axis=1, kind='stable')
+        table, beam = np.take_along_axis(table, ranked, axis=1), np.take_along_axis(nodes, ranked, axis=1)
+        beam[table == INF] = -1
+    return results
+
+def get_path(query: NavQuery, came_from: np.ndarray) -> list[Point]:
+    path: list[Point] = []
+    node = query.end_id
+    while node != query.start_id:
+        path.append(query.to_point(node))
+        node = int(came_from[node])
+    return path
@@ -0,0 +1,79 @@
+from time import perf_counter
+from SurvivalGame.components.navgraph import NavQuery
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+import numpy as np
+
+class BacktrackSearch:
+    """
+    Backtracking over the corners of a compiled graph. Each step assigns the next corner of the path,
+    trying the corners closest to the end first, until the end itself can be assigned.
+
+    The corners in sight are read from the visibility matrix of the graph, so a new step is only checked
+    against the last one. A corner with no unassigned corner in sight is pruned before it is assigned,
+    and a corner whose every choice failed is remembered as a dead end for the rest of the search.
+    The search gives up once it has assigned max_nodes corners or ran for budget_ms
+    """
+    # Check the clock every this many assigned corners
+    CLOCK_EVERY = 16
+    def __init__(self, max_nodes: int = CSP_MAX_NODES, budget_ms: float = CSP_BUDGET_MS):
+        self.max_nodes = max_nodes
+        self.budget = budget_ms / 1000
+        self.nodes = 0
+        self.exhausted = False
+
+    def search(self, query: NavQuery) -> list[Point] | None:
+        """
+        Get the points from the start to the end, without the start
+        """
+        if query.end_id == query.start_id:
+            return [query.end]
+        graph = query.graph
+        visibility = graph.visibility
+        end_id = query.end_id
+        # The end is in sight of the corners in end_from, and is the goal itself
+        goal_mask = sum(1 << node for node in query.end_from) | (1 << end_id)
+        end_distance: list[float] = np.hypot(*(graph.coords - query.end).T).tolist() + [INF, 0.0]
+        end_distance[end_id] = 0.0
+
+        def get_domain(node: int) -> list[int]:
+            values = query.start_neighbours if node == query.start_id else graph.neighbours[node]
+            if goal_mask >> node & 1 and node != query.start_id:
+                values = [*values, end_id]
+            return sorted(values, key=end_distance.__getitem__)
+
+        deadline = perf_counter() + self.budget
+        self.nodes = 0
+        self.exhausted = False
+        assigned = 1 << query.start_id
+        failed = 0
+        picked: list[int] = []
+        stack = [(query.start_id, iter(get_domain(query.start_id)))]
+        while stack:
+            node, values = stack[-1]
+            for value in values:
+                if (assigned | failed) >> value & 1:
+                    continue
+                if value == end_id:
+                    picked.append(value)
+                    return [query.to_point(node) for node in picked]
+                self.nodes += 1
+                if self.nodes >= self.max_nodes or (self.nodes % self.CLOCK_EVERY == 0 and perf_counter() > deadline):
+                    self.exhausted = True
+                    return None
+                # Forward checking, a corner that can't see the end nor any free corner is a dead end
+                if not goal_mask >> value & 1 and not visibility[value] & ~(assigned | failed | (1 << value)):
+                    failed |= 1 << value
+                    continue
+                assigned |= 1 << value
+                picked.append(value)
+                stack.append((value, iter(get_domain(value))))
+                break
+            else:
+                # Every choice after this corner failed, undo it
+                stack.pop()
+                if picked:
+                    picked.pop()
+                assigned &= ~(1 << node)
+                failed |= 1 << node
+        return None
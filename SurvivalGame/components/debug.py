@@ -4,7 +4,7 @@ from SurvivalGame.components.abstract import EntityBase, PhysicComponent
 from SurvivalGame.components.camera import CameraComponent
 from SurvivalGame.components.entity import EnemyType
 from SurvivalGame.components.grid import SpatialGrid
-from SurvivalGame.components.pathfind import AOSearching, BackTrackCSP, InformedPathFind, LocalPathFind, PathFindComponent, QLearningPathFind, UninformedPathFind
+from SurvivalGame.components.pathfind import AOSearching, BackTrackCSP, FlowFieldPathFind, HPAPathFind, InformedPathFind, JPSPathFind, LocalPathFind, PathFindComponent, QLearningPathFind, UninformedPathFind
 from SurvivalGame.components.render import LayerId, LayeredRender
 from SurvivalGame.components.sprites import BasicSprite
 from SurvivalGame.const import *
@@ -34,6 +34,7 @@ class Debugger(EntityBase):
         overlay = pg.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pg.SRCALPHA)
         overlay.fill(CL_TRANS)
         self.add_component(BasicSprite, overlay, layer=LayerId.OVERLAY)
+        self.font = pg.font.Font(None, 20)
         
     def update(self, scene: Any = None, events: list[pg.Event] = [], **kwargs):
         if not self.switch.active:
@@ -49,18 +50,23 @@ class Debugger(EntityBase):
                     enemy: EntityBase = scene.enemy_spawn.spawn(EnemyType.GHOUL)
                 elif event.key == pg.K_p:
                     self.switch.draw_pathfind = not self.switch.draw_pathfind
+                elif event.key == pg.K_h:
+                    self.switch.draw_pathcache = not self.switch.draw_pathcache
                 elif event.key == pg.K_q:
                     scene.pause = not scene.pause
                 elif event.key == pg.K_0:
                     scene.enemy_spawn.enable = False
-                elif event.key == pg.K_1 or event.key == pg.K_2 or event.key == pg.K_3 or event.key == pg.K_4 or event.key == pg.K_5 or event.key == pg.K_6:
+                elif event.key == pg.K_1 or event.key == pg.K_2 or event.key == pg.K_3 or event.key == pg.K_4 or event.key == pg.K_5 or event.key == pg.K_6 or event.key == pg.K_7 or event.key == pg.K_8 or event.key == pg.K_j:
                     algo = {
                         pg.K_1: UninformedPathFind,
                         pg.K_2: InformedPathFind,
                         pg.K_3: LocalPathFind,
                         pg.K_4: AOSearching,
                         pg.K_5: BackTrackCSP,
-                        pg.K_6: QLearningPathFind
+                        pg.K_6: QLearningPathFind,
+                        pg.K_7: FlowFieldPathFind,
+                        pg.K_8: HPAPathFind,
+                        pg.K_j: JPSPathFind
                     }
                     print('Spawning', algo[event.key])
                     #ENEMY_TYPE_TO_SKIN[EnemyType.UNKNOWN] = ENEMY_TYPE_TO_SKIN[choice([EnemyType.WEAK_ZOMBIE, EnemyType.STRONG_ZOMBIE, EnemyType.WEAK_SKELETON, EnemyType.STRONG_SKELETON, EnemyType.GHOUL])]
@@ -73,7 +79,12 @@ class Debugger(EntityBase):
                 elif event.key == pg.K_l:
                     scene.enemy_spawn.enable = not scene.enemy_spawn.enable 
                 elif event.key == pg.K_SPACE:
-                    scene.add_entity(scene.player.spawn_bullet())
+                    projectile_system = kwargs.get('projectile_system', None)
+                    if projectile_system is not None:
+                        position, direction = scene.player.get_aim()
+                        projectile_system.spawn(position, (direction.x, direction.y))
+                    else:
+                        scene.add_entity(scene.player.spawn_bullet())
                     
 
         surf = self.get_component(BasicSprite).image
@@ -111,4 +122,19 @@ class Debugger(EntityBase):
                         for idx, (pA, pB) in enumerate(zip(path, path[1:])):
                             pg.draw.aaline(surf, pg.Color.from_hsva(240 * (idx / pathlen), 100, 100, 100), self._render.to_screen(pA), self._render.to_screen(pB), 3)
                         
-    
\ No newline at end of file
+    
+        if self.switch.draw_pathcache:
+            cache = scene.map.template_nav.path_cache
+            total = max(cache.hits + cache.misses, 1)
+            text = f'Path cache: {cache.hits} hits, {cache.misses} misses ({cache.hits / total:.0%}), {len(cache.entries)}/{cache.capacity} paths'
+            text_surf = self.font.render(text, True, CL_WHITE)
+            surf.blit(text_surf, text_surf.get_rect(bottomleft=(4, SCREEN_HEIGHT - 4)))
+            scheduler = scene.path_scheduler
+            text = f'Path requests: {len(scheduler.pending)} pending, {scheduler.completed} done, {scheduler.elapsed * 1000:.2f}/{scheduler.budget * 1000:g}ms'
+            text_surf = self.font.render(text, True, CL_WHITE)
+            surf.blit(text_surf, text_surf.get_rect(bottomleft=(4, SCREEN_HEIGHT - 24)))
+            workers = scene.path_workers
+            if workers is not None:
+                text = f'Path workers: {workers.queue_depth} queued, {workers.latency * 1000:.2f}ms round trip'
+                text_surf = self.font.render(text, True, CL_WHITE)
+                surf.blit(text_surf, text_surf.get_rect(bottomleft=(4, SCREEN_HEIGHT - 44)))
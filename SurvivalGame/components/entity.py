@@ -5,6 +5,7 @@ from SurvivalGame.components.camera import CameraComponent
 from SurvivalGame.components.controller import PlayerController
 from SurvivalGame.components.grid import SpatialGrid
 from SurvivalGame.components.physic import BoundingBoxCollider, BulletCollider
+from SurvivalGame.components.projectile import ProjectileSystem
 from SurvivalGame.components.render import LayerId, LayeredRender
 from SurvivalGame.components.sprites import BasicSprite, SpriteSheetImage
 from SurvivalGame.components.state import StateComponent
@@ -24,7 +25,7 @@ class Bullet(EntityBase):
         if rotation != 0:
             sprite = pg.transform.rotate(sprite, rotation)
         self.add_component(BasicSprite, sprite, layer=LayerId.OBJECT, center=position)
-        self.add_component(BulletCollider, bound=(2, 2), direction=direction, speed=300, is_solid=False)
+        self.add_component(BulletCollider, bound=BULLET_BOUND, direction=direction, speed=BULLET_SPEED, is_solid=False)
         self.add_component(BulletTrigger)
     def update(self, paused=False, scene: SupportsEntityOperation | None = None, **kwargs):
         if 'killing' in self.tags:
@@ -47,15 +48,23 @@ class Player(EntityBase):
         self.attack_event = pg.event.custom_type()
         pg.time.set_timer(self.attack_event, 500)
 
-    def update(self, paused = False, scene: SupportsEntityOperation | None = None, events: list[pg.Event] = [], collide_grid: SpatialGrid | None = None, **kwargs):
+    def update(self, paused = False, scene: SupportsEntityOperation | None = None, events: list[pg.Event] = [], collide_grid: SpatialGrid | None = None,
+               projectile_system: ProjectileSystem | None = None, **kwargs):
         super().update(paused = paused, scene = scene, events=events, collide_grid=collide_grid, **kwargs)
         if paused or scene is None or not events or collide_grid is None:
             return
         for event in events:
             if event.type == self.attack_event:
-                scene.add_entity(self.spawn_bullet())
+                if projectile_system is not None:
+                    position, direction = self.get_aim()
+                    projectile_system.spawn(position, (direction.x, direction.y))
+                else:
+                    scene.add_entity(self.spawn_bullet())
 
-    def spawn_bullet(self):
+    def get_aim(self) -> tuple[Point, pg.Vector2]:
+        """
+        Get where a bullet starts and the direction it flies, toward the mouse or random without a camera
+        """
         camera = self.get_component(CameraComponent, None)
         current_pos = self.get_component(BasicSprite).rect.center
         if camera is None:
@@ -64,7 +73,11 @@ class Player(EntityBase):
         else:
             render = camera.render
             direction = pg.Vector2(pg.mouse.get_pos()) - render.to_screen(current_pos)
-            direction.normalize_ip()
+        return current_pos, direction
+
+    def spawn_bullet(self):
+        current_pos, direction = self.get_aim()
+        direction.normalize_ip()
         return Bullet(position=current_pos, direction=(direction.x, direction.y))
         
 class EnemyType(IntEnum):
@@ -81,7 +94,7 @@ class Enemy(EntityBase):
         self.type_name = type_name
         self.add_component(BasicSprite, layer=LayerId.OBJECT, center=spawn)
         self.add_component(EnemyAnimator, SpriteSheetImage.from_yaml(join(PT_SPRITE, f'{skin}.png')))
-        self.add_component(BoundingBoxCollider, (10, 11), speed = speed)
+        self.add_component(BoundingBoxCollider, ENEMY_BOUND, speed = speed)
         self.add_component(StateComponent)
         self.add_tag('enemy')
     
@@ -1,9 +1,10 @@
 from SurvivalGame.components.abstract import EntityBase, PhysicComponent, SpriteComponent
 from SurvivalGame.typing import *
 from SurvivalGame.const import *
-from collections.abc import Generator, Iterable
+from collections.abc import Callable, Generator, Iterable
+from typing import NamedTuple
+import numpy as np
 import pygame as pg
-import bisect
 import math
 
 def to_cell(*args) -> Generator[int]:
@@ -49,43 +50,342 @@ def remove_by_identity(lst, obj):
     )
 
 
+def get_cover(rect: Rect) -> list[Point]:
+    """
+    Get every cell a rect covers, even when it's smaller than a cell
+    """
+    xmin, xmax, ymin, ymax = to_cell(rect.left, math.ceil(rect.right) - 1, rect.top, math.ceil(rect.bottom) - 1)
+    return [(gx, gy) for gx in range(xmin, xmax + 1) for gy in range(ymin, ymax + 1)]
+
+
+def get_cells(rect: Rect) -> list[Point]:
+    """
+    Get the cells a rect is in, a rect smaller than a cell is only in the cell of its center
+    """
+    if rect.w < CELL_SIZE and rect.h < CELL_SIZE:
+        return [(int(rect.centerx // CELL_SIZE), int(rect.centery // CELL_SIZE))]
+    return get_cover(rect)
+
+
+def walk_cells(start: Point, end: Point) -> Generator[tuple[Point, float]]:
+    """
+    Walk the cells a segment goes through in order (DDA), each with the part of the segment done when it leaves the cell
+    """
+    x, y = int(start[0] // CELL_SIZE), int(start[1] // CELL_SIZE)
+    end_x, end_y = int(end[0] // CELL_SIZE), int(end[1] // CELL_SIZE)
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    step_x, step_y = (1 if dx > 0 else -1), (1 if dy > 0 else -1)
+    delta_x = CELL_SIZE / abs(dx) if dx else math.inf
+    delta_y = CELL_SIZE / abs(dy) if dy else math.inf
+    next_x = ((x + (dx > 0)) * CELL_SIZE - start[0]) / dx if dx else math.inf
+    next_y = ((y + (dy > 0)) * CELL_SIZE - start[1]) / dy if dy else math.inf
+    for _ in range(abs(end_x - x) + abs(end_y - y)):
+        if next_x < next_y:
+            yield (x, y), next_x
+            x += step_x
+            next_x += delta_x
+        else:
+            yield (x, y), next_y
+            y += step_y
+            next_y += delta_y
+    yield (x, y), 1.0
+
+
+def clip_segment(rect: Rect, start: Point, end: Point) -> float | None:
+    """
+    Get the part of the segment done when it gets into the rect, None when it only grazes it, like ray_intersect
+    """
+    clip = rect.clipline(start, end)
+    if not clip or clip[0] == clip[1]:
+        return None
+    length = math.dist(start, end)
+    return min(math.dist(start, clip[0]), math.dist(start, clip[1])) / length
+
+
+class RayHit(NamedTuple):
+    # The part of the way done when the hit happens
+    t: float
+    # The rect hit, inflated by the bound of the query
+    rect: Rect
+    owner: EntityBase | None
+
+
+def get_cell_keys(cells: np.ndarray) -> np.ndarray:
+    return cells[:, 0].astype(np.int64) * (1 << 32) + cells[:, 1]
+
+
+def near_pairs(cells: np.ndarray, other_cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get every pair of a cell and an other cell in the 3x3 cells around it, as the indices of both
+    """
+    order = np.argsort(get_cell_keys(other_cells), kind='stable')
+    keys = get_cell_keys(other_cells)[order]
+    rows: list[np.ndarray] = []
+    cols: list[np.ndarray] = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            near = get_cell_keys(cells + (dx, dy))
+            firsts = np.searchsorted(keys, near, 'left')
+            counts = np.searchsorted(keys, near, 'right') - firsts
+            rows.append(np.repeat(np.arange(len(cells)), counts))
+            cols.append(order[np.repeat(firsts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())])
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def sweep_pairs(boxes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get every pair of overlapping boxes once, as the indices of both.
+    The boxes are sorted along x, each one is only tested with the next ones starting before its right side
+    """
+    order = np.argsort(boxes[:, 0], kind='stable')
+    ends = np.searchsorted(boxes[order, 0], boxes[order, 2], 'left')
+    counts = np.maximum(ends - np.arange(len(boxes)) - 1, 0)
+    firsts = np.repeat(np.arange(len(boxes)), counts)
+    seconds = firsts + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    first, second = order[firsts], order[seconds]
+    keep = (boxes[first, 2] > boxes[second, 0]) & (boxes[first, 1] < boxes[second, 3]) & (boxes[first, 3] > boxes[second, 1])
+    return first[keep], second[keep]
+
+def sweep_cross_pairs(boxes: np.ndarray, others: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get every pair of a box and an overlapping other box, as the indices of both.
+    The others are sorted along x, each box is only tested with the others starting between its left side less the widest other
+    and its right side
+    """
+    order = np.argsort(others[:, 0], kind='stable')
+    lefts = others[order, 0]
+    widest = (others[:, 2] - others[:, 0]).max(initial=0.0)
+    firsts = np.searchsorted(lefts, boxes[:, 0] - widest, 'right')
+    counts = np.maximum(np.searchsorted(lefts, boxes[:, 2], 'left') - firsts, 0)
+    first = np.repeat(np.arange(len(boxes)), counts)
+    second = order[np.repeat(firsts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+    keep = (boxes[first, 0] < others[second, 2]) & (boxes[first, 1] < others[second, 3]) & (boxes[first, 3] > others[second, 1])
+    return first[keep], second[keep]
+
+
 class SpatialGrid:
+    """
+    Grid of the collidables in two layers.
+
+    The static layer holds the rects of the map. The rects around each cell are baked into a tuple the first time the cell is queried.
+    The dynamic layer holds the entities in slots, each with its hitbox rect and its cells.
+    Moving an entity updates its hitbox, it's only taken out of its cells when it gets into another one
+    """
     def __init__(self):
-        self.map: dict[Point, list] = dict()
+        self.static: dict[Point, list[Rect]] = dict()
+        self.baked: dict[Point, tuple[tuple[Rect, None], ...]] = dict()
+        self.cells: dict[Point, list[int]] = dict()
+        # Entities by slot, a free slot holds None
+        self.bodies: list[EntityBase | None] = []
+        self.rects: list[Rect] = []
+        self.body_cells: list[list[Point]] = []
+        self.slots: dict[int, int] = dict()
+        self.free: list[int] = []
+        # Entities in more than one cell, queries only need to skip duplicates when there are some
+        self.spanning = 0
+        self.static_boxes: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        # The static rects inflated by a bound, in every cell they cover
+        self.inflated: dict[Point, dict[Point, list[Rect]]] = dict()
 
     def add(self, obj, /):
         rect = obj_get_rect(obj)
-        if rect.w < CELL_SIZE and rect.h < CELL_SIZE:
-            x, y = to_cell(rect.center)
-            bisect.insort_right(self.map.setdefault((x, y), []), obj, key=get_rank)
-        else:
-            xmin, xmax, ymin, ymax = to_cell(rect.left, math.ceil(rect.right) - 1, rect.top, math.ceil(rect.bottom) - 1)
-            for gx in range(xmin, xmax + 1):
-                for gy in range(ymin, ymax + 1):
-                    bisect.insort_right(self.map.setdefault((gx, gy), []), obj, key=get_rank)
+        if rect is obj:
+            for cell in get_cells(rect):
+                self.static.setdefault(cell, []).append(rect)
+            self.baked.clear()
+            self.static_boxes = None
+            self.inflated.clear()
+            return
+        if id(obj) in self.slots:
+            raise ValueError(f'{obj} is already in the grid')
+        slot = self.free.pop() if self.free else len(self.bodies)
+        if slot == len(self.bodies):
+            self.bodies.append(None)
+            self.rects.append(rect)
+            self.body_cells.append([])
+        cells = get_cells(rect)
+        self.bodies[slot], self.rects[slot], self.body_cells[slot] = obj, rect, cells
+        self.slots[id(obj)] = slot
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(slot)
+        self.spanning += len(cells) > 1
 
     def remove(self, obj, /):
-        rect = obj_get_rect(obj)
-        if rect.w < CELL_SIZE and rect.h < CELL_SIZE:
-            x, y = to_cell(rect.center)
-            remove_by_identity(self.map[(x, y)], obj)
-        else:
-            xmin, xmax, ymin, ymax = to_cell(rect.left, math.ceil(rect.right) - 1, rect.top, math.ceil(rect.bottom) - 1)
-            for gx in range(xmin, xmax + 1):
-                for gy in range(ymin, ymax + 1):
-                    remove_by_identity(self.map[(gx, gy)], obj)
+        slot = self.slots.pop(id(obj), None)
+        if slot is None:
+            if isinstance(obj, pg.Rect | pg.FRect):
+                for cell in get_cells(obj):
+                    remove_by_identity(self.static[cell], obj)
+                self.baked.clear()
+                self.static_boxes = None
+                self.inflated.clear()
+                return
+            raise ValueError(f'{obj} is not in the grid')
+        cells = self.body_cells[slot]
+        for cell in cells:
+            self.cells[cell].remove(slot)
+        self.spanning -= len(cells) > 1
+        self.bodies[slot] = None
+        self.body_cells[slot] = []
+        self.free.append(slot)
+
+    def move(self, obj, rect: Rect | None = None, /):
+        """
+        Update the hitbox of an entity after it moved, the new hitbox can be given when it's known
+        """
+        slot = self.slots[id(obj)]
+        if rect is None:
+            rect = obj_get_rect(obj)
+        self.rects[slot] = rect
+        cells = self.body_cells[slot]
+        if len(cells) == 1 and rect.w < CELL_SIZE and rect.h < CELL_SIZE:
+            cell = (int(rect.centerx // CELL_SIZE), int(rect.centery // CELL_SIZE))
+            if cell == cells[0]:
+                return
+        for cell in cells:
+            self.cells[cell].remove(slot)
+        self.spanning -= len(cells) > 1
+        cells = get_cells(rect)
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(slot)
+        self.spanning += len(cells) > 1
+        self.body_cells[slot] = cells
+
+    def bake(self, x: int, y: int):
+        seen: set[int] = set()
+        baked: list[tuple[Rect, None]] = []
+        for i in range(x - 1, x + 2):
+            for j in range(y - 1, y + 2):
+                for rect in self.static.get((i, j), ()):
+                    if id(rect) not in seen:
+                        seen.add(id(rect))
+                        baked.append((rect, None))
+        self.baked[(x, y)] = tuple(baked)
+        return self.baked[(x, y)]
 
     def get_collidables(self, point: Point, /):
-        obj_set = set()
-        x, y = to_cell(point)
+        x, y = int(point[0] // CELL_SIZE), int(point[1] // CELL_SIZE)
+        cells, bodies, rects = self.cells, self.bodies, self.rects
+        seen: set[int] | None = set() if self.spanning else None
         for i in range(x - 1, x + 2):
             for j in range(y - 1, y + 2):
-                for obj in self.map.get((i, j), []):
-                    obj_rect = obj_get_rect(obj)
-                    if id(obj) in obj_set:
+                for slot in cells.get((i, j), ()):
+                    if seen is not None:
+                        if slot in seen:
+                            continue
+                        seen.add(slot)
+                    yield rects[slot], bodies[slot]
+        baked = self.baked.get((x, y), None)
+        yield from baked if baked is not None else self.bake(x, y)
+
+    def get_inflated(self, bound: Point) -> dict[Point, list[Rect]]:
+        """
+        Get the static rects inflated by the bound in every cell they cover, built the first time the bound is used
+        """
+        if bound not in self.inflated:
+            seen: set[int] = set()
+            inflated: dict[Point, list[Rect]] = dict()
+            for rects in self.static.values():
+                for rect in rects:
+                    if id(rect) in seen:
                         continue
-                    obj_set.add(id(obj))
-                    if obj_rect is obj:
-                        yield obj_rect, None
-                    else:
-                        yield obj_rect, obj
\ No newline at end of file
+                    seen.add(id(rect))
+                    big = rect.inflate(bound)
+                    for cell in get_cover(big):
+                        inflated.setdefault(cell, []).append(big)
+            self.inflated[bound] = inflated
+        return self.inflated[bound]
+
+    def segment_blocked(self, start: Point, end: Point, bound: Point = (0, 0)) -> bool:
+        """
+        Check if a box of the bound moving from start to end goes through a static rect, the same as rect_scan_intersect.
+        Only the cells along the segment are tested
+        """
+        inflated = self.get_inflated(bound)
+        seen: set[int] = set()
+        for cell, _ in walk_cells(start, end):
+            for rect in inflated.get(cell, ()):
+                if id(rect) in seen:
+                    continue
+                seen.add(id(rect))
+                if clip_segment(rect, start, end) is not None:
+                    return True
+        return False
+
+    def cast(self, start: Point, end: Point, bound: Point = (0, 0), hit_bodies: Callable[[EntityBase], bool] | None = None, first = False) -> list[RayHit]:
+        """
+        Get what a box of the bound moving from start to end goes through, in the order it's hit.
+        The entities are only hit when hit_bodies accepts them, the walk stops at the first hit when first is set
+        """
+        inflated = self.get_inflated(bound)
+        # A small entity is only in the cell of its center, its inflated hitbox can reach the cells around
+        reach = 1 + math.ceil(max(bound) / 2 / CELL_SIZE)
+        hits: list[RayHit] = []
+        seen: set[int] = set()
+        seen_cells: set[Point] = set()
+        for (x, y), t_exit in walk_cells(start, end):
+            for rect in inflated.get((x, y), ()):
+                if id(rect) not in seen:
+                    seen.add(id(rect))
+                    t = clip_segment(rect, start, end)
+                    if t is not None:
+                        hits.append(RayHit(t, rect, None))
+            if hit_bodies is not None:
+                for i in range(x - reach, x + reach + 1):
+                    for j in range(y - reach, y + reach + 1):
+                        if (i, j) in seen_cells:
+                            continue
+                        seen_cells.add((i, j))
+                        for slot in self.cells.get((i, j), ()):
+                            body = self.bodies[slot]
+                            if id(body) in seen or not hit_bodies(body):
+                                continue
+                            seen.add(id(body))
+                            rect = self.rects[slot].inflate(bound)
+                            t = clip_segment(rect, start, end)
+                            if t is not None:
+                                hits.append(RayHit(t, rect, body))
+            # Whatever isn't found yet is hit after this cell
+            if first and hits and min(hit.t for hit in hits) <= t_exit:
+                break
+        hits.sort(key=lambda hit: hit.t)
+        return hits[:1] if first else hits
+
+    def raycast(self, start: Point, end: Point, hit_bodies: Callable[[EntityBase], bool] | None = None) -> RayHit | None:
+        """
+        Get the first thing the segment from start to end goes through
+        """
+        hits = self.cast(start, end, hit_bodies=hit_bodies, first=True)
+        return hits[0] if hits else None
+
+    def sweep(self, rect: Rect, end: Point, hit_bodies: Callable[[EntityBase], bool] | None = None) -> list[RayHit]:
+        """
+        Get what the rect goes through when its center moves to end, in the order it's hit
+        """
+        return self.cast(rect.center, end, rect.size, hit_bodies)
+
+    def get_static_boxes(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get the left, top, right and bottom of the static rects, with a row of cell and rect index for every cell of each rect
+        """
+        if self.static_boxes is None:
+            ids: dict[int, int] = {}
+            boxes: list[tuple[float, float, float, float]] = []
+            cells: list[Point] = []
+            rows: list[int] = []
+            for cell, rects in self.static.items():
+                for rect in rects:
+                    if id(rect) not in ids:
+                        ids[id(rect)] = len(boxes)
+                        boxes.append((rect.left, rect.top, rect.right, rect.bottom))
+                    cells.append(cell)
+                    rows.append(ids[id(rect)])
+            self.static_boxes = (np.array(boxes, dtype=np.float64).reshape(-1, 4), np.array(cells, dtype=np.int64).reshape(-1, 2), np.array(rows, dtype=np.intp))
+        return self.static_boxes
+
+    def get_body_boxes(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the left, top, right and bottom of the hitbox of every slot, with the slots holding an entity
+        """
+        boxes = np.array([(rect.left, rect.top, rect.right, rect.bottom) for rect in self.rects], dtype=np.float64).reshape(-1, 4)
+        return boxes, np.array([slot for slot, body in enumerate(self.bodies) if body is not None], dtype=np.intp)
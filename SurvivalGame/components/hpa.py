@@ -0,0 +1,182 @@
+from collections.abc import Callable
+from SurvivalGame.components.raster import Box, WalkRaster, pull_string
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+import heapq
+import math
+import numpy as np
+
+def get_runs(mask: np.ndarray) -> list[tuple[int, int]]:
+    """
+    Get the (first, last) index of every run of True in a 1D mask
+    """
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1).tolist(), (np.flatnonzero(edges == -1) - 1).tolist()))
+
+class HierarchicalMap:
+    """
+    A HPA* map over a walk raster.
+
+    The raster is split into square clusters, the walkable openings between two clusters are entrances.
+    The distances between the entrances of a cluster are searched once when the map is built.
+    A path is first searched over the entrances, then refined into cells one segment at a time
+    """
+    # Openings at least this wide get an entrance at both ends instead of one in the middle
+    WIDE_ENTRANCE = 6
+    def __init__(self, raster: WalkRaster, blocked: Callable[[Point, Point], bool], cluster_size: int = HPA_CLUSTER):
+        self.raster = raster
+        self.blocked = blocked
+        self.cluster_size = cluster_size
+        self.nodes: list[int] = []
+        self.node_ids: dict[int, int] = {}
+        self.edges: list[list[tuple[int, float]]] = []
+        self.cluster_nodes: dict[Point, list[int]] = {}
+        self.build_entrances()
+        self.build_intra_edges()
+
+    def get_cluster(self, idx: int) -> Point:
+        row, col = divmod(idx, self.raster.width)
+        return (col // self.cluster_size, row // self.cluster_size)
+
+    def get_box(self, cluster: Point) -> Box:
+        size = self.cluster_size
+        return (cluster[0] * size, cluster[1] * size, min((cluster[0] + 1) * size, self.raster.width), min((cluster[1] + 1) * size, self.raster.height))
+
+    def add_node(self, idx: int) -> int:
+        if idx not in self.node_ids:
+            self.node_ids[idx] = len(self.nodes)
+            self.nodes.append(idx)
+            self.edges.append([])
+            self.cluster_nodes.setdefault(self.get_cluster(idx), []).append(self.node_ids[idx])
+        return self.node_ids[idx]
+
+    def add_entrance(self, a: int, b: int):
+        node_a, node_b = self.add_node(a), self.add_node(b)
+        cost = self.raster.get_cost(a, b)
+        self.edges[node_a].append((node_b, cost))
+        self.edges[node_b].append((node_a, cost))
+
+    def build_entrances(self):
+        walkable, width, size = self.raster.walkable, self.raster.width, self.cluster_size
+        for border in range(size, width, size):
+            # Vertical border between the column border - 1 and border
+            mask = walkable[:, border - 1] & walkable[:, border]
+            for band in range(0, self.raster.height, size):
+                for first, last in get_runs(mask[band:band + size]):
+                    rows = (first, last) if last - first + 1 >= self.WIDE_ENTRANCE else ((first + last) // 2, )
+                    for row in rows:
+                        idx = (band + row) * width + border
+                        self.add_entrance(idx - 1, idx)
+        for border in range(size, self.raster.height, size):
+            mask = walkable[border - 1, :] & walkable[border, :]
+            for band in range(0, width, size):
+                for first, last in get_runs(mask[band:band + size]):
+                    cols = (first, last) if last - first + 1 >= self.WIDE_ENTRANCE else ((first + last) // 2, )
+                    for col in cols:
+                        idx = border * width + band + col
+                        self.add_entrance(idx - width, idx)
+
+    def build_intra_edges(self):
+        for cluster, node_ids in self.cluster_nodes.items():
+            box = self.get_box(cluster)
+            for i, node in enumerate(node_ids[:-1]):
+                dist, _ = self.raster.search(self.nodes[node], box=box)
+                for other in node_ids[i + 1:]:
+                    cost = dist.get(self.nodes[other], None)
+                    if cost is not None:
+                        self.edges[node].append((other, cost))
+                        self.edges[other].append((node, cost))
+
+    def connect(self, point: Point, idx: int) -> list[tuple[int, float]]:
+        """
+        Get the distance from a point to the entrances of its cluster.
+        Entrances in sight are reached straight, the cluster is only searched when none of them is
+        """
+        cluster = self.get_cluster(idx)
+        node_ids = self.cluster_nodes.get(cluster, [])
+        edges = []
+        for node in node_ids:
+            entrance = self.raster.to_point(self.nodes[node])
+            if not self.blocked(point, entrance):
+                edges.append((node, math.dist(point, entrance)))
+        if edges:
+            return edges
+        dist, _ = self.raster.search(idx, box=self.get_box(cluster))
+        return [(node, dist[self.nodes[node]]) for node in node_ids if self.nodes[node] in dist]
+
+    def find_path(self, start: Point, end: Point) -> list[Point] | None:
+        """
+        Search the entrances a path goes through, in order from the start and ending with the end.
+        Segments between the points aren't refined
+        """
+        if not self.blocked(start, end):
+            return [end]
+        start_idx, end_idx = self.raster.nearest_walkable(start), self.raster.nearest_walkable(end)
+        if start_idx is None or end_idx is None:
+            return None
+        # -- A* over the entrances, with -1 as the start and -2 as the end --
+        START, END = -1, -2
+        start_edges = self.connect(start, start_idx)
+        if self.get_cluster(start_idx) == self.get_cluster(end_idx):
+            dist, _ = self.raster.search(start_idx, end_idx, self.get_box(self.get_cluster(start_idx)))
+            if end_idx in dist:
+                start_edges.append((END, dist[end_idx]))
+        end_edges = dict(self.connect(end, end_idx))
+        end_x, end_y = self.raster.to_point(end_idx)
+        g_score: dict[int, float] = {START: 0.0}
+        came_from: dict[int, int] = {}
+        frontier = [(0.0, 0.0, START)]
+        while frontier:
+            _, curr_g, node = heapq.heappop(frontier)
+            if node == END:
+                break
+            if curr_g > g_score[node]:
+                continue
+            edges = start_edges if node == START else self.edges[node]
+            if node in end_edges:
+                edges = [*edges, (END, end_edges[node])]
+            for neighbour, cost in edges:
+                new_g = curr_g + cost
+                if new_g < g_score.get(neighbour, INF):
+                    g_score[neighbour] = new_g
+                    came_from[neighbour] = node
+                    if neighbour == END:
+                        heuristic = 0.0
+                    else:
+                        x, y = self.raster.to_point(self.nodes[neighbour])
+                        heuristic = math.hypot(x - end_x, y - end_y)
+                    heapq.heappush(frontier, (new_g + heuristic, new_g, neighbour))
+        else:
+            return None
+        path: list[Point] = [end]
+        node = came_from[END]
+        while node != START:
+            path.append(self.raster.to_point(self.nodes[node]))
+            node = came_from[node]
+        path.reverse()
+        return path
+
+    def refine(self, start: Point, goal: Point) -> list[Point] | None:
+        """
+        Refine a segment of the abstract path into waypoints, in order from the start and ending with the goal
+        """
+        if not self.blocked(start, goal):
+            return [goal]
+        start_idx, goal_idx = self.raster.nearest_walkable(start), self.raster.nearest_walkable(goal)
+        if start_idx is None or goal_idx is None:
+            return None
+        # Both ends are in the same or neighbouring clusters, search in the box around their clusters
+        (col_a, row_a), (col_b, row_b) = self.get_cluster(start_idx), self.get_cluster(goal_idx)
+        box_a, box_b = self.get_box((min(col_a, col_b), min(row_a, row_b))), self.get_box((max(col_a, col_b), max(row_a, row_b)))
+        box = (box_a[0], box_a[1], box_b[2], box_b[3])
+        _, parent = self.raster.search(start_idx, goal_idx, box)
+        if goal_idx not in parent:
+            _, parent = self.raster.search(start_idx, goal_idx)
+            if goal_idx not in parent:
+                return None
+        points = [self.raster.to_point(idx) for idx in self.raster.get_path(parent, goal_idx)]
+        if points:
+            points[-1] = goal
+        else:
+            points = [goal]
+        return pull_string(start, points, self.blocked)
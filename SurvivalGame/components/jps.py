@@ -0,0 +1,190 @@
+from collections import deque
+from SurvivalGame.components.raster import SQRT2, WalkRaster
+from SurvivalGame.const import *
+import heapq
+import numpy as np
+
+STRAIGHT = ((1, 0), (-1, 0), (0, 1), (0, -1))
+DIAGONAL = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+
+class JumpPointSearch:
+    """
+    Jump Point Search over a walk raster, with the same moves as WalkRaster.search.
+    Diagonal moves need both cells beside them to be walkable.
+
+    The raster is padded with a border of blocked cells so the jumps never check the bounds.
+    Where a straight jump stops only depends on the cell it starts from, so it is looked up instead of walked
+    """
+    def __init__(self, raster: WalkRaster):
+        self.raster = raster
+        self.stride = raster.width + 2
+        padded = np.zeros((raster.height + 2, raster.width + 2), dtype=bool)
+        padded[1:-1, 1:-1] = raster.walkable
+        self.cells: list[bool] = padded.ravel().tolist()
+        self.stops = {direction: self.build_stops(*direction) for direction in STRAIGHT}
+        self.regions = self.build_regions()
+        self.goal = (0, 0)
+
+    def is_forced(self, idx: int, dx: int, dy: int):
+        """
+        Whether a straight move gets to the cell next to a wall it was walking along, where it has to turn
+        """
+        cells, stride = self.cells, self.stride
+        if dx:
+            return (cells[idx - stride] and not cells[idx - stride - dx]) or (cells[idx + stride] and not cells[idx + stride - dx])
+        return (cells[idx - 1] and not cells[idx - 1 - dy * stride]) or (cells[idx + 1] and not cells[idx + 1 - dy * stride])
+
+    def build_stops(self, dx: int, dy: int) -> list[int]:
+        """
+        Get the first cell a straight move from each cell stops at, a blocked cell or a jump point
+        """
+        cells, stride = self.cells, self.stride
+        step = dx + dy * stride
+        stops = list(range(len(cells)))
+        # Walk every line backward so the stop of the next cell is known
+        order = range(len(cells) - 1, -1, -1) if step > 0 else range(len(cells))
+        for idx in order:
+            if cells[idx] and not self.is_forced(idx, dx, dy):
+                stops[idx] = stops[idx + step]
+        return stops
+
+    def build_regions(self) -> list[int]:
+        """
+        Label the cells reachable from each other. Diagonal moves can't cut corners so the straight moves are enough
+        """
+        cells, stride = self.cells, self.stride
+        regions = [-1] * len(cells)
+        region = 0
+        for seed, walkable in enumerate(cells):
+            if not walkable or regions[seed] != -1:
+                continue
+            regions[seed] = region
+            frontier = deque([seed])
+            while frontier:
+                idx = frontier.popleft()
+                for neighbour in (idx + 1, idx - 1, idx + stride, idx - stride):
+                    if cells[neighbour] and regions[neighbour] == -1:
+                        regions[neighbour] = region
+                        frontier.append(neighbour)
+            region += 1
+        return regions
+
+    def jump_straight(self, x: int, y: int, dx: int, dy: int) -> tuple[int, int] | None:
+        stride = self.stride
+        stop = self.stops[(dx, dy)][y * stride + x]
+        stop_y, stop_x = divmod(stop, stride)
+        goal_x, goal_y = self.goal
+        # The goal is on the way to the stop
+        if dx and goal_y == y and min(x, stop_x) <= goal_x <= max(x, stop_x):
+            return self.goal
+        if dy and goal_x == x and min(y, stop_y) <= goal_y <= max(y, stop_y):
+            return self.goal
+        return (stop_x, stop_y) if self.cells[stop] else None
+
+    def jump(self, x: int, y: int, dx: int, dy: int) -> tuple[int, int] | None:
+        """
+        Move from (x, y) in the direction until a jump point, the goal or a blocked cell
+        """
+        if not (dx and dy):
+            return self.jump_straight(x, y, dx, dy)
+        cells, stride = self.cells, self.stride
+        goal_x, goal_y = self.goal
+        while True:
+            if not cells[y * stride + x]:
+                return None
+            if x == goal_x and y == goal_y:
+                return (x, y)
+            if self.jump_straight(x + dx, y, dx, 0) is not None or self.jump_straight(x, y + dy, 0, dy) is not None:
+                return (x, y)
+            if not (cells[y * stride + x + dx] and cells[(y + dy) * stride + x]):
+                return None
+            x += dx
+            y += dy
+
+    def get_directions(self, x: int, y: int, parent: tuple[int, int] | None) -> list[tuple[int, int]]:
+        """
+        Get the directions worth searching from a jump point, the ones the parent couldn't reach as short
+        """
+        cells, stride = self.cells, self.stride
+        def walkable(cx: int, cy: int):
+            return cells[cy * stride + cx]
+        if parent is None:
+            directions = [(dx, dy) for dx, dy in STRAIGHT if walkable(x + dx, y + dy)]
+            directions.extend((dx, dy) for dx, dy in DIAGONAL if walkable(x + dx, y) and walkable(x, y + dy))
+            return directions
+        dx = (x > parent[0]) - (x < parent[0])
+        dy = (y > parent[1]) - (y < parent[1])
+        directions: list[tuple[int, int]] = []
+        if dx and dy:
+            if walkable(x, y + dy):
+                directions.append((0, dy))
+            if walkable(x + dx, y):
+                directions.append((dx, 0))
+            if walkable(x, y + dy) and walkable(x + dx, y):
+                directions.append((dx, dy))
+        elif dx:
+            ahead, up, down = walkable(x + dx, y), walkable(x, y - 1), walkable(x, y + 1)
+            if ahead:
+                directions.append((dx, 0))
+                if up:
+                    directions.append((dx, -1))
+                if down:
+                    directions.append((dx, 1))
+            if up:
+                directions.append((0, -1))
+            if down:
+                directions.append((0, 1))
+        else:
+            ahead, left, right = walkable(x, y + dy), walkable(x - 1, y), walkable(x + 1, y)
+            if ahead:
+                directions.append((0, dy))
+                if left:
+                    directions.append((-1, dy))
+                if right:
+                    directions.append((1, dy))
+            if left:
+                directions.append((-1, 0))
+            if right:
+                directions.append((1, 0))
+        return directions
+
+    def search(self, start: int, goal: int) -> list[int] | None:
+        """
+        Get the jump points from the start to the goal cell of the raster, without the start
+        """
+        width = self.raster.width
+        start_y, start_x = divmod(start, width)
+        goal_y, goal_x = divmod(goal, width)
+        start_point, self.goal = (start_x + 1, start_y + 1), (goal_x + 1, goal_y + 1)
+        # A goal out of reach would search every reachable cell before failing
+        if self.regions[(start_y + 1) * self.stride + start_x + 1] != self.regions[(goal_y + 1) * self.stride + goal_x + 1]:
+            return None
+        def octile(a: tuple[int, int], b: tuple[int, int]):
+            dx, dy = abs(a[0] - b[0]), abs(a[1] - b[1])
+            return max(dx, dy) + (SQRT2 - 1) * min(dx, dy)
+        g_score = {start_point: 0.0}
+        came_from: dict[tuple[int, int], tuple[int, int] | None] = {start_point: None}
+        frontier = [(octile(start_point, self.goal), 0.0, start_point)]
+        while frontier:
+            _, curr_g, point = heapq.heappop(frontier)
+            if point == self.goal:
+                path: list[int] = []
+                node = point
+                while node != start_point:
+                    path.append((node[1] - 1) * width + node[0] - 1)
+                    node = came_from[node]
+                path.reverse()
+                return path
+            if curr_g > g_score[point]:
+                continue
+            x, y = point
+            for dx, dy in self.get_directions(x, y, came_from[point]):
+                jump_point = self.jump(x + dx, y + dy, dx, dy)
+                if jump_point is None:
+                    continue
+                new_g = curr_g + octile(point, jump_point)
+                if new_g < g_score.get(jump_point, INF):
+                    g_score[jump_point] = new_g
+                    came_from[jump_point] = point
+                    heapq.heappush(frontier, (new_g + octile(jump_point, self.goal), new_g, jump_point))
+        return None
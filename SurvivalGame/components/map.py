@@ -1,17 +1,28 @@
 from SurvivalGame.components.abstract import AbstractPixelMap, SpriteComponent, EntityBase, SupportsEntityOperation
 from SurvivalGame.components.animator import BasicAnimator
 from SurvivalGame.components.grid import SpatialGrid
+from SurvivalGame.components.hpa import HierarchicalMap
+from SurvivalGame.components.jps import JumpPointSearch
+from SurvivalGame.components.navgraph import NavGraph, NavQuery
+from SurvivalGame.components.raster import WalkRaster
 from SurvivalGame.components.render import LayerId
 from SurvivalGame.components.sprites import BasicSprite, SpriteSheetImage
 from SurvivalGame.typing import *
 from SurvivalGame.const import *
-from collections.abc import Iterable, Generator
-from typing import Literal, NamedTuple
+from collections import OrderedDict
+from collections.abc import Iterable, Generator, Hashable
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal, NamedTuple
 from pytmx.util_pygame import load_pygame
-from pytmx.pytmx import TiledTileLayer, TiledObjectGroup, TiledObject
-from itertools import combinations
+from pytmx.pytmx import TiledMap, TiledTileLayer, TiledObjectGroup, TiledObject
+import hashlib
+import numpy as np
+import os
 import pygame as pg
 
+if TYPE_CHECKING:
+    from SurvivalGame.components.pathfind import FlowField
+
 def ray_intersect(pointA: Point, pointB: Point, collisions: Iterable[Rect]):
     for obj in collisions:
         clip = obj.clipline(pointA, pointB)
@@ -35,17 +46,317 @@ def rect_scan_intersect(rect: Rect, rect_end: Rect, collisions: Iterable[Rect]):
             return True
     return False
 
+def segments_intersect_boxes(starts: np.ndarray, ends: np.ndarray, boxes: np.ndarray, min_length: float = 0.0) -> np.ndarray:
+    """
+    Test every segment against every (left, top, right, bottom) box using the slab method.
+
+    Return a (segments, boxes) matrix that is True where the part of the segment inside the box is longer than min_length
+    """
+    delta = ends - starts
+    length = np.hypot(delta[:, 0], delta[:, 1])
+    # A tiny direction keeps a segment parallel to a slab either always or never inside of it
+    delta[delta == 0] = 1e-12
+    inv_x = (1 / delta[:, 0])[:, None]
+    inv_y = (1 / delta[:, 1])[:, None]
+    start_x = starts[:, 0, None]
+    start_y = starts[:, 1, None]
+    tx1 = (boxes[:, 0] - start_x) * inv_x
+    tx2 = (boxes[:, 2] - start_x) * inv_x
+    ty1 = (boxes[:, 1] - start_y) * inv_y
+    ty2 = (boxes[:, 3] - start_y) * inv_y
+    t_enter = np.maximum(np.maximum(np.minimum(tx1, tx2), np.minimum(ty1, ty2)), 0.0)
+    t_exit = np.minimum(np.minimum(np.maximum(tx1, tx2), np.maximum(ty1, ty2)), 1.0)
+    return (t_exit - t_enter) * length[:, None] > min_length
+
+def point_segment_distance(points: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    delta = end - start
+    length_sq = delta.dot(delta)
+    if length_sq == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip((points - start).dot(delta) / length_sq, 0.0, 1.0)
+    return np.hypot(*(points - start - t[:, None] * delta).T)
+
+def split_clusters(points: np.ndarray, ids: np.ndarray, leaf_size: int) -> list[np.ndarray]:
+    """
+    Split the points at the median of the longer side until each cluster has at most leaf_size points
+    """
+    if len(ids) <= leaf_size:
+        return [ids]
+    extent = points[ids].max(axis=0) - points[ids].min(axis=0)
+    order = ids[np.argsort(points[ids, int(extent[1] > extent[0])], kind='stable')]
+    half = len(order) // 2
+    return split_clusters(points, order[:half], leaf_size) + split_clusters(points, order[half:], leaf_size)
+
+class PointClusters:
+    """
+    Points split into clusters of close points, with the circle around each cluster
+    """
+    def __init__(self, points: np.ndarray, leaf_size: int):
+        self.points = points
+        self.ids = split_clusters(points, np.arange(len(points)), leaf_size) if len(points) > 0 else []
+        self.labels = np.empty(len(points), dtype=np.intp)
+        self.centers: list[np.ndarray] = []
+        self.radius: list[float] = []
+        for label, ids in enumerate(self.ids):
+            self.labels[ids] = label
+            low, high = points[ids].min(axis=0), points[ids].max(axis=0)
+            self.centers.append((low + high) / 2)
+            self.radius.append(float(np.hypot(*(high - low))) / 2)
+
+class CollisionIndex:
+    """
+    A uniform grid over the collisions, used to limit the collisions a segment is tested against
+    """
+    GRAZE = 1e-3
+    def __init__(self, collisions: list[Rect], cell_size: int = NAV_CELL_SIZE):
+        self.collisions = collisions
+        self.cell_size = cell_size
+        self.rects = np.array([(obj.left, obj.top, obj.right, obj.bottom) for obj in collisions], dtype=np.float64).reshape(-1, 4)
+        self.centers = (self.rects[:, :2] + self.rects[:, 2:]) / 2
+        self.radius = np.hypot(self.rects[:, 2] - self.rects[:, 0], self.rects[:, 3] - self.rects[:, 1]) / 2
+        # FRect.clipline clips against the rect with its right and bottom edge one unit inside.
+        # Segments that pass through the shrunk box surely intersect, segments that miss the
+        # full rect surely don't, anything between is left for clipline to decide
+        self.outer = self.rects + (-self.GRAZE, -self.GRAZE, self.GRAZE, self.GRAZE)
+        self.inner = self.rects + (self.GRAZE, self.GRAZE, -1 - self.GRAZE, -1 - self.GRAZE)
+        cells: dict[tuple[int, int], list[int]] = {}
+        for idx, (left, top, right, bottom) in enumerate(self.rects):
+            for gx in range(int(left // cell_size), int(right // cell_size) + 1):
+                for gy in range(int(top // cell_size), int(bottom // cell_size) + 1):
+                    cells.setdefault((gx, gy), []).append(idx)
+        self.cell_keys = np.array(list(cells), dtype=np.int64).reshape(-1, 2)
+        self.cell_ids = [np.array(ids, dtype=np.intp) for ids in cells.values()]
+
+    def query(self, left: float, top: float, right: float, bottom: float) -> np.ndarray:
+        """
+        Get the index of the collisions in the cells that overlap the area
+        """
+        size = self.cell_size
+        in_area = (
+            (self.cell_keys[:, 0] >= left // size) & (self.cell_keys[:, 0] <= right // size) &
+            (self.cell_keys[:, 1] >= top // size) & (self.cell_keys[:, 1] <= bottom // size)
+        )
+        found = [self.cell_ids[idx] for idx in np.flatnonzero(in_area)]
+        if not found:
+            return np.empty(0, dtype=np.intp)
+        return np.unique(np.concatenate(found))
+
+    def query_corridor(self, start: Point, end: Point, radius: float) -> np.ndarray:
+        """
+        Get the index of the collisions that can be within radius of the segment
+        """
+        ids = self.query(min(start[0], end[0]) - radius, min(start[1], end[1]) - radius, max(start[0], end[0]) + radius, max(start[1], end[1]) + radius)
+        if ids.size == 0:
+            return ids
+        dist = point_segment_distance(self.centers[ids], np.asarray(start, dtype=np.float64), np.asarray(end, dtype=np.float64))
+        return ids[dist <= radius + self.radius[ids]]
+
+    def segments_blocked(self, starts: np.ndarray, ends: np.ndarray, candidates: np.ndarray, chunk: int = 8) -> np.ndarray:
+        """
+        Check which segments intersect any of the candidate collisions, the same as ray_intersect.
+
+        The candidates are tested a chunk at a time so the segments that were already blocked
+        are not tested again, put the most likely blockers first
+        """
+        blocked = np.zeros(len(starts), dtype=bool)
+        remain = np.arange(len(starts))
+        for idx in range(0, len(candidates), chunk):
+            if remain.size == 0:
+                return blocked
+            hit = segments_intersect_boxes(starts[remain], ends[remain], self.inner[candidates[idx:idx + chunk]], self.GRAZE).any(axis=1)
+            blocked[remain[hit]] = True
+            remain = remain[~hit]
+        if remain.size == 0 or candidates.size == 0:
+            return blocked
+        maybe = segments_intersect_boxes(starts[remain], ends[remain], self.outer[candidates]).any(axis=1)
+        for idx in remain[maybe]:
+            blocked[idx] = ray_intersect(tuple(starts[idx]), tuple(ends[idx]), (self.collisions[c] for c in candidates))
+        return blocked
+
+    def visible_pairs(self, points: np.ndarray, leaf_size: int = 32) -> np.ndarray:
+        """
+        Get every (i, j) with i < j where the segment between the points doesn't intersect any collision.
+
+        Close points are clustered so each pair of clusters is tested in one batch against
+        the collisions near the line between the two clusters
+        """
+        clusters = PointClusters(points, leaf_size)
+        found: list[np.ndarray] = [np.empty((0, 2), dtype=np.intp)]
+        for a, ids_a in enumerate(clusters.ids):
+            for b in range(a, len(clusters.ids)):
+                ids_b = clusters.ids[b]
+                if a == b:
+                    ii, jj = np.triu_indices(len(ids_a), k=1)
+                    ii, jj = ids_a[ii], ids_a[jj]
+                else:
+                    ii = np.repeat(ids_a, len(ids_b))
+                    jj = np.tile(ids_b, len(ids_a))
+                if ii.size == 0:
+                    continue
+                # clipline isn't symmetric when grazing a corner, always test from the first point
+                ii, jj = np.minimum(ii, jj), np.maximum(ii, jj)
+                visible = ~self.blocked_between(points[ii], points[jj], clusters.centers[a], clusters.centers[b], max(clusters.radius[a], clusters.radius[b]))
+                found.append(np.stack((ii[visible], jj[visible]), axis=1))
+        pairs = np.concatenate(found)
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+    def pairs_visible(self, clusters: PointClusters, ii: np.ndarray, jj: np.ndarray) -> np.ndarray:
+        """
+        Check which segments from clusters.points[ii] to clusters.points[jj] don't intersect any collision
+        """
+        visible = np.ones(len(ii), dtype=bool)
+        if len(ii) == 0:
+            return visible
+        count = len(clusters.ids)
+        keys = clusters.labels[ii] * count + clusters.labels[jj]
+        order = np.argsort(keys, kind='stable')
+        for group in np.split(order, np.flatnonzero(np.diff(keys[order])) + 1):
+            a, b = divmod(int(keys[group[0]]), count)
+            radius = max(clusters.radius[a], clusters.radius[b])
+            visible[group] = ~self.blocked_between(clusters.points[ii[group]], clusters.points[jj[group]], clusters.centers[a], clusters.centers[b], radius)
+        return visible
+
+    def visible_from(self, point: Point, clusters: PointClusters) -> np.ndarray:
+        """
+        Check which of the clustered points can be seen from the point
+        """
+        visible = np.zeros(len(clusters.points), dtype=bool)
+        origin = np.asarray(point, dtype=np.float64)
+        for ids, center, radius in zip(clusters.ids, clusters.centers, clusters.radius):
+            starts = np.broadcast_to(origin, (len(ids), 2))
+            visible[ids] = ~self.blocked_between(starts, clusters.points[ids], origin, center, radius)
+        return visible
+
+    def blocked_between(self, starts: np.ndarray, ends: np.ndarray, center_a: np.ndarray, center_b: np.ndarray, radius: float) -> np.ndarray:
+        """
+        Check which segments are blocked, where every start is within radius of center_a and every end within radius of center_b
+        """
+        candidates = self.query_corridor(center_a, center_b, radius)
+        # Collisions near the ends of the segments block the most
+        near = np.minimum(np.hypot(*(self.centers[candidates] - center_a).T), np.hypot(*(self.centers[candidates] - center_b).T))
+        candidates = candidates[np.argsort(near, kind='stable')]
+        return self.segments_blocked(starts, ends, candidates)
+
+    def segment_blocked(self, start: Point, end: Point) -> bool:
+        candidates = self.query_corridor(start, end, 0.0)
+        return ray_intersect(start, end, (self.collisions[c] for c in candidates))
+
 NavigationMap = dict[Point, list[Point]]
+class NavigationOverlay:
+    """
+    A read-only navigation map with the start and end point inserted on top of a cached map.
+    The cached map is never copied or modified
+    """
+    def __init__(self, base: NavigationMap, start: Point, end: Point, start_neighbours: list[Point], end_from: set[Point]):
+        self.base = base
+        self.start = start
+        self.end = end
+        self.start_neighbours = start_neighbours
+        self.end_from = end_from
+
+    def get(self, point: Point, default: list[Point] | None = None) -> list[Point] | None:
+        if point == self.start:
+            return self.start_neighbours
+        if point in self.end_from:
+            return [self.end, *self.base.get(point, [])]
+        if point == self.end and point not in self.base:
+            return []
+        return self.base.get(point, default)
+
+    def __getitem__(self, point: Point) -> list[Point]:
+        neighbours = self.get(point)
+        if neighbours is None:
+            raise KeyError(point)
+        return neighbours
+
+    def __contains__(self, point: Point):
+        return point == self.start or point == self.end or point in self.base
+
+def collision_key(collisions: Iterable[Rect], *extra: int, digest_size: int = 10) -> bytes:
+    """
+    Hash the collisions of a map with the extra values, any change to the collision layer gives a different key
+    """
+    rects = np.array([(obj.x, obj.y, obj.w, obj.h) for obj in collisions], dtype=np.float32)
+    digest = hashlib.blake2b(rects.tobytes(), digest_size=digest_size)
+    digest.update(np.array(extra, dtype=np.int64).tobytes())
+    return digest.digest()
+
 class NavigationTemplateMap:
-    def __init__(self, collisions: list[Rect]) -> None:
+    CLUSTER_SIZE = 128
+    CACHE_VERSION = 1
+    def __init__(self, collisions: list[Rect], cache_dir: str | None = None) -> None:
         self.collisions = collisions
+        self.cache_dir = cache_dir
+        self.key = collision_key(collisions, self.CACHE_VERSION).hex()
+        self.index = CollisionIndex(collisions)
         self.nav_map: dict[Edge, list[Edge]] = {}
         self.cached_map: dict[Point, NavigationMap] = {}
+        self.cached_index: dict[Point, CollisionIndex] = {}
+        self.cached_grid: dict[Point, SpatialGrid] = {}
+        self.cached_points: dict[Point, tuple[list[Point], PointClusters]] = {}
+        self.cached_end: dict[Point, tuple[Point, np.ndarray, set[Point]]] = {}
+        self.cached_graph: dict[Point, NavGraph] = {}
+        self.cached_raster: dict[Point, WalkRaster] = {}
+        self.cached_hpa: dict[Point, HierarchicalMap] = {}
+        self.cached_jps: dict[Point, JumpPointSearch] = {}
+        self.path_cache = PathCache(self)
+        # The flow fields toward a target for a bounding box, shared by every entity chasing it
+        self.flow_fields: dict[tuple[Hashable, Point], FlowField] = {}
         # Building the map
-        for edgeStart, edgeEnd in combinations(self.get_collision_edges(), 2):
-            if not ray_intersect(edgeStart.point, edgeEnd.point, self.collisions):
-                self.nav_map.setdefault(edgeStart, []).append(edgeEnd)
-                self.nav_map.setdefault(edgeEnd, []).append(edgeStart)
+        edges = list(self.get_collision_edges())
+        pairs = self.load_cache(None, len(edges))
+        if pairs is None:
+            points = np.array([edge.point for edge in edges], dtype=np.float64).reshape(-1, 2)
+            pairs = self.index.visible_pairs(points)
+            self.save_cache(None, pairs)
+        for i, j in pairs.tolist():
+            self.nav_map.setdefault(edges[i], []).append(edges[j])
+            self.nav_map.setdefault(edges[j], []).append(edges[i])
+
+    def get_cache_path(self, bound: Point | None) -> Path | None:
+        """
+        Get the cache file of the map, or of the bounded map when a bound is given
+        """
+        if self.cache_dir is None:
+            return None
+        if bound is None:
+            return Path(self.cache_dir, f'{self.key}.npy')
+        return Path(self.cache_dir, f'{self.key}_{bound[0]:g}x{bound[1]:g}.npy')
+
+    def load_cache(self, bound: Point | None, node_count: int) -> np.ndarray | None:
+        """
+        Load the (start, end) node pairs of a cached map. Return None when it's missing or doesn't fit the map
+        """
+        path = self.get_cache_path(bound)
+        if path is None or not path.exists():
+            return None
+        try:
+            pairs = np.load(path, allow_pickle=False)
+        except (OSError, ValueError) as ex:
+            print('Warning: Ignoring the navigation cache', path, ex)
+            return None
+        if pairs.ndim != 2 or pairs.shape[1] != 2 or (pairs.size > 0 and (pairs.min() < 0 or pairs.max() >= node_count)):
+            print('Warning: Ignoring the navigation cache', path, 'which does not match the map')
+            return None
+        return pairs.astype(np.intp)
+
+    def save_cache(self, bound: Point | None, pairs: np.ndarray):
+        path = self.get_cache_path(bound)
+        if path is None:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so a crash never leaves half a cache behind
+        temp = path.with_name(path.name + '.tmp')
+        with open(temp, 'wb') as f:
+            np.save(f, pairs.astype(np.int32), allow_pickle=False)
+        os.replace(temp, path)
+
+    def preload(self, bounds: Iterable[Point]):
+        """
+        Build or load the bounded maps ahead of time so the first path request doesn't have to
+        """
+        for bound in bounds:
+            self.get_bounded_graph(bound)
 
     def get_collision_edges(self) -> Generator[Edge, None, None]:
         for obj in self.collisions:
@@ -56,65 +367,239 @@ class NavigationTemplateMap:
             yield Edge(inf.bottomleft, 'topright')
             yield Edge(inf.bottomright, 'topleft')
 
-    def get_nav_for(self, bound: Point, start: Point, end: Point):
+    def get_colliable(self, bound: Point):
         """
-        Build a navigation map for a entity with the bounding box
+        Get the collisions that an entity with the bounding box can collide with
         """
         rect_bound = pg.FRect((0, 0), bound)
-        colliable = [collision for collision in self.collisions if not collision.colliderect(rect_bound)]
+        return [collision for collision in self.collisions if not collision.colliderect(rect_bound)]
+
+    def get_bounded_index(self, bound: Point) -> CollisionIndex:
+        """
+        Get the index of the collisions inflated by the bounding box, the same as the ones rect_scan_intersect tests
+        """
+        if bound not in self.cached_index:
+            self.cached_index[bound] = CollisionIndex([collision.inflate(bound) for collision in self.get_colliable(bound)])
+        return self.cached_index[bound]
+
+    def get_bounded_grid(self, bound: Point) -> SpatialGrid:
+        """
+        Get a grid of the collisions of the bounded index, its segment_blocked only tests the cells along a segment
+        """
+        if bound not in self.cached_grid:
+            grid = SpatialGrid()
+            for collision in self.get_bounded_index(bound).collisions:
+                grid.add(collision)
+            self.cached_grid[bound] = grid
+        return self.cached_grid[bound]
+
+    def get_bounded_points(self, bound: Point) -> tuple[list[Point], PointClusters]:
+        """
+        Get the points of the bounded navigation map and their clusters
+        """
+        if bound not in self.cached_points:
+            rect_bound = pg.FRect((0, 0), bound)
+            points = list(dict.fromkeys(rect_at_edge(rect_bound, edge).center for edge in self.nav_map))
+            self.cached_points[bound] = (points, PointClusters(np.array(points, dtype=np.float64).reshape(-1, 2), self.CLUSTER_SIZE))
+        return self.cached_points[bound]
+
+    def get_bounded_nav(self, bound: Point) -> NavigationMap:
+        """
+        Get the cached navigation map of the collision edges for a entity with the bounding box
+        """
         if bound not in self.cached_map:
-            bounded_nav_map = {}
-            for edge, neigh_edges in self.nav_map.items():
-                start_rect = rect_at_edge(rect_bound, edge)
-                if start_rect.collidelist(colliable) >= 0:
-                    bounded_nav_map.setdefault(start_rect.center, [])
-                    continue
-                neigh_points: list = bounded_nav_map.setdefault(start_rect.center, [])
-                for neigh in neigh_edges:
-                    end_rect = rect_at_edge(rect_bound, neigh)
-                    if rect_scan_intersect(start_rect, end_rect, colliable):
+            rect_bound = pg.FRect((0, 0), bound)
+            colliable = self.get_colliable(bound)
+            points, clusters = self.get_bounded_points(bound)
+            pairs = self.load_cache(bound, len(points))
+            if pairs is None:
+                point_ids = {point: idx for idx, point in enumerate(points)}
+                starts: list[int] = []
+                ends: list[int] = []
+                for edge, neigh_edges in self.nav_map.items():
+                    start_rect = rect_at_edge(rect_bound, edge)
+                    if start_rect.collidelist(colliable) >= 0:
                         continue
-                    neigh_points.append(end_rect.center)
+                    for neigh in neigh_edges:
+                        starts.append(point_ids[start_rect.center])
+                        ends.append(point_ids[rect_at_edge(rect_bound, neigh).center])
+                pairs = np.array([starts, ends], dtype=np.intp).reshape(2, -1).T
+                visible = self.get_bounded_index(bound).pairs_visible(clusters, pairs[:, 0], pairs[:, 1])
+                pairs = pairs[visible]
+                self.save_cache(bound, pairs)
+            bounded_nav_map: NavigationMap = {point: [] for point in points}
+            for start, end in pairs.tolist():
+                bounded_nav_map[points[start]].append(points[end])
             self.cached_map[bound] = bounded_nav_map
-        # Inserting start point and end point to the map
-        nav_map = self.cached_map[bound].copy()
+        return self.cached_map[bound]
+
+    def get_bounded_graph(self, bound: Point) -> NavGraph:
+        """
+        Get the bounded navigation map compiled to integer node ids
+        """
+        if bound not in self.cached_graph:
+            points, _ = self.get_bounded_points(bound)
+            self.cached_graph[bound] = NavGraph(points, self.get_bounded_nav(bound))
+        return self.cached_graph[bound]
+
+    def get_bounded_raster(self, bound: Point) -> WalkRaster:
+        """
+        Get the cells an entity with the bounding box can stand on
+        """
+        if bound not in self.cached_raster:
+            self.cached_raster[bound] = WalkRaster(self.get_bounded_index(bound).rects)
+        return self.cached_raster[bound]
+
+    def get_bounded_hpa(self, bound: Point) -> HierarchicalMap:
+        """
+        Get the HPA* map of the raster for a entity with the bounding box
+        """
+        if bound not in self.cached_hpa:
+            self.cached_hpa[bound] = HierarchicalMap(self.get_bounded_raster(bound), self.get_bounded_grid(bound).segment_blocked)
+        return self.cached_hpa[bound]
+
+    def get_bounded_jps(self, bound: Point) -> JumpPointSearch:
+        """
+        Get the Jump Point Search of the raster for a entity with the bounding box
+        """
+        if bound not in self.cached_jps:
+            self.cached_jps[bound] = JumpPointSearch(self.get_bounded_raster(bound))
+        return self.cached_jps[bound]
+
+    def get_visible(self, bound: Point, start: Point, end: Point) -> tuple[np.ndarray | None, np.ndarray, set[Point], bool]:
+        """
+        Get the ids of the bounded points in sight of the start, None when the start is already on the map,
+        the ids and the points in sight of the end, and whether the end is in sight of the start
+        """
+        nav_map = self.get_bounded_nav(bound)
+        index = self.get_bounded_index(bound)
+        points, clusters = self.get_bounded_points(bound)
+        start_ids = None
         if start not in nav_map:
-            neighbours = []
-            rect_bound.center = start
-            # for edge in self.get_collision_edges():
-            for edge in self.nav_map:
-                end_rect = rect_at_edge(rect_bound, edge)
-                if not rect_scan_intersect(rect_bound, end_rect, colliable):
-                    neighbours.append(end_rect.center)
-                    # don't need to return to start
-                    # nav_map[end_rect.center].append(start) 
-                    # only add for default
-                    # nav_map.setdefault(end_rect.center, [])
-            nav_map[start] = neighbours
-        if end not in nav_map:
-            nav_map.setdefault(end, [])
-            rect_bound.center = end
-            # for edge in self.get_collision_edges():
-            for edge in self.nav_map:
-                start_rect = rect_at_edge(rect_bound, edge)
-                if not rect_scan_intersect(rect_bound, start_rect, colliable):
-                    # don't need to return to other point when ended
-                    # neighbours.append(end_rect.center)
-                    # making a copy as to not affect the cached map
-                    neighbours = [end]
-                    neighbours.extend(nav_map.get(start_rect.center, []))
-                    nav_map[start_rect.center] = neighbours
-        if not rect_scan_intersect(rect_bound.move_to(center=start), rect_bound.move_to(center=end), colliable):
-            nav_map[start].append(end)
-            #nav_map[end].append(start)
-        
-        return nav_map
+            start_ids = np.flatnonzero(index.visible_from(start, clusters))
+        end_ids, end_from = np.empty(0, dtype=np.intp), set()
+        if end not in nav_map and end != start:
+            # Every entity chasing the same target asks for the same end point
+            last_end, end_ids, end_from = self.cached_end.get(bound, (None, end_ids, end_from))
+            if last_end != end:
+                end_ids = np.flatnonzero(index.visible_from(end, clusters))
+                end_from = {points[idx] for idx in end_ids.tolist()}
+                self.cached_end[bound] = (end, end_ids, end_from)
+        return start_ids, end_ids, end_from, not self.get_bounded_grid(bound).segment_blocked(start, end)
+
+    def get_nav_for(self, bound: Point, start: Point, end: Point):
+        """
+        Build a navigation map for a entity with the bounding box.
+        The start and end point are inserted in an overlay so the cached map is shared between every query
+        """
+        nav_map = self.get_bounded_nav(bound)
+        points, _ = self.get_bounded_points(bound)
+        start_ids, _, end_from, direct = self.get_visible(bound, start, end)
+        if start_ids is None:
+            start_neighbours = nav_map[start]
+        else:
+            start_neighbours = [points[idx] for idx in start_ids.tolist()]
+        if direct:
+            start_neighbours = [*start_neighbours, end]
+        return NavigationOverlay(nav_map, start, end, start_neighbours, end_from)
+
+    def get_query(self, bound: Point, start: Point, end: Point) -> NavQuery:
+        """
+        The same as get_nav_for but on the compiled graph
+        """
+        start_ids, end_ids, _, direct = self.get_visible(bound, start, end)
+        return self.get_bounded_graph(bound).query(start, end, start_ids, end_ids, direct)
+
+class CachedPath(NamedTuple):
+    start: Point
+    end: Point
+    path: list[Point]
+
+class PathCache:
+    """
+    A LRU cache of the paths found on a navigation map, shared by every entity.
+
+    A path is keyed by the cells of its start and end, and reused when the new start and end are in sight of the cached ones.
+    The key also holds the kind of the path finder, a path is only shared by the finders giving paths as good,
+    so a faster finder can't hand its rougher paths to the others
+    """
+    def __init__(self, nav_map: NavigationTemplateMap, capacity: int = PATH_CACHE_SIZE):
+        self.map_template = nav_map
+        self.capacity = capacity
+        self.entries: OrderedDict[Hashable, CachedPath] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, kind: Hashable, bound: Point, start: Point, end: Point):
+        size = PATH_CACHE_CELL
+        return (kind, bound, int(start[0] // size), int(start[1] // size), int(end[0] // size), int(end[1] // size))
+
+    def get(self, kind: Hashable, bound: Point, start: Point, end: Point) -> list[Point] | None:
+        """
+        Get a path reversed with the end at the front and without the start, the same as the path finders
+        """
+        key = self.get_key(kind, bound, start, end)
+        entry = self.entries.get(key)
+        grid = self.map_template.get_bounded_grid(bound)
+        if entry is None or grid.segment_blocked(start, entry.start) or grid.segment_blocked(entry.end, end):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        path = entry.path.copy()
+        if entry.end != end:
+            path.insert(0, end)
+        if entry.start != start:
+            path.append(entry.start)
+        return path
+
+    def put(self, kind: Hashable, bound: Point, start: Point, end: Point, path: list[Point]):
+        """
+        Cache a path that reached the end. Partial paths are never cached
+        """
+        if not path or path[0] != end:
+            return
+        key = self.get_key(kind, bound, start, end)
+        self.entries[key] = CachedPath(start, end, path.copy())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+class MapObjects(NamedTuple):
+    collisions: list[Rect]
+    markers: dict[str, list[Point]]
+
+def read_objects(map_data: TiledMap, include_hidden = False) -> MapObjects:
+    """
+    Read the collisions and the markers of a parsed map, skipping the hidden layers like TmxMap
+    """
+    objects = MapObjects([], {})
+    for layer in map_data.layers:
+        if not isinstance(layer, TiledObjectGroup) or not (include_hidden or getattr(layer, 'visible', False)):
+            continue
+        obj: TiledObject
+        if layer.name == 'Collision':
+            objects.collisions.extend(pg.FRect(obj.x, obj.y, obj.width, obj.height) for obj in layer)
+        elif layer.name == 'Marker':
+            for obj in layer:
+                objects.markers.setdefault(str(obj.name), []).append((obj.x, obj.y))
+    return objects
+
+def read_collisions(path: str, include_hidden = True) -> list[Rect]:
+    """
+    Read the collisions of a map without loading any image.
+    TmxMap skips hidden layers, pass include_hidden=False to read the same collisions
+    """
+    return read_objects(TiledMap(path), include_hidden).collisions
 
 class TmxMap(AbstractPixelMap):
     def __init__(self, path: str):
         self.__map_data = load_pygame(path)
-        self.markers: dict[str, list[Point]] = {}
-        self.collisions: list[Rect] = []
+        self.collisions, self.markers = read_objects(self.__map_data)
         self.entities: list[EntityBase] = []
         ground = BasicSprite(pg.Surface((self.width, self.height)), layer=LayerId.TILED)
         self.map_sprites = [ground]
@@ -140,18 +625,8 @@ class TmxMap(AbstractPixelMap):
                             ent.add_component(BasicAnimator, SpriteSheetImage.from_tile_animation(prop['frames'], self.__map_data))
                             self.map_sprites.append(ent.get_component(BasicSprite))
                             self.entities.append(ent)
-            elif isinstance(layer, TiledObjectGroup):
-                obj: TiledObject
-                if layer.name == 'Collision':
-                    for obj in layer:
-                        rect = pg.rect.FRect(obj.x, obj.y, obj.width, obj.height)
-                        self.collisions.append(rect)
-                        
-                elif layer.name == 'Marker':
-                    for obj in layer:
-                        obj: TiledObject
-                        self.markers.setdefault(str(obj.name), []).append((obj.x, obj.y))
-        self.template_nav = NavigationTemplateMap(self.collisions)
+        self.template_nav = NavigationTemplateMap(self.collisions, cache_dir=PT_CACHE)
+        self.template_nav.preload([ENEMY_BOUND])
 
     @property    
     def tilewidth(self):
@@ -0,0 +1,235 @@
+from collections import deque
+from collections.abc import Generator
+from typing import NamedTuple, TypeVar
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+import heapq
+import math
+import numpy as np
+
+Path = list[Point]
+T = TypeVar('T')
+Search = Generator[None, None, T]
+
+def run_search(search: Search[T]) -> T:
+    """
+    Run a resumable search to the end
+    """
+    try:
+        while True:
+            next(search)
+    except StopIteration as stop:
+        return stop.value
+
+class NavQuery(NamedTuple):
+    """
+    A search between a start and an end point on a compiled graph.
+    The start and end get their own node id when they aren't already on the graph
+    """
+    graph: 'NavGraph'
+    start: Point
+    end: Point
+    start_id: int
+    end_id: int
+    start_neighbours: list[int]
+    start_lengths: list[float]
+    end_from: list[int]
+    end_lengths: list[float]
+
+    def to_point(self, node: int) -> Point:
+        if node == self.end_id:
+            return self.end
+        if node == self.start_id:
+            return self.start
+        return self.graph.points[node]
+
+class NavGraph:
+    """
+    A navigation map compiled to integer node ids, with a CSR adjacency and the length of every edge.
+
+    The two ids after the last point are reserved for the start and end point of a query
+    """
+    def __init__(self, points: list[Point], nav_map: dict[Point, list[Point]]):
+        self.points = points
+        self.ids = {point: idx for idx, point in enumerate(points)}
+        self.node_count = len(points)
+        self.start_id = self.node_count
+        self.end_id = self.node_count + 1
+        self.coords = np.array(points, dtype=np.float64).reshape(-1, 2)
+        indptr = [0]
+        indices: list[int] = []
+        for point in points:
+            indices.extend(self.ids[neighbour] for neighbour in nav_map.get(point, []))
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.intp)
+        self.indices = np.array(indices, dtype=np.intp)
+        sources = np.repeat(np.arange(self.node_count), np.diff(self.indptr))
+        self.weights = np.hypot(*(self.coords[self.indices] - self.coords[sources]).T)
+        # The search loops run in Python where indexing a list is much faster than indexing an array
+        neighbours = self.indices.tolist()
+        weights = self.weights.tolist()
+        self.neighbours: list[list[int]] = [neighbours[a:b] for a, b in zip(indptr, indptr[1:])] + [[], []]
+        self.lengths: list[list[float]] = [weights[a:b] for a, b in zip(indptr, indptr[1:])] + [[], []]
+        self.xs: list[float] = self.coords[:, 0].tolist() + [0.0, 0.0]
+        self.ys: list[float] = self.coords[:, 1].tolist() + [0.0, 0.0]
+        self.engine = SearchEngine(self)
+        # Scheduled searches are suspended between frames, they get their own arrays so a synchronous search can't reset them
+        self.sliced_engine = SearchEngine(self)
+        self._visibility: list[int] | None = None
+        self._predecessors: list[list[int]] | None = None
+
+    @property
+    def visibility(self) -> list[int]:
+        """
+        The visibility matrix of the points, each row packed in an int with bit j set when point j is in sight
+        """
+        if self._visibility is None:
+            self._visibility = [sum(1 << neighbour for neighbour in neighbours) for neighbours in self.neighbours]
+        return self._visibility
+
+    @property
+    def predecessors(self) -> list[list[int]]:
+        """
+        The reversed adjacency, the nodes with an edge to each node, so a search can run back from the goal
+        """
+        if self._predecessors is None:
+            self._predecessors = [[] for _ in self.neighbours]
+            for node, neighbours in enumerate(self.neighbours):
+                for neighbour in neighbours:
+                    self._predecessors[neighbour].append(node)
+        return self._predecessors
+
+    def get_lengths(self, point: Point, ids: np.ndarray) -> list[float]:
+        return np.hypot(*(self.coords[ids] - point).T).tolist()
+
+    def query(self, start: Point, end: Point, start_ids: np.ndarray | None, end_ids: np.ndarray, direct: bool) -> NavQuery:
+        """
+        Insert the start and end point. start_ids is None when the start is on the graph,
+        end_ids is empty when the end is on the graph or the same as the start
+        """
+        if start_ids is None:
+            start_id = self.ids[start]
+            start_neighbours = self.neighbours[start_id]
+            start_lengths = self.lengths[start_id]
+        else:
+            start_id = self.start_id
+            start_neighbours = start_ids.tolist()
+            start_lengths = self.get_lengths(start, start_ids)
+        end_id = self.ids.get(end, self.end_id)
+        if end == start:
+            end_id = start_id
+        if direct:
+            start_neighbours = [*start_neighbours, end_id]
+            start_lengths = [*start_lengths, math.dist(start, end)]
+        return NavQuery(self, start, end, start_id, end_id, start_neighbours, start_lengths, end_ids.tolist(), self.get_lengths(end, end_ids))
+
+class SearchEngine:
+    """
+    A* and BFS over a compiled graph.
+    The score and parent arrays are allocated once and reset by bumping the generation counter.
+
+    The iter_ searches yield every SLICE expanded nodes so they can be resumed later,
+    only one of them can run at a time on the same engine
+    """
+    SLICE = 64
+    def __init__(self, graph: NavGraph):
+        size = graph.node_count + 2
+        self.graph = graph
+        self.generation = 0
+        self.stamp = [0] * size
+        self.g_score = [INF] * size
+        self.parent = [-1] * size
+        self.end_stamp = [0] * size
+        self.end_length = [0.0] * size
+        self.xs = graph.xs.copy()
+        self.ys = graph.ys.copy()
+        self.expanded = 0
+
+    def begin(self, query: NavQuery):
+        """
+        Start a new search. Every node stamped with an older generation counts as unvisited
+        """
+        self.generation += 1
+        generation = self.generation
+        for node, length in zip(query.end_from, query.end_lengths):
+            self.end_stamp[node] = generation
+            self.end_length[node] = length
+        self.stamp[query.start_id] = generation
+        self.g_score[query.start_id] = 0.0
+        self.parent[query.start_id] = -1
+
+    def get_edges(self, node: int, query: NavQuery):
+        if node == query.start_id:
+            return query.start_neighbours, query.start_lengths
+        if self.end_stamp[node] == self.generation:
+            return [query.end_id, *self.graph.neighbours[node]], [self.end_length[node], *self.graph.lengths[node]]
+        return self.graph.neighbours[node], self.graph.lengths[node]
+
+    def get_path(self, query: NavQuery) -> Path:
+        """
+        Follow the parents from the end. The path is reversed with the end at the front and without the start
+        """
+        path: Path = []
+        node = query.end_id
+        while node != query.start_id:
+            path.append(query.to_point(node))
+            node = self.parent[node]
+        return path
+
+    def astar(self, query: NavQuery) -> Path | None:
+        return run_search(self.iter_astar(query))
+
+    def bfs(self, query: NavQuery) -> Path | None:
+        return run_search(self.iter_bfs(query))
+
+    def iter_astar(self, query: NavQuery) -> Search[Path | None]:
+        self.begin(query)
+        generation, stamp, g_score, parent = self.generation, self.stamp, self.g_score, self.parent
+        xs, ys = self.xs, self.ys
+        xs[self.graph.end_id], ys[self.graph.end_id] = query.end
+        end_x, end_y = query.end
+        end_id = query.end_id
+        hypot, heappush, heappop = math.hypot, heapq.heappush, heapq.heappop
+        frontier = [(0.0, 0.0, query.start_id)]
+        budget = self.SLICE
+        while frontier:
+            _, curr_g, node = heappop(frontier)
+            if node == end_id:
+                return self.get_path(query)
+            if curr_g > g_score[node]:
+                continue
+            self.expanded += 1
+            budget -= 1
+            if budget == 0:
+                yield
+                budget = self.SLICE
+            for neighbour, length in zip(*self.get_edges(node, query)):
+                new_g = curr_g + length
+                if stamp[neighbour] != generation or new_g < g_score[neighbour]:
+                    stamp[neighbour] = generation
+                    g_score[neighbour] = new_g
+                    parent[neighbour] = node
+                    heappush(frontier, (new_g + hypot(xs[neighbour] - end_x, ys[neighbour] - end_y), new_g, neighbour))
+        return None
+
+    def iter_bfs(self, query: NavQuery) -> Search[Path | None]:
+        self.begin(query)
+        generation, stamp, parent = self.generation, self.stamp, self.parent
+        end_id = query.end_id
+        frontier = deque([query.start_id])
+        budget = self.SLICE
+        while frontier:
+            node = frontier.popleft()
+            if node == end_id:
+                return self.get_path(query)
+            self.expanded += 1
+            budget -= 1
+            if budget == 0:
+                yield
+                budget = self.SLICE
+            for neighbour in self.get_edges(node, query)[0]:
+                if stamp[neighbour] != generation:
+                    stamp[neighbour] = generation
+                    parent[neighbour] = node
+                    frontier.append(neighbour)
+        return None
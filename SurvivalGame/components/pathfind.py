@@ -1,14 +1,20 @@
 from collections import deque
-from enum import IntEnum
-from time import localtime
-from random import Random
-from typing import Any, Callable, NamedTuple, TypeVar, Generic, Protocol, runtime_checkable, cast
+from collections.abc import Hashable
+from concurrent.futures import Future
+from typing import Any, NamedTuple, TypeVar, Generic, Protocol, runtime_checkable
 from abc import ABC, abstractmethod
 from SurvivalGame.const import *
 from SurvivalGame.typing import *
 from SurvivalGame.components.abstract import AbstractEntity, AbstractPixelMap, PhysicComponent, SpriteComponent
-from SurvivalGame.components.map import NavigationTemplateMap, rect_at_edge, rect_scan_intersect
-import pandas as pd
+from SurvivalGame.components.beam import beam_search
+from SurvivalGame.components.csp import BacktrackSearch
+from SurvivalGame.components.grid import to_cell
+from SurvivalGame.components.hpa import HierarchicalMap
+from SurvivalGame.components.map import NavigationTemplateMap, PathCache
+from SurvivalGame.components.navgraph import NavQuery, Search, run_search
+from SurvivalGame.components.qpolicy import QPolicy, rollout
+from SurvivalGame.components.raster import pull_string
+import numpy as np
 import pygame as pg
 import heapq
 
@@ -20,22 +26,95 @@ class PathFindComponent:
 class MinimalPathFindBase(PathFindComponent, ABC):
     needs_update = True
     update_order = ORD_PATH
+    # The kind of the paths in the path cache, None for the type of the finder
+    cache_kind: Hashable | None = None
     """
     A path finder that minimize updating the path.
 
     This is a base class doesn't do any path find.
-    It just checking whether a new path needs to be calculated then call the abstract method implement by the subclass
+    It just checking whether a new path needs to be calculated then call the abstract method implement by the subclass.
+    A subclass can set path_cache to share its paths with every entity using the same path finder,
+    and cache_kind to share them with the other finders of that kind.
+
+    When a path_scheduler is passed to update the search runs in the scheduler, and the entity keeps
+    following its old path until the new one is found.
+    A subclass that sets worker_search can also run its search in the path_workers pool when there is one
     """
     def __init__(self, target: AbstractEntity) -> None:
         self.path = []
         self.target = target
         self._last_pos = None
         self.update_angle = 45
+        self.path_cache: PathCache | None = None
+        self.worker_search: str | None = None
+        self._worker_request: tuple[Future[Path], Point, Point, Point] | None = None
 
     @abstractmethod
     def path_find(self, start: Point, end: Point, entity: AbstractEntity): ...
 
-    def update(self, entity: AbstractEntity, **_):
+    def get_cache_kind(self) -> Hashable:
+        return type(self) if self.cache_kind is None else self.cache_kind
+
+    def path_search(self, start: Point, end: Point, entity: AbstractEntity) -> Search[None]:
+        """
+        A resumable path_find. By default the whole path_find runs in one step
+        """
+        self.path_find(start, end, entity)
+        yield from ()
+
+    def use_cached_path(self, bound: Point, start: Point, end: Point):
+        """
+        Take a cached path close enough to the start and end. Return whether there was one
+        """
+        if self.path_cache is None:
+            return False
+        path = self.path_cache.get(self.get_cache_kind(), bound, start, end)
+        if path is None:
+            return False
+        self.path[:] = path
+        return True
+
+    def search(self, start: Point, end: Point, entity: AbstractEntity) -> Search[None]:
+        """
+        Reuse a cached path or find a new one and cache it
+        """
+        bound = entity.get_component(PhysicComponent).bound
+        if self.use_cached_path(bound, start, end):
+            return
+        yield from self.path_search(start, end, entity)
+        if self.path_cache is not None:
+            self.path_cache.put(self.get_cache_kind(), bound, start, end, self.path)
+
+    def find_path(self, start: Point, end: Point, entity: AbstractEntity, scheduler: Any = None, workers: Any = None):
+        """
+        Find a new path now, or queue it in the scheduler or the worker pool.
+        A queued search checks the cache when it starts, so a path found in the meantime is reused
+        """
+        if workers is not None and self.worker_search is not None:
+            bound = entity.get_component(PhysicComponent).bound
+            if not self.use_cached_path(bound, start, end):
+                self._worker_request = (workers.submit(self.worker_search, bound, start, end), bound, start, end)
+        elif scheduler is not None:
+            scheduler.request(self, entity)
+        else:
+            run_search(self.search(start, end, entity))
+
+    def poll_worker(self):
+        """
+        Take the path of the worker search once it's done
+        """
+        if self._worker_request is None or not self._worker_request[0].done():
+            return
+        future, bound, start, end = self._worker_request
+        self._worker_request = None
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.path[:] = future.result()
+        if self.path_cache is not None:
+            self.path_cache.put(self.get_cache_kind(), bound, start, end, self.path)
+
+    def update(self, entity: AbstractEntity, **kwargs):
+        self.poll_worker()
         current_position = entity.get_component(SpriteComponent).rect.center
         current_vect = pg.Vector2(current_position)
         current_destination = self.target.get_component(SpriteComponent).rect.center
@@ -56,8 +135,10 @@ class MinimalPathFindBase(PathFindComponent, ABC):
             angle_to_curr = (current_vect - current_destination).as_polar()[1]
             angle = abs(angle_to_last - angle_to_curr) % 180
             should_update = angle > self.update_angle
-        if should_update:
-            self.path_find(current_position, current_destination, entity)
+        scheduler = kwargs.get('path_scheduler', None)
+        waiting = self._worker_request is not None or (scheduler is not None and scheduler.is_pending(self))
+        if should_update and not waiting:
+            self.find_path(current_position, current_destination, entity, scheduler, kwargs.get('path_workers', None))
             # scene = kwargs.get('scene', None)
             # if scene is not None:
             #     scene.pause = not scene.pause
@@ -73,14 +154,24 @@ class MinimalPathFindBase(PathFindComponent, ABC):
 class UninformedPathFind(MinimalPathFindBase):
     """
     A uniformed path find component using BFS
+
+    The search runs on the compiled graph of the map unless compiled is False
     """
-    def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity):
+    def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity, compiled = True):
         super().__init__(target)
         self.map_template = nav_map
+        self.path_cache = nav_map.path_cache
         self.update_angle = 60
+        self.compiled = compiled
+        if compiled:
+            self.worker_search = 'bfs'
 
     def path_find(self, start: Point, end: Point, entity: AbstractEntity): 
         bound = entity.get_component(PhysicComponent).bound
+        if self.compiled:
+            query = self.map_template.get_query(bound, start, end)
+            self.path[:] = query.graph.engine.bfs(query) or []
+            return
         nav_map = self.map_template.get_nav_for(bound, start, end)
         # -- BFS Search --
         frontier: deque[Point] = deque([start])
@@ -103,6 +194,15 @@ class UninformedPathFind(MinimalPathFindBase):
             # Can't find a path
             self.path.clear()
 
+    def path_search(self, start, end, entity):
+        if not self.compiled:
+            yield from super().path_search(start, end, entity)
+            return
+        bound = entity.get_component(PhysicComponent).bound
+        query = self.map_template.get_query(bound, start, end)
+        path = yield from query.graph.sliced_engine.iter_bfs(query)
+        self.path[:] = path or []
+
 T = TypeVar('T')
 @runtime_checkable
 class SupportsLessThan(Protocol):
@@ -120,13 +220,23 @@ del SupportsLessThan
 class InformedPathFind(MinimalPathFindBase):
     """
     A informed path find component using A*
+
+    The search runs on the compiled graph of the map unless compiled is False
     """
-    def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity):
+    def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity, compiled = True):
         super().__init__(target)
         self.map_template = nav_map
+        self.path_cache = nav_map.path_cache
+        self.compiled = compiled
+        if compiled:
+            self.worker_search = 'astar'
     
     def path_find(self, start, end, entity):
         bound = entity.get_component(PhysicComponent).bound
+        if self.compiled:
+            query = self.map_template.get_query(bound, start, end)
+            self.path[:] = query.graph.engine.astar(query) or []
+            return
         nav_map = self.map_template.get_nav_for(bound, start, end)
         # -- A* search --
         frontier = [KeyValueType(0.0, start)]
@@ -157,20 +267,75 @@ class InformedPathFind(MinimalPathFindBase):
             # print("No path found")
             self.path.clear()
 
+    def path_search(self, start, end, entity):
+        if not self.compiled:
+            yield from super().path_search(start, end, entity)
+            return
+        bound = entity.get_component(PhysicComponent).bound
+        query = self.map_template.get_query(bound, start, end)
+        path = yield from query.graph.sliced_engine.iter_astar(query)
+        self.path[:] = path or []
+
 class LocalPathFind(MinimalPathFindBase):
     """
     A local search path find component using BeamSearch
+
+    The search runs on the compiled graph unless compiled is False.
+    When a path_batch is passed to update the searches of every entity are run together at the end of the frame
     """
-    def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity, beam_width = 6, max_depth = 10):
+    def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity, beam_width = 6, max_depth = 10, compiled = True):
         super().__init__(target)
         self.map_template = nav_map
+        self.path_cache = nav_map.path_cache
         self.update_angle = 80
         self.beam_width = beam_width
         self.max_depth = max_depth
-    
+        self.compiled = compiled
+        self.path_batch: Any = None
+
+    def update(self, entity: AbstractEntity, **kwargs):
+        self.path_batch = kwargs.get('path_batch', None)
+        super().update(entity, **kwargs)
+
+    def find_path(self, start: Point, end: Point, entity: AbstractEntity, scheduler: Any = None, workers: Any = None):
+        if self.path_batch is None or not self.compiled:
+            super().find_path(start, end, entity, scheduler, workers)
+            return
+        bound = entity.get_component(PhysicComponent).bound
+        if not self.use_cached_path(bound, start, end):
+            self.path_batch.request(self, entity, self.map_template.get_query(bound, start, end))
+
+    def get_batch_key(self, query: NavQuery):
+        return (query.graph, self.beam_width, self.max_depth)
+
+    @staticmethod
+    def run_batch(key: tuple[Any, int, int], requests: list[tuple['LocalPathFind', AbstractEntity, NavQuery]]):
+        graph, beam_width, max_depth = key
+        results = beam_search(graph, [query for _, _, query in requests], beam_width, max_depth)
+        for (component, entity, query), result in zip(requests, results):
+            component.set_result(entity, query, result)
+
+    def use_result(self, result: Path | None):
+        if result is not None:
+            self.path[:] = result
+        elif self.path:
+            self.path.pop()
+
+    def set_result(self, entity: AbstractEntity, query: NavQuery, result: Path | None):
+        """
+        Take the path of a batched search
+        """
+        self.use_result(result)
+        if self.path_cache is not None:
+            self.path_cache.put(self.get_cache_kind(), entity.get_component(PhysicComponent).bound, query.start, query.end, self.path)
+
     def path_find(self, start, end, entity):
         end_vec = pg.Vector2(end)
         bound = entity.get_component(PhysicComponent).bound
+        if self.compiled:
+            query = self.map_template.get_query(bound, start, end)
+            self.use_result(beam_search(query.graph, [query], self.beam_width, self.max_depth)[0])
+            return
         nav_map = self.map_template.get_nav_for(bound, start, end)
         # -- Beam search --
 
@@ -196,8 +361,207 @@ class LocalPathFind(MinimalPathFindBase):
             # Keep only top-k from the heap
             beam = heapq.nsmallest(self.beam_width, candidates)
         else:
+            if self.path:
+                self.path.pop()
+
+
+class HPAPathFind(MinimalPathFindBase):
+    """
+    A hierarchical path find component using HPA*
+
+    Only the way to the first entrance is refined, the rest of the path is refined as the entity gets there
+    """
+    def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity):
+        super().__init__(target)
+        self.map_template = nav_map
+        # Number of points at the front of the path that aren't refined yet
+        self.unrefined = 0
+
+    def path_find(self, start, end, entity):
+        hpa = self.map_template.get_bounded_hpa(entity.get_component(PhysicComponent).bound)
+        path = hpa.find_path(start, end)
+        self.path.clear()
+        self.unrefined = 0
+        if path is not None:
+            self.path.extend(reversed(path))
+            self.unrefined = len(self.path)
+            self.refine_next(start, hpa)
+
+    def refine_next(self, position: Point, hpa: HierarchicalMap):
+        """
+        Refine the way to the next entrance once the entity has walked every refined point
+        """
+        if not self.path or len(self.path) > self.unrefined:
+            return
+        # Skip the entrances that can be walked to straight
+        while self.unrefined > 1 and not hpa.blocked(position, self.path[-2]):
             self.path.pop()
+            self.unrefined -= 1
+        self.unrefined -= 1
+        segment = hpa.refine(position, self.path[-1])
+        if segment is not None:
+            self.path[-1:] = reversed(segment)
+
+    def update(self, entity: AbstractEntity, **kwargs):
+        hpa = self.map_template.get_bounded_hpa(entity.get_component(PhysicComponent).bound)
+        self.refine_next(entity.get_component(SpriteComponent).rect.center, hpa)
+        super().update(entity, **kwargs)
+
+class JPSPathFind(MinimalPathFindBase):
+    """
+    A path find component using Jump Point Search over the walk raster
+
+    Unlike the searches over the navigation graph it doesn't depend on the number of corners,
+    so it stays fast on maps with many small obstacles
+    """
+    def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity):
+        super().__init__(target)
+        self.map_template = nav_map
+
+    def path_find(self, start, end, entity):
+        bound = entity.get_component(PhysicComponent).bound
+        grid = self.map_template.get_bounded_grid(bound)
+        self.path.clear()
+        if not grid.segment_blocked(start, end):
+            self.path.append(end)
+            return
+        jps = self.map_template.get_bounded_jps(bound)
+        start_idx, end_idx = jps.raster.nearest_walkable(start), jps.raster.nearest_walkable(end)
+        if start_idx is None or end_idx is None:
+            return
+        jump_points = jps.search(start_idx, end_idx)
+        if jump_points is None:
+            return
+        points = [jps.raster.to_point(idx) for idx in jump_points[:-1]]
+        points.append(end)
+        self.path.extend(reversed(pull_string(start, points, grid.segment_blocked)))
+
+class FlowField:
+    """
+    The distance of every navigation point to a shared target, built with a backward Dijkstra.
+
+    The field is only rebuilt when the target moves to another cell of the grid
+    """
+    def __init__(self, nav_map: NavigationTemplateMap, bound: Point):
+        self.map_template = nav_map
+        self.bound = bound
+        self.index = nav_map.get_bounded_index(bound)
+        self.grid = nav_map.get_bounded_grid(bound)
+        self.points, self.clusters = nav_map.get_bounded_points(bound)
+        self.region: Point | None = None
+        self.generation = 0
+        self.dist: dict[Point, float] = {}
+        self.next_point: dict[Point, Point | None] = {}
+        # Reverse the edges so the search can run from the target
+        self.reverse_map: dict[Point, list[Point]] = {}
+        for point, neighbours in nav_map.get_bounded_nav(bound).items():
+            for neighbour in neighbours:
+                self.reverse_map.setdefault(neighbour, []).append(point)
+
+    def can_walk(self, start: Point, end: Point):
+        return not self.grid.segment_blocked(start, end)
+
+    def refresh(self, target: Point):
+        """
+        Rebuild the field if the target has changed region. Return whether it was rebuilt
+        """
+        region = tuple(to_cell(target))
+        if region == self.region:
+            return False
+        self.region = region
+        self.generation += 1
+        self.dist.clear()
+        self.next_point.clear()
+        # -- Backward Dijkstra --
+        frontier: list[KeyValueType[float, Point]] = []
+        vect_target = pg.Vector2(target)
+        for point, seen in zip(self.points, self.index.visible_from(target, self.clusters).tolist()):
+            if seen:
+                dist = vect_target.distance_to(point)
+                self.dist[point] = dist
+                self.next_point[point] = None
+                frontier.append(KeyValueType(dist, point))
+        heapq.heapify(frontier)
+        while len(frontier) > 0:
+            curr_dist, point = heapq.heappop(frontier)
+            if curr_dist > self.dist[point]:
+                continue
+            vect = pg.Vector2(point)
+            for prev in self.reverse_map.get(point, []):
+                new_dist = curr_dist + vect.distance_to(prev)
+                if new_dist < self.dist.get(prev, INF):
+                    self.dist[prev] = new_dist
+                    self.next_point[prev] = point
+                    heapq.heappush(frontier, KeyValueType(new_dist, prev))
+        return True
 
+    def get_entry(self, start: Point) -> Point | None:
+        """
+        Get the navigation point that leads to the target in the shortest distance
+        """
+        vect_start = pg.Vector2(start)
+        best, best_dist = None, INF
+        for point, seen in zip(self.points, self.index.visible_from(start, self.clusters).tolist()):
+            if not seen or point not in self.dist:
+                continue
+            dist = self.dist[point] + vect_start.distance_to(point)
+            if dist < best_dist:
+                best, best_dist = point, dist
+        return best
+
+    def get_path(self, entry: Point | None, end: Point) -> Path:
+        """
+        Follow the field from the entry point. The path is reversed with the end at the front
+        """
+        path: Path = []
+        node = entry
+        while node is not None:
+            path.append(node)
+            node = self.next_point[node]
+        path.append(end)
+        path.reverse()
+        return path
+
+class FlowFieldPathFind(MinimalPathFindBase):
+    """
+    A path find component that follows a flow field shared with every entity chasing the same target
+    """
+    def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity):
+        super().__init__(target)
+        self.map_template = nav_map
+        self._generation = 0
+
+    def get_field(self, entity: AbstractEntity):
+        bound = entity.get_component(PhysicComponent).bound
+        fields = self.map_template.flow_fields
+        key = (self.target, bound)
+        if key not in fields:
+            fields[key] = FlowField(self.map_template, bound)
+        return fields[key]
+
+    def update(self, entity: AbstractEntity, **kwargs):
+        field = self.get_field(entity)
+        field.refresh(self.target.get_component(SpriteComponent).rect.center)
+        if self.path and field.generation != self._generation:
+            # The field changed, keep heading to the current point and follow the new field from there
+            start = entity.get_component(SpriteComponent).rect.center
+            self.path_find(start, self.target.get_component(SpriteComponent).rect.center, entity)
+        super().update(entity, **kwargs)
+
+    def path_find(self, start, end, entity):
+        field = self.get_field(entity)
+        field.refresh(end)
+        self._generation = field.generation
+        if field.can_walk(start, end):
+            entry = None
+        elif self.path and self.path[-1] in field.dist:
+            entry = self.path[-1]
+        else:
+            entry = field.get_entry(start)
+            if entry is None:
+                self.path.clear()
+                return
+        self.path[:] = field.get_path(entry, end)
 
 class AND_Node(NamedTuple):
     #type = Literal["AND"]
@@ -210,29 +574,45 @@ SearchNode = AND_Node | OR_Node | Point
 class AOSearching(MinimalPathFindBase):
     """
     A path search component using AND OR Tree
+
+    Within a plan every goal gets one BFS tree over the compiled graph, shared by all the leaves reaching for it,
+    and the solved subgoals are kept in a transposition table
     """
+    # The BFS trees give paths with the fewest corners like UninformedPathFind, they share their cached paths
+    cache_kind = UninformedPathFind
     def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity):
         super().__init__(target)
         self.map_template = nav_map
+        self.path_cache = nav_map.path_cache
         self.update_angle = 90
+        self.bound: Point = (0, 0)
+        self.trees: dict[Point, tuple[list[int], list[int]]] = {}
+        self.solved: dict[tuple[Point, SearchNode], Path | None] = {}
     
     def path_find(self, start, end, entity):
-        bound = entity.get_component(PhysicComponent).bound
-        self.nav_map = self.map_template.get_nav_for(bound, start, end)
+        self.bound = entity.get_component(PhysicComponent).bound
+        self.trees.clear()
+        self.solved.clear()
         # -- AND OR search --
-        path = self.and_or_search(start, AND_Node((end, )), set())
+        path = self.and_or_search(start, AND_Node((end, )))
         self.path.clear()
         if path:
             self.path.extend(p for p in reversed(path) if p != start)
-            
-    def and_or_search(self, point: Point, goal: SearchNode, visited: set[Point]) -> Path | None:
-        if point in visited:
-            return None
 
+    def and_or_search(self, point: Point, goal: SearchNode) -> Path | None:
+        """
+        Search a plan for the goal from the point, a subgoal already solved from the same point is reused
+        """
+        key = (point, goal)
+        if key not in self.solved:
+            self.solved[key] = self.search_goal(point, goal)
+        return self.solved[key]
+
+    def search_goal(self, point: Point, goal: SearchNode) -> Path | None:
         if isinstance(goal, AND_Node):
             result: Path = []
             for subgoal in goal.data:
-                path = self.and_or_search(point, subgoal, visited.copy())
+                path = self.and_or_search(point, subgoal)
                 if path is None:
                     return None
                 result.extend(path)
@@ -240,143 +620,125 @@ class AOSearching(MinimalPathFindBase):
             return result
         elif isinstance(goal, OR_Node):
             for subgoal in goal.data:
-                path = self.and_or_search(point, subgoal, visited.copy())
+                path = self.and_or_search(point, subgoal)
                 if path:
                     return path
             return None
         else:
             # Base case: goal_structure is a position
-            visited.add(point)
             return self.get_path(point, goal)
-        
 
-    def get_path(self, start: Point, end: Point):
-        path: Path = []
-        queue = deque([start])
-        came_from: dict[Point, Point | None] = {start: None}
-        while queue:
-            current = queue.popleft()
-            if current == end:
-                node = end
-                while node is not None:
-                    path.append(node)
-                    node = came_from[node]
-                path.reverse()
-                return path
-            for succ in self.nav_map.get(current, []):
-                if succ not in came_from:
-                    came_from[succ] = current
-                    queue.append(succ)
-        return None
-
-def backtrack_search(picked: list[T], remain: list[T], is_valid: Callable[[list[T]], bool], reached_goal: Callable[[list[T]], bool]) -> list[T] | None:
-    if not remain:
-        return picked
-    for picking in remain:
-        new_picked = picked.copy()
-        new_picked.append(picking)
-        if not is_valid(new_picked):
-            continue
-        if reached_goal(new_picked):
-            return new_picked
-        new_remain = [r for r in remain if r is not picking]
-        result = backtrack_search(new_picked, new_remain, is_valid, reached_goal)
-        if result:
-            return result
-    return None
+    def get_tree(self, goal: Point, query: NavQuery) -> tuple[list[int], list[int]]:
+        """
+        Get the BFS tree of the graph toward the goal, as the number of steps and the next node of every node.
+        The search runs back from the goal over the reversed edges, so the tree only follows edges in their direction
+        """
+        if goal not in self.trees:
+            size = query.graph.node_count
+            depth, parent = [-1] * size, [-1] * size
+            sources = [query.end_id] if query.end_id < size else query.end_from
+            for node in sources:
+                if depth[node] == -1:
+                    depth[node] = 0
+            frontier = deque(sources)
+            predecessors = query.graph.predecessors
+            while frontier:
+                node = frontier.popleft()
+                for pred in predecessors[node]:
+                    if depth[pred] == -1:
+                        depth[pred] = depth[node] + 1
+                        parent[pred] = node
+                        frontier.append(pred)
+            self.trees[goal] = (depth, parent)
+        return self.trees[goal]
+
+    def get_path(self, start: Point, end: Point) -> Path | None:
+        if start == end:
+            return [start]
+        query = self.map_template.get_query(self.bound, start, end)
+        if query.end_id in query.start_neighbours:
+            return [start, end]
+        depth, parent = self.get_tree(end, query)
+        if query.start_id < query.graph.node_count:
+            node = query.start_id
+        else:
+            reachable = [node for node in query.start_neighbours if depth[node] != -1]
+            if not reachable:
+                return None
+            node = min(reachable, key=depth.__getitem__)
+        if depth[node] == -1:
+            return None
+        path: Path = [start]
+        while node != -1:
+            path.append(query.to_point(node))
+            node = parent[node]
+        if path[-1] != end:
+            path.append(end)
+        return path
 
 class BackTrackCSP(MinimalPathFindBase):
+    """
+    A path find component using backtracking search, the corners of the path are the variables
+
+    The search is bounded by CSP_MAX_NODES and CSP_BUDGET_MS, the entity stops when it gives up
+    """
     def __init__(self, nav_map: NavigationTemplateMap, target: AbstractEntity) -> None:
         super().__init__(target)
         self.map_template = nav_map
+        self.path_cache = nav_map.path_cache
+        self.backtrack = BacktrackSearch()
     
     def path_find(self, start, end, entity):
         bound = entity.get_component(PhysicComponent).bound
-        rect_bound = pg.FRect((0, 0), bound)
-        end_vec = pg.Vector2(end)
-        colliable = [collision for collision in self.map_template.collisions if not collision.colliderect(rect_bound)]
-        # -- Backtracking Search --
-        edges: list[Rect] = [rect_bound.move_to(center=end), *(rect_at_edge(rect_bound, edge) for edge in self.map_template.get_collision_edges())]
-        edges.sort(key=lambda r: end_vec.distance_to(r.center))
-
-        def can_walk_to(picked: list[Rect]):
-            prev_rect = rect_bound.move_to(center=start)
-            for rect in picked:
-                if rect_scan_intersect(prev_rect, rect, colliable):
-                    return False
-                prev_rect = rect
-            return True
-        
-        def end_at_target(picked: list[Rect]):
-            return picked[-1].center == end
-        
-        result = backtrack_search([], edges, can_walk_to, end_at_target)
-        if result is None:
-            self.path.clear()
-        else:
-            self.path.clear()
-            self.path.extend(r.center for r in reversed(result))
-
-class Action(IntEnum):
-    N = 0
-    S = 1
-    W = 3
-    E = 4
-    NW = 5
-    NE = 6
-    SW = 7
-    SE = 8
-
-ACTION_TO_DIRECTION = {
-    Action.N: (0, -1),
-    Action.S: (0, 1),
-    Action.W: (-1, 0),
-    Action.E: (1, 0),
-    Action.NW: (-1, -1),
-    Action.NE: (1, -1),
-    Action.SW: (-1, 1),
-    Action.SE: (1, 1)
-}
+        query = self.map_template.get_query(bound, start, end)
+        result = self.backtrack.search(query)
+        self.path.clear()
+        if result is not None:
+            self.path.extend(reversed(result))
 
 class QLearningPathFind(MinimalPathFindBase):
     needs_update = True
     update_order = ORD_PATH
     """
     A reforcement learning path find component using Q-learning
+
+    The path is a rollout of the compiled policy, tiles without a known action take a random one.
+    When a path_batch is passed to update the rollouts of every entity are run together at the end of the frame
     """
-    def __init__(self, map: AbstractPixelMap, qtable: pd.DataFrame, target: AbstractEntity):
+    def __init__(self, map: AbstractPixelMap, qtable: QPolicy | None, target: AbstractEntity):
         super().__init__(target)
         self.map = map
-        self.Q = qtable
-        self.rng = Random()
+        self.policy = qtable
+        self.rng = np.random.default_rng()
+        self.path_batch: Any = None
 
     def to_tile(self, point: Point):
         return (int(point[0] // self.map.tilewidth), int(point[1] // self.map.tileheight))
     
     def from_tile(self, tile: Point):
         return (int((tile[0] + 0.5) * self.map.tilewidth), int((tile[1] + 0.5) * self.map.tileheight))
-    
-    def get_action(self, tile: Point, goal: Point):
-        try:
-            return Action(self.Q.at[tile, goal])
-        except:
-            # Choose a random angle
-            self.rng.seed(hash((tile, localtime().tm_sec)))
-            return cast(Action, Action._member_map_[self.rng.choice(Action._member_names_)])
+
+    def update(self, entity: AbstractEntity, **kwargs):
+        self.path_batch = kwargs.get('path_batch', None)
+        super().update(entity, **kwargs)
+
+    def find_path(self, start: Point, end: Point, entity: AbstractEntity, scheduler: Any = None, workers: Any = None):
+        if self.path_batch is None:
+            super().find_path(start, end, entity, scheduler, workers)
+        else:
+            self.path_batch.request(self, entity, (self.to_tile(start), self.to_tile(end)))
+
+    def get_batch_key(self, _: tuple[Point, Point]):
+        return (self.policy, self.map)
+
+    @staticmethod
+    def run_batch(key: tuple[QPolicy | None, AbstractPixelMap], requests: list[tuple['QLearningPathFind', AbstractEntity, tuple[Point, Point]]]):
+        policy = key[0]
+        starts = np.array([tiles[0] for _, _, tiles in requests], dtype=np.intp)
+        goals = np.array([tiles[1] for _, _, tiles in requests], dtype=np.intp)
+        for (component, _, _), tiles in zip(requests, rollout(policy, starts, goals, requests[0][0].rng)):
+            component.path[:] = [component.from_tile(tile) for tile in reversed(tiles)]
 
     def path_find(self, start: Point, end: Point, entity: AbstractEntity):
-        self.path.clear()
-        steps = iter(range(18))
-        current_tile = self.to_tile(start)
-        current_goal = self.to_tile(end)
-        current_action: Action = self.get_action(current_tile, current_goal)
-        visited = set([current_goal])
-        
-        while current_tile not in visited and next(steps, -1) != -1:
-            visited.add(current_tile)
-            # Get the next tile from the action
-            dir = ACTION_TO_DIRECTION[current_action]
-            current_tile = (current_tile[0] + dir[0], current_tile[1] + dir[1])
-            current_action = self.get_action(current_tile, current_goal)
-            self.path.append(self.from_tile(current_tile))
-        self.path.reverse()
+        tiles = rollout(self.policy, np.array([self.to_tile(start)]), np.array([self.to_tile(end)]), self.rng)[0]
+        self.path[:] = [self.from_tile(tile) for tile in reversed(tiles)]
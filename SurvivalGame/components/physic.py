@@ -1,14 +1,17 @@
 from random import random
 from SurvivalGame.components.abstract import AbstractEntity, CollideTriggerComponent, PhysicComponent, SpriteComponent, EntityBase
-from SurvivalGame.components.grid import SpatialGrid
+from SurvivalGame.components.grid import SpatialGrid, near_pairs, sweep_pairs
 from SurvivalGame.components.state import StateComponent
 from SurvivalGame.const import *
 from SurvivalGame.typing import *
+import numpy as np
 import pygame as pg
 
 class BoundingBoxCollider(PhysicComponent):
     needs_update = True
     update_order = ORD_PHYSIC
+    # Whether the collisions stop the body, PhysicSystem reads it instead of calling should_obj_collide
+    blocking = True
     def __init__(self, bound: Point = (1, 1), direction: Point = (0, 0), speed: float = PhysicComponent.DEFAULT_SPEED, is_solid = True):
         self.solid = is_solid
         self.clip = True # Allow clipping when inside another collider
@@ -39,7 +42,7 @@ class BoundingBoxCollider(PhysicComponent):
             return True
         other_collider = ent.get_component(BoundingBoxCollider, None)
         return other_collider is None or not other_collider.solid
-    def update(self, entity: AbstractEntity, dt: float, collide_grid = None, **_): 
+    def update(self, entity: AbstractEntity, dt: float, collide_grid = None, physic_system: 'PhysicSystem | None' = None, **_):
         state = entity.get_component(StateComponent, None)
         if state and state.health <= 0:
             return
@@ -49,6 +52,9 @@ class BoundingBoxCollider(PhysicComponent):
         if not isinstance(collide_grid, SpatialGrid):
             sprite.rect.center += self.direction * self.speed * dt
             return
+        if physic_system is not None:
+            physic_system.queue(entity, self, sprite, dt)
+            return
         TOLERANCE = 1e-4
         offset = self.direction * self.speed * dt
         kx = 1.0
@@ -103,10 +109,250 @@ class BoundingBoxCollider(PhysicComponent):
         offset.x *= kx
         offset.y *= ky
 
-        collide_grid.remove(entity)
         sprite.rect.center += offset
-        collide_grid.add(entity)
+        collide_grid.move(entity)
 
 class BulletCollider(BoundingBoxCollider):
+    """
+    A collider going through everything. Its box is swept along the move, so nothing it passes between two ticks is missed,
+    and the trigger is called with what it went through in the order it was hit
+    """
+    blocking = False
     def should_obj_collide(self, obj):
-        return False
\ No newline at end of file
+        return False
+    def update(self, entity: AbstractEntity, dt: float, collide_grid = None, **_):
+        sprite = entity.get_component(SpriteComponent, None)
+        if sprite is None:
+            return
+        offset = self.direction * self.speed * dt
+        if not isinstance(collide_grid, SpatialGrid):
+            sprite.rect.center += offset
+            return
+        box = pg.FRect(sprite.rect.center - pg.Vector2(self.bound) / 2, self.bound)
+        hits = collide_grid.sweep(box, box.center + offset, lambda owner: owner is not entity)
+        sprite.rect.center += offset
+        collide_grid.move(entity)
+        trigger = entity.get_component(CollideTriggerComponent, None)
+        if trigger:
+            for hit in hits:
+                trigger.on_any_collided(hit.owner)
+
+def overlaps(boxes: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """
+    Whether each box overlaps the other box of its row, the way FRect.colliderect does in single precision
+    """
+    boxes, others = boxes.astype(np.float32), others.astype(np.float32)
+    return (boxes[:, 0] < others[:, 2]) & (boxes[:, 2] > others[:, 0]) & (boxes[:, 1] < others[:, 3]) & (boxes[:, 3] > others[:, 1])
+
+def get_boxes(corners: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """
+    Get the left, top, right and bottom of boxes from their top left corners and sizes, like the properties of FRect.
+    The corners are kept in single precision
+    """
+    corners = corners.astype(np.float32).astype(np.float64)
+    return np.concatenate([corners, corners + sizes], axis=1)
+
+class PhysicSystem:
+    """
+    Move the bodies of BoundingBoxCollider together once a tick instead of each in its own update.
+    The colliders queue their body while the entities update, then update runs the step of the collider on all of them.
+    The overlapping bodies are found once per pair by a sort and sweep along x, the solid ones are pushed apart
+    from both sides, and the move along each axis stops at the first collision on it.
+
+    Every body sees where the others were at the start of the tick. The separation forces on a body are summed
+    before it's clipped. Like the step of the collider, a body touches what both its box and its move before the separation overlap,
+    even when it's then stopped or pushed back. The touches are kept in contacts, the triggers are called from it once every body has moved.
+    A queued body that isn't in the grid is left alone
+    """
+    SEP_FORCE = 3
+    TOLERANCE = 1e-4
+    def __init__(self, capacity: int = 64):
+        self.entities: list[EntityBase] = []
+        self.colliders: list[BoundingBoxCollider] = []
+        self.sprites: list[SpriteComponent] = []
+        self.queued_dts: list[float] = []
+        # The touches of the last update, a moved body first and None for a rect of the map
+        self.contacts: list[tuple[EntityBase, EntityBase | None]] = []
+        self.capacity = 0
+        self.grow(capacity)
+
+    def grow(self, capacity: int):
+        self.capacity = capacity
+        self.centers = np.zeros((capacity, 2))
+        self.directions = np.zeros((capacity, 2))
+        self.speeds = np.zeros(capacity)
+        self.dts = np.zeros(capacity)
+        self.bounds = np.zeros((capacity, 2))
+        self.solid = np.zeros(capacity, dtype=bool)
+        self.clip = np.zeros(capacity, dtype=bool)
+        self.blocking = np.zeros(capacity, dtype=bool)
+
+    def queue(self, entity: EntityBase, collider: BoundingBoxCollider, sprite: SpriteComponent, dt: float):
+        self.entities.append(entity)
+        self.colliders.append(collider)
+        self.sprites.append(sprite)
+        self.queued_dts.append(dt)
+
+    def cancel(self, entity: EntityBase):
+        for idx in range(len(self.entities) - 1, -1, -1):
+            if self.entities[idx] is entity:
+                del self.entities[idx], self.colliders[idx], self.sprites[idx], self.queued_dts[idx]
+
+    def load(self, count: int):
+        """
+        Copy the state of the queued bodies into the buffers
+        """
+        if count > self.capacity:
+            self.grow(max(count, self.capacity * 2))
+        colliders = self.colliders
+        self.centers[:count] = [sprite.rect.center for sprite in self.sprites]
+        self.directions[:count] = [(collider.direction.x, collider.direction.y) for collider in colliders]
+        self.speeds[:count] = [collider.speed for collider in colliders]
+        self.dts[:count] = self.queued_dts
+        self.bounds[:count] = [collider.bound for collider in colliders]
+        self.solid[:count] = [collider.solid for collider in colliders]
+        self.clip[:count] = [collider.clip for collider in colliders]
+        self.blocking[:count] = [collider.blocking for collider in colliders]
+
+    def get_static_candidates(self, collide_grid: SpatialGrid, count: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get the body, the box and the index of every rect of the map in the 3x3 cells around a body,
+        a big one is there once for each of its cells around the body
+        """
+        cells = (self.centers[:count] // CELL_SIZE).astype(np.int64)
+        static_boxes, static_cells, static_ids = collide_grid.get_static_boxes()
+        rows, cols = near_pairs(cells, static_cells)
+        ids = static_ids[cols]
+        return rows, static_boxes[ids], ids
+
+    def update(self, collide_grid: SpatialGrid):
+        if any(id(entity) not in collide_grid.slots for entity in self.entities):
+            for entity in [entity for entity in self.entities if id(entity) not in collide_grid.slots]:
+                self.cancel(entity)
+        count = len(self.entities)
+        self.contacts = []
+        if count == 0:
+            return
+        self.load(count)
+        centers, directions = self.centers[:count], self.directions[:count]
+        steps = self.speeds[:count] * self.dts[:count]
+        half = self.bounds[:count] / 2
+        sizes = self.bounds[:count].astype(np.float32)
+        boxes = get_boxes(centers - half, sizes)
+        solid, clip = self.solid[:count], self.clip[:count]
+        # -- The bodies by slot, the queued ones with the box of their sprite --
+        own_slots = np.array([collide_grid.slots[id(entity)] for entity in self.entities], dtype=np.intp)
+        body_boxes, occupied = collide_grid.get_body_boxes()
+        body_boxes[own_slots] = boxes
+        row_of = np.full(len(body_boxes), -1, dtype=np.intp)
+        row_of[own_slots] = np.arange(count)
+        alive = np.ones(len(body_boxes), dtype=bool)
+        body_solid = np.zeros(len(body_boxes), dtype=bool)
+        body_solid[own_slots] = solid
+        read = row_of >= 0
+        def read_bodies(slots: np.ndarray):
+            """
+            Read whether the bodies that aren't queued are alive and solid
+            """
+            for slot in slots[~read[slots]].tolist():
+                if read[slot]:
+                    continue
+                read[slot] = True
+                owner = collide_grid.bodies[slot]
+                state = owner.get_component(StateComponent, None)
+                alive[slot] = not (state and state.health <= 0)
+                collider = owner.get_component(BoundingBoxCollider, None)
+                body_solid[slot] = collider is not None and collider.solid
+        def get_passes(rows: np.ndarray, slots: np.ndarray) -> np.ndarray:
+            """
+            should_ent_inside of the bodies of rows for the bodies of the slots
+            """
+            return np.where(solid[rows], ~alive[slots] | ~body_solid[slots], clip[rows])
+        # -- The overlapping pairs, a queued body first --
+        first, second = sweep_pairs(body_boxes[occupied].astype(np.float32))
+        first, second = occupied[first], occupied[second]
+        swap = row_of[first] < 0
+        first, second = np.where(swap, second, first), np.where(swap, first, second)
+        keep = row_of[first] >= 0
+        first, second = first[keep], second[keep]
+        read_bodies(second)
+        # The move the step of the collider tests its touches with, before the bodies are pushed apart
+        tested = get_boxes(boxes[:, :2] + directions * steps[:, None], sizes)
+        # -- Push apart the bodies that shouldn't be inside each other, the same force on both sides --
+        push_first = ~get_passes(row_of[first], second)
+        push_second = (row_of[second] >= 0) & ~get_passes(np.maximum(row_of[second], 0), first)
+        pushing = push_first | push_second
+        if pushing.any():
+            firsts, seconds = first[pushing], second[pushing]
+            sep = (body_boxes[firsts, :2] + body_boxes[firsts, 2:] - body_boxes[seconds, :2] - body_boxes[seconds, 2:]) / 2
+            length = np.hypot(*sep.T)
+            angles = np.array([random() * 2 * np.pi for _ in range(int((length == 0).sum()))])
+            sep[length == 0] = np.stack([np.cos(angles), np.sin(angles)], axis=1).reshape(-1, 2)
+            length[length == 0] = 1.0
+            force = sep / length[:, None] * self.SEP_FORCE
+            np.add.at(directions, row_of[firsts[push_first[pushing]]], force[push_first[pushing]])
+            np.add.at(directions, row_of[seconds[push_second[pushing]]], -force[push_second[pushing]])
+        offsets = directions * steps[:, None]
+        moved = get_boxes(boxes[:, :2] + offsets, sizes)
+        # -- The rects of the map a body may hit --
+        static_rows, static_boxes, static_ids = self.get_static_candidates(collide_grid, count)
+        static_inside = overlaps(boxes[static_rows], static_boxes)
+        static_blocked = overlaps(moved[static_rows], static_boxes) & ~(static_inside & clip[static_rows]) & self.blocking[:count][static_rows]
+        # -- The bodies a body may hit, from a sweep of the boxes the moves cover --
+        swept = body_boxes.copy()
+        swept[own_slots] = np.concatenate([np.minimum(boxes[:, :2], moved[:, :2]), np.maximum(boxes[:, 2:], moved[:, 2:])], axis=1)
+        near_first, near_second = sweep_pairs(swept[occupied])
+        near_first, near_second = occupied[near_first], occupied[near_second]
+        body_rows = np.concatenate([row_of[near_first], row_of[near_second]])
+        body_slots = np.concatenate([near_second, near_first])
+        queued = body_rows >= 0
+        body_rows, body_slots = body_rows[queued], body_slots[queued]
+        body_others = body_boxes[body_slots]
+        # A body pushed out of others is only stopped by the map, the bodies it's pushed into are pushed in turn next tick
+        pushed = np.zeros(count, dtype=bool)
+        pushed[row_of[first[push_first]]] = True
+        pushed[row_of[second[push_second]]] = True
+        body_blocked = overlaps(moved[body_rows], body_others) & self.blocking[:count][body_rows] & solid[body_rows] & ~pushed[body_rows]
+        read_bodies(body_slots[body_blocked])
+        body_blocked &= alive[body_slots] & body_solid[body_slots]
+        body_blocked &= ~(overlaps(boxes[body_rows], body_others) & get_passes(body_rows, body_slots))
+        # -- Clip the moves at the first collision on each axis --
+        rows = np.concatenate([static_rows[static_blocked], body_rows[body_blocked]])
+        others = np.concatenate([static_boxes[static_blocked], body_others[body_blocked]])
+        scales = np.ones((count, 2))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for axis in (0, 1):
+                move = directions[rows, axis]
+                dist = np.where(move > 0, others[:, axis] - boxes[rows, axis + 2], boxes[rows, axis] - others[:, axis + 2])
+                k = np.where(np.abs(dist) > self.TOLERANCE, np.abs(dist / offsets[rows, axis]), 0.0)
+                np.minimum.at(scales[:, axis], rows[move != 0], k[move != 0])
+        centers += offsets * scales
+        # -- Write the bodies back --
+        redirected = set(np.flatnonzero(pushed).tolist())
+        for idx, (entity, collider, sprite, center, (half_w, half_h)) in enumerate(zip(self.entities, self.colliders, self.sprites, centers.tolist(), half.tolist())):
+            rect = sprite.rect
+            rect.center = center
+            if idx in redirected:
+                collider.direction.update(directions[idx].tolist())
+            # The hitbox from the center the rect kept, like obj_get_rect
+            collide_grid.move(entity, pg.FRect(rect.centerx - half_w, rect.centery - half_h, half_w * 2, half_h * 2))
+        # -- The touches, from the boxes tested before the moves were clipped. A big rect of the map is only a touch once --
+        static_touched = static_inside & overlaps(tested[static_rows], static_boxes)
+        touched = dict.fromkeys(zip(static_rows[static_touched].tolist(), static_ids[static_touched].tolist()))
+        self.contacts = [(self.entities[row], None) for row, _ in touched]
+        body_touched = overlaps(boxes[body_rows], body_others) & overlaps(tested[body_rows], body_others)
+        self.contacts.extend((self.entities[row], collide_grid.bodies[slot]) for row, slot in zip(body_rows[body_touched].tolist(), body_slots[body_touched].tolist()))
+        self.entities.clear()
+        self.colliders.clear()
+        self.sprites.clear()
+        self.queued_dts.clear()
+        self.dispatch()
+
+    def dispatch(self):
+        """
+        Call the triggers of the moved bodies with what they touched
+        """
+        for entity, other in self.contacts:
+            trigger = entity.get_component(CollideTriggerComponent, None)
+            if trigger:
+                trigger.on_any_collided(other)
@@ -0,0 +1,136 @@
+from SurvivalGame.components.grid import SpatialGrid, near_pairs, sweep_cross_pairs
+from SurvivalGame.components.sprites import SpriteSheetImage
+from SurvivalGame.components.trigger import bullet_hit
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+import math
+import numpy as np
+import pygame as pg
+
+def segments_enter(starts: np.ndarray, ends: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """
+    Get the part of each segment done when it gets into the (left, top, right, bottom) box of its row, inf when it misses the box
+    or only grazes it
+    """
+    delta = ends - starts
+    # A tiny direction keeps a segment parallel to a slab either always or never inside of it
+    delta[delta == 0] = 1e-12
+    near = (boxes[:, :2] - starts) / delta
+    far = (boxes[:, 2:] - starts) / delta
+    t_enter = np.maximum(np.minimum(near, far).max(axis=1), 0.0)
+    t_exit = np.minimum(np.maximum(near, far).min(axis=1), 1.0)
+    return np.where(t_exit > t_enter, t_enter, np.inf)
+
+class ProjectileSystem:
+    """
+    The bullets in flight, kept in fixed-capacity arrays instead of an entity each.
+
+    The live bullets are the first count rows of the arrays, a bullet that hits or runs out of time is dropped by packing the rows.
+    Like the bullet entities they fly until they hit something unless a lifetime in seconds is given.
+    Each tick the moves of every bullet are tested together against the rects of the map and the entities of the grid,
+    a bullet is spent by the first hit bullet_hit accepts. The bullets are drawn from rotated images made once
+    """
+    def __init__(self, capacity: int = BULLET_CAPACITY, speed: float = BULLET_SPEED, bound: Point = BULLET_BOUND, lifetime: float = INF):
+        self.capacity = capacity
+        self.speed = speed
+        self.bound = bound
+        self.lifetime = lifetime
+        self.count = 0
+        self.positions = np.zeros((capacity, 2))
+        self.velocities = np.zeros((capacity, 2))
+        self.lifetimes = np.zeros(capacity)
+        self.rotations = np.zeros(capacity, dtype=np.intp)
+        self.images: list[pg.Surface] | None = None
+
+    def spawn(self, position: Point, direction: Point) -> bool:
+        """
+        Fire a bullet from the position toward the direction, return False when every slot is taken
+        """
+        if self.count == self.capacity:
+            return False
+        length = math.hypot(*direction)
+        if length == 0:
+            return False
+        idx = self.count
+        self.positions[idx] = position
+        self.velocities[idx] = (direction[0] / length * self.speed, direction[1] / length * self.speed)
+        self.lifetimes[idx] = self.lifetime
+        self.rotations[idx] = round(math.atan2(direction[1], direction[0]) / (2 * math.pi) * BULLET_ROTATIONS) % BULLET_ROTATIONS
+        self.count += 1
+        return True
+
+    def clear(self):
+        self.count = 0
+
+    def get_images(self) -> list[pg.Surface]:
+        """
+        Get the bullet sprite rotated toward each slice of the circle, the first is pointing right
+        """
+        if self.images is None:
+            sprite = SpriteSheetImage.from_yaml(join(PT_SPRITE, 'Props.png')).sprites['Bullet 0']
+            # The sprite points up
+            self.images = [pg.transform.rotate(sprite, -90 - idx * 360 / BULLET_ROTATIONS) for idx in range(BULLET_ROTATIONS)]
+        return self.images
+
+    def get_blits(self, offset: pg.Vector2) -> list[tuple[pg.Surface, Point]]:
+        """
+        Get the image and the top left corner on the screen of every bullet
+        """
+        images = self.get_images()
+        sizes = np.array([image.get_size() for image in images], dtype=np.float64)
+        rotations = self.rotations[:self.count]
+        corners = self.positions[:self.count] + (offset.x, offset.y) - sizes[rotations] / 2
+        return [(images[rotation], corner) for rotation, corner in zip(rotations.tolist(), corners.tolist())]
+
+    def get_hits(self, collide_grid: SpatialGrid, rows: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get every rect and entity the bullets of rows go through from starts to ends, as the row, the part of the move done
+        and the slot of the entity, -1 for a rect of the map. The moves are shorter than a cell
+        """
+        half = np.array(self.bound, dtype=np.float64) / 2
+        # -- The rects of the map, in the 3x3 cells around both ends of a move --
+        static_boxes, static_cells, static_ids = collide_grid.get_static_boxes()
+        cells = np.concatenate([starts, ends]) // CELL_SIZE
+        near_rows, cols = near_pairs(cells.astype(np.int64), static_cells)
+        keys = np.unique(near_rows % len(rows) * len(static_boxes) + static_ids[cols])
+        static_rows, ids = keys // max(len(static_boxes), 1), keys % max(len(static_boxes), 1)
+        static_t = segments_enter(starts[static_rows], ends[static_rows], static_boxes[ids] + np.concatenate([-half, half]))
+        # -- The entities, from a sweep of the boxes the moves cover against the hitboxes of the grid --
+        body_boxes, occupied = collide_grid.get_body_boxes()
+        swept = np.concatenate([np.minimum(starts, ends) - half, np.maximum(starts, ends) + half], axis=1)
+        bullet_rows, slots = sweep_cross_pairs(swept, body_boxes[occupied])
+        slots = occupied[slots]
+        body_t = segments_enter(starts[bullet_rows], ends[bullet_rows], body_boxes[slots] + np.concatenate([-half, half]))
+        hit_rows = np.concatenate([static_rows, bullet_rows])
+        hit_t = np.concatenate([static_t, body_t])
+        hit_slots = np.concatenate([np.full(len(static_rows), -1, dtype=np.intp), slots])
+        hit = hit_t < np.inf
+        return rows[hit_rows[hit]], hit_t[hit], hit_slots[hit]
+
+    def update(self, dt: float, collide_grid: SpatialGrid):
+        count = self.count
+        if count == 0 or dt <= 0:
+            return
+        positions, velocities = self.positions[:count], self.velocities[:count]
+        spent = np.zeros(count, dtype=bool)
+        moves = velocities * dt
+        # Split a long move so no step skips a cell
+        substeps = max(1, math.ceil(np.abs(moves).max() / CELL_SIZE))
+        for _ in range(substeps):
+            rows = np.flatnonzero(~spent)
+            if len(rows) == 0:
+                break
+            starts = positions[rows]
+            ends = starts + moves[rows] / substeps
+            hit_rows, hit_t, hit_slots = self.get_hits(collide_grid, rows, starts, ends)
+            # The hits of a bullet in the order it goes through them
+            for row, slot in zip(*(array[np.lexsort((hit_t, hit_rows))].tolist() for array in (hit_rows, hit_slots))):
+                if spent[row]:
+                    continue
+                spent[row] = bullet_hit(collide_grid.bodies[slot] if slot >= 0 else None)
+            positions[rows] = ends
+        self.lifetimes[:count] -= dt
+        keep = np.flatnonzero(~spent & (self.lifetimes[:count] > 0))
+        self.count = len(keep)
+        for array in (self.positions, self.velocities, self.lifetimes, self.rotations):
+            array[:self.count] = array[keep]
@@ -0,0 +1,200 @@
+from collections.abc import Iterable
+from SurvivalGame.components.qpolicy import ACTION_VALUES, DIRECTIONS, UNKNOWN
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+import numpy as np
+
+# Rewards of a step, the same as qtraining.step
+REWARD_GOAL = 10
+REWARD_STAY = -5
+REWARD_MOVE = -1
+
+class GridEnv:
+    """
+    The tiles of a map the way qtraining walks them, without pygame. The agent starts each step at the center of a tile
+    and moves a tile length, stopped by the collisions like BoundingBoxCollider without clipping.
+    Unlike qtraining the agent can't leave the map, a move out of the map is scored as staying on the tile.
+
+    Where every action of every tile leads is computed once, then the episodes toward a goal run side by side as array operations.
+    The tiles are flat indices like in QPolicy, an action is the column of its value in ACTION_VALUES
+    """
+    # Distance below which BoundingBoxCollider doesn't move
+    TOLERANCE = 1e-4
+    def __init__(self, collisions: Iterable[Rect], width: int, height: int, tilewidth: int, tileheight: int, bound: Point = ENEMY_BOUND):
+        self.width = width
+        self.height = height
+        self.tilewidth = tilewidth
+        self.tileheight = tileheight
+        self.bound = bound
+        self.collisions = np.array([(obj.left, obj.top, obj.right, obj.bottom) for obj in collisions], dtype=np.float64).reshape(-1, 4)
+        self.next_tiles, self.stays = self.build_transitions()
+        self.moves = self.build_reverse(~self.stays & (self.next_tiles >= 0))
+        # A move stopped short still counts when it gets into the goal tile
+        self.touches = self.build_reverse(self.stays & (self.next_tiles >= 0) & (self.next_tiles != np.arange(self.tile_count)[:, None]))
+
+    @property
+    def tile_count(self):
+        return self.width * self.height
+
+    def get_near(self, centers: np.ndarray) -> np.ndarray:
+        """
+        Get which collisions SpatialGrid.get_collidables gives at each center, the ones in the 3x3 cells around it
+        """
+        left, top, right, bottom = self.collisions.T
+        small = (right - left < CELL_SIZE) & (bottom - top < CELL_SIZE)
+        # A small collision is in the cell of its center, a big one in every cell it covers
+        first_x = np.where(small, ((left + right) / 2) // CELL_SIZE, left // CELL_SIZE)
+        last_x = np.where(small, first_x, (np.ceil(right) - 1) // CELL_SIZE)
+        first_y = np.where(small, ((top + bottom) / 2) // CELL_SIZE, top // CELL_SIZE)
+        last_y = np.where(small, first_y, (np.ceil(bottom) - 1) // CELL_SIZE)
+        cell_x, cell_y = (centers[:, 0] // CELL_SIZE)[:, None], (centers[:, 1] // CELL_SIZE)[:, None]
+        return (first_x <= cell_x + 1) & (last_x >= cell_x - 1) & (first_y <= cell_y + 1) & (last_y >= cell_y - 1)
+
+    def build_transitions(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the tile every action of every tile ends in, -1 outside the map, and whether the agent moved less than a tile
+        """
+        tiles = np.arange(self.tile_count)
+        centers = np.stack([(tiles % self.width + 0.5) * self.tilewidth, (tiles // self.width + 0.5) * self.tileheight], axis=1)
+        half = np.array(self.bound, dtype=np.float64) / 2
+        box = np.concatenate([centers - half, centers + half], axis=1)
+        near = self.get_near(centers)
+        left, top, right, bottom = (column[None, :] for column in self.collisions.T)
+        next_tiles = np.full((self.tile_count, len(ACTION_VALUES)), -1, dtype=np.intp)
+        stays = np.zeros((self.tile_count, len(ACTION_VALUES)), dtype=bool)
+        for col, action in enumerate(ACTION_VALUES.tolist()):
+            direction = DIRECTIONS[action].astype(np.float64)
+            offset = direction / np.hypot(*direction) * self.tilewidth
+            moved = box + np.tile(offset, 2)
+            hits = near & (moved[:, 0:1] < right) & (moved[:, 2:3] > left) & (moved[:, 1:2] < bottom) & (moved[:, 3:4] > top)
+            scales = []
+            for axis, (low, high) in enumerate(((left, right), (top, bottom))):
+                if not direction[axis]:
+                    scales.append(np.ones(self.tile_count))
+                    continue
+                dist = low - box[:, axis + 2:axis + 3] if direction[axis] > 0 else box[:, axis:axis + 1] - high
+                k = np.where(np.abs(dist) > self.TOLERANCE, np.abs(dist / offset[axis]), 0.0)
+                scales.append(np.minimum(1.0, np.where(hits, k, np.inf).min(axis=1, initial=np.inf)))
+            # The sprite rect keeps its position in single precision
+            post = (centers + offset * np.stack(scales, axis=1)).astype(np.float32).astype(np.float64)
+            post_x, post_y = (post[:, 0] // self.tilewidth).astype(np.intp), (post[:, 1] // self.tileheight).astype(np.intp)
+            inside = (post_x >= 0) & (post_x < self.width) & (post_y >= 0) & (post_y < self.height)
+            next_tiles[:, col] = np.where(inside, post_y * self.width + post_x, -1)
+            stays[:, col] = np.hypot(*(post - centers).T) < self.tilewidth
+        return next_tiles, stays
+
+    def build_reverse(self, valid: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the tiles leading to each tile with the valid transitions, as an index pointer and the tiles
+        """
+        tiles, _ = np.nonzero(valid)
+        order = np.argsort(self.next_tiles[valid], kind='stable')
+        indptr = np.searchsorted(self.next_tiles[valid][order], np.arange(self.tile_count + 1))
+        return indptr, tiles[order]
+
+    def get_distances(self, goals: np.ndarray) -> np.ndarray:
+        """
+        Get the fewest steps from every tile to each goal, -1 where the goal can't be reached.
+        The searches of all the goals walk the reversed transitions together, one step at a time
+        """
+        dist = np.full((len(goals), self.tile_count), -1, dtype=np.int16)
+        rows, tiles = np.arange(len(goals)), goals.astype(np.intp)
+        dist[rows, tiles] = 0
+        level = 0
+        while len(tiles):
+            level += 1
+            reverses = [self.moves, self.touches] if level == 1 else [self.moves]
+            pairs = [gather(indptr, sources, rows, tiles) for indptr, sources in reverses]
+            rows, tiles = np.concatenate([pair[0] for pair in pairs]), np.concatenate([pair[1] for pair in pairs])
+            fresh = dist[rows, tiles] < 0
+            keys = np.unique(rows[fresh] * self.tile_count + tiles[fresh])
+            rows, tiles = keys // self.tile_count, keys % self.tile_count
+            dist[rows, tiles] = level
+        return dist
+
+    def solve(self, goals: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the exact policy rows of the goals, the first action of a shortest walk from every tile, with the distances.
+        A shortest walk also has the best return with the rewards of step
+        """
+        dist = self.get_distances(goals)
+        valid = ~self.stays & (self.next_tiles >= 0)
+        actions = np.full((len(goals), self.tile_count), UNKNOWN, dtype=np.int8)
+        for row, goal in enumerate(goals.tolist()):
+            after = np.where(valid | (self.next_tiles == goal), dist[row, self.next_tiles], -1)
+            after[after < 0] = np.iinfo(np.int16).max
+            best = after.argmin(axis=1)
+            known = dist[row] > 0
+            actions[row, known] = ACTION_VALUES[best[known]]
+        return actions, dist
+
+    def step(self, tiles: np.ndarray, actions: np.ndarray, goal: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the next tile and the reward of every tile and action toward the goal.
+
+        qtraining lets the agent walk off the map for -1 and learns the tiles out there, which never reach the policy file.
+        The grid has no tiles outside the map, so here such a move keeps the agent on its tile with the stay penalty
+        """
+        post = self.next_tiles[tiles, actions]
+        reached = post == goal
+        stay = ~reached & (self.stays[tiles, actions] | (post < 0))
+        next_tiles = np.where(reached, goal, np.where(stay, tiles, post))
+        rewards = np.where(reached, REWARD_GOAL, np.where(stay, REWARD_STAY, REWARD_MOVE))
+        return next_tiles, rewards
+
+    def train(self, goal: int, spawns: np.ndarray, episodes: int, lanes: int, rng: np.random.Generator,
+              alpha: float, gamma: float, epsilon: float, max_steps: int) -> tuple[np.ndarray, int]:
+        """
+        Q-learning toward one goal, with lanes episodes walking at once from random spawn tiles.
+        Every lane updates the same table, when lanes take the same action on the same tile in a step only one update is kept.
+        An episode that doesn't reach the goal makes the next ones ten times shorter, like qtraining does
+
+        Return the best action value of every tile toward the goal, UNKNOWN for the unvisited tiles, and the episodes run
+        """
+        action_count = len(ACTION_VALUES)
+        q = np.zeros((self.tile_count, action_count))
+        tried = np.zeros((self.tile_count, action_count), dtype=bool)
+        started = min(lanes, episodes)
+        tiles = rng.choice(spawns, started)
+        steps = np.zeros(started, dtype=np.intp)
+        limits = np.full(started, max_steps, dtype=np.intp)
+        finished = 0
+        while len(tiles):
+            greedy = q[tiles].argmax(axis=1)
+            explore = rng.random(len(tiles)) < epsilon
+            actions = np.where(explore, rng.integers(action_count, size=len(tiles)), greedy)
+            next_tiles, rewards = self.step(tiles, actions, goal)
+            # The future value only counts the actions tried from the next tile
+            future = np.where(tried[next_tiles], q[next_tiles], -np.inf).max(axis=1)
+            future[np.isinf(future)] = 0.0
+            old = q[tiles, actions]
+            q[tiles, actions] = old + alpha * (rewards + gamma * future - old)
+            tried[tiles, actions] = True
+            tiles = next_tiles
+            steps += 1
+            reached = tiles == goal
+            done = reached | (steps >= limits)
+            if not done.any():
+                continue
+            finished += int(done.sum())
+            if (done & ~reached).any():
+                max_steps //= 10
+            # Restart the finished lanes while episodes are left
+            keep = ~done
+            restart = np.flatnonzero(done)[:max(0, episodes - started)] if max_steps > 0 else np.empty(0, dtype=np.intp)
+            keep[restart] = True
+            tiles[restart] = rng.choice(spawns, len(restart))
+            steps[restart] = 0
+            limits[restart] = max_steps
+            started += len(restart)
+            tiles, steps, limits = tiles[keep], steps[keep], limits[keep]
+        best = np.where(tried, q, -np.inf).argmax(axis=1)
+        return np.where(tried.any(axis=1), ACTION_VALUES[best], UNKNOWN).astype(np.int8), finished
+
+def gather(indptr: np.ndarray, values: np.ndarray, rows: np.ndarray, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get the values of every node from an index pointer, each with the row of its node
+    """
+    counts = indptr[nodes + 1] - indptr[nodes]
+    firsts = np.repeat(indptr[nodes] - np.cumsum(counts) + counts, counts)
+    return np.repeat(rows, counts), values[firsts + np.arange(counts.sum())]
@@ -0,0 +1,357 @@
+from collections import OrderedDict
+from collections.abc import Iterable
+from enum import IntEnum
+from SurvivalGame.components.map import collision_key
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+import mmap
+import numpy as np
+import os
+import pandas as pd
+import pickle
+import struct
+import zlib
+
+class Action(IntEnum):
+    N = 0
+    S = 1
+    W = 3
+    E = 4
+    NW = 5
+    NE = 6
+    SW = 7
+    SE = 8
+
+ACTION_TO_DIRECTION = {
+    Action.N: (0, -1),
+    Action.S: (0, 1),
+    Action.W: (-1, 0),
+    Action.E: (1, 0),
+    Action.NW: (-1, -1),
+    Action.NE: (1, -1),
+    Action.SW: (-1, 1),
+    Action.SE: (1, 1)
+}
+# Direction of every action value, the values without an action don't move
+DIRECTIONS = np.zeros((max(Action) + 1, 2), dtype=np.intp)
+for action, direction in ACTION_TO_DIRECTION.items():
+    DIRECTIONS[action] = direction
+ACTION_VALUES = np.array([int(action) for action in Action], dtype=np.int8)
+# Entry of the policy without a known action
+UNKNOWN = -1
+# The 3-bit code of every action value in a policy file
+ACTION_CODES = np.zeros(max(Action) + 1, dtype=np.uint8)
+ACTION_CODES[ACTION_VALUES] = np.arange(len(ACTION_VALUES))
+
+# -- Policy file --
+# Header: magic, version, width and height in tiles, number of goal chunks, map hash.
+# Then the chunk of every goal as int32, -1 for the goals without one.
+# A chunk is a bitmap of the tiles with a known action followed by the 3-bit codes of the actions
+POLICY_MAGIC = b'QPOL'
+POLICY_VERSION = 1
+POLICY_HASH_SIZE = 16
+POLICY_HEADER = struct.Struct(f'<4sHHHI{POLICY_HASH_SIZE}s')
+
+def policy_key(collisions: Iterable[Rect], width: int, height: int) -> bytes:
+    """
+    Hash of the map a policy was trained on
+    """
+    return collision_key(collisions, width, height, digest_size=POLICY_HASH_SIZE)
+
+def get_chunk_size(tiles: int):
+    return (tiles + 7) // 8 + (tiles * 3 + 7) // 8
+
+def pack_row(row: np.ndarray) -> bytes:
+    known = row != UNKNOWN
+    codes = ACTION_CODES[np.where(known, row, 0)]
+    bits = np.unpackbits(codes[:, None], axis=1)[:, 5:]
+    return np.packbits(known).tobytes() + np.packbits(bits.ravel()).tobytes()
+
+def unpack_row(chunk: np.ndarray, tiles: int) -> np.ndarray:
+    known_size = (tiles + 7) // 8
+    known = np.unpackbits(chunk[:known_size], count=tiles).astype(bool)
+    bits = np.unpackbits(chunk[known_size:], count=tiles * 3).reshape(-1, 3)
+    codes = bits[:, 0] * 4 + bits[:, 1] * 2 + bits[:, 2]
+    return np.where(known, ACTION_VALUES[codes], UNKNOWN).astype(np.int8)
+
+class QPolicy:
+    """
+    The best action of every (goal, tile) pair of a map, in a dense int8 array indexed by the flat goal and tile.
+    Pairs without a learned action hold UNKNOWN
+    """
+    def __init__(self, actions: np.ndarray, width: int, height: int):
+        self.actions = actions
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def from_dataframe(cls, qtable: pd.DataFrame, width: int, height: int):
+        """
+        Compile a Q-table with the tiles as index and the goals as columns, the way qtraining used to save it
+        """
+        actions = np.full((width * height, width * height), UNKNOWN, dtype=np.int8)
+        tiles = np.array([tuple(tile) for tile in qtable.index], dtype=np.intp).reshape(-1, 2)
+        goals = np.array([tuple(goal) for goal in qtable.columns], dtype=np.intp).reshape(-1, 2)
+        values = qtable.to_numpy(dtype=np.float64, na_value=np.nan)
+        tile_ids, goal_ids = cls.flat(tiles, width, height), cls.flat(goals, width, height)
+        rows, cols = np.nonzero(~np.isnan(values) & (tile_ids >= 0)[:, None] & (goal_ids >= 0)[None, :])
+        actions[goal_ids[cols], tile_ids[rows]] = values[rows, cols].astype(np.int8)
+        return cls(actions, width, height)
+
+    @classmethod
+    def from_actions(cls, items: Iterable[tuple[Point, Point, int]], width: int, height: int):
+        """
+        Compile the (tile, goal, action) of a policy
+        """
+        actions = np.full((width * height, width * height), UNKNOWN, dtype=np.int8)
+        for tile, goal, action in items:
+            if 0 <= tile[0] < width and 0 <= tile[1] < height and 0 <= goal[0] < width and 0 <= goal[1] < height:
+                actions[int(goal[1]) * width + int(goal[0]), int(tile[1]) * width + int(tile[0])] = action
+        return cls(actions, width, height)
+
+    @staticmethod
+    def flat(tiles: np.ndarray, width: int, height: int) -> np.ndarray:
+        """
+        Get the flat index of the tiles, -1 for the tiles outside the map
+        """
+        inside = (tiles[:, 0] >= 0) & (tiles[:, 0] < width) & (tiles[:, 1] >= 0) & (tiles[:, 1] < height)
+        return np.where(inside, tiles[:, 1] * width + tiles[:, 0], -1)
+
+    def get_row(self, goal_id: int) -> np.ndarray:
+        """
+        Get the action of every tile toward a goal
+        """
+        return self.actions[goal_id]
+
+    def lookup(self, tiles: np.ndarray, goals: np.ndarray) -> np.ndarray:
+        """
+        Get the action of every tile toward its goal, UNKNOWN outside the map
+        """
+        tile_ids, goal_ids = self.flat(tiles, self.width, self.height), self.flat(goals, self.width, self.height)
+        known = (tile_ids >= 0) & (goal_ids >= 0)
+        actions = np.full(len(tiles), UNKNOWN, dtype=np.int8)
+        # The entities mostly chase the same goal, each goal row is read once
+        for goal_id in np.unique(goal_ids[known]).tolist():
+            same = known & (goal_ids == goal_id)
+            actions[same] = self.get_row(goal_id)[tile_ids[same]]
+        return actions
+
+    def get_action(self, tile: Point, goal: Point) -> int:
+        return int(self.lookup(np.array([tile], dtype=np.intp), np.array([goal], dtype=np.intp))[0])
+
+    def save(self, path: str, map_hash: bytes):
+        """
+        Write the policy file. The file is replaced at once so a crash can't leave it half written
+        """
+        tiles = self.width * self.height
+        goals = [goal_id for goal_id in range(tiles) if (self.get_row(goal_id) != UNKNOWN).any()]
+        chunks = np.full(tiles, -1, dtype='<i4')
+        chunks[goals] = np.arange(len(goals))
+        temp = f'{path}.tmp'
+        with open(temp, 'wb') as f:
+            f.write(POLICY_HEADER.pack(POLICY_MAGIC, POLICY_VERSION, self.width, self.height, len(goals), map_hash))
+            f.write(chunks.tobytes())
+            for goal_id in goals:
+                f.write(pack_row(self.get_row(goal_id)))
+        os.replace(temp, path)
+
+class MappedQPolicy(QPolicy):
+    """
+    A policy read from a policy file through mmap, a goal row is only read and unpacked when it is looked up.
+    The last unpacked rows are kept.
+
+    The file stays mapped until close, the policy can be used in a with statement
+    """
+    def __init__(self, path: str, map_hash: bytes | None = None, cache_size: int = Q_ROW_CACHE):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.read_header(path, map_hash)
+        except ValueError:
+            self.close()
+            raise
+        self.cache_size = cache_size
+        self.rows: OrderedDict[int, np.ndarray] = OrderedDict()
+        self.empty_row = np.full(self.width * self.height, UNKNOWN, dtype=np.int8)
+
+    def read_header(self, path: str, map_hash: bytes | None):
+        """
+        Check the header against the map and map the chunk table
+        """
+        if len(self.mmap) < POLICY_HEADER.size:
+            raise ValueError(f'{path} is not a policy file')
+        magic, version, width, height, count, file_hash = POLICY_HEADER.unpack_from(self.mmap)
+        if magic != POLICY_MAGIC or version != POLICY_VERSION:
+            raise ValueError(f'{path} is not a policy file of version {POLICY_VERSION}')
+        if map_hash is not None and file_hash != map_hash:
+            raise ValueError(f'{path} was trained on another map')
+        super().__init__(np.empty((0, 0), dtype=np.int8), width, height)
+        self.map_hash = file_hash
+        tiles = width * height
+        self.chunk_size = get_chunk_size(tiles)
+        self.chunks = np.frombuffer(self.mmap, dtype='<i4', count=tiles, offset=POLICY_HEADER.size)
+        self.data_start = POLICY_HEADER.size + 4 * tiles
+        if len(self.mmap) < self.data_start + count * self.chunk_size:
+            raise ValueError(f'{path} is truncated')
+
+    def close(self):
+        # The chunk table is a view of the mapping, it has to go before the mapping can be closed
+        self.chunks = np.empty(0, dtype='<i4')
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def get_row(self, goal_id: int) -> np.ndarray:
+        row = self.rows.get(goal_id, None)
+        if row is not None:
+            self.rows.move_to_end(goal_id)
+            return row
+        chunk = int(self.chunks[goal_id])
+        if chunk < 0:
+            return self.empty_row
+        offset = self.data_start + chunk * self.chunk_size
+        row = unpack_row(np.frombuffer(self.mmap, dtype=np.uint8, count=self.chunk_size, offset=offset), self.width * self.height)
+        self.rows[goal_id] = row
+        if len(self.rows) > self.cache_size:
+            self.rows.popitem(last=False)
+        return row
+
+def get_reaching(policy: QPolicy, goal_ids: np.ndarray) -> np.ndarray:
+    """
+    Get which tiles get to each goal by following the policy, like rollout without the step limit.
+    The walks of every tile are doubled in length until they are longer than the map has tiles, then a walk ends on its goal,
+    in a loop, or on the sink past the last tile where the unknown actions and the moves out of the map go
+    """
+    tiles = policy.width * policy.height
+    flat = np.arange(tiles)
+    coords = np.stack([flat % policy.width, flat // policy.width], axis=1)
+    nexts = np.empty((len(goal_ids), tiles + 1), dtype=np.int32)
+    for row, goal_id in enumerate(goal_ids.tolist()):
+        actions = policy.get_row(goal_id)
+        known = actions != UNKNOWN
+        moved = QPolicy.flat(coords + DIRECTIONS[np.where(known, actions, 0)], policy.width, policy.height)
+        nexts[row, :tiles] = np.where(known & (moved >= 0), moved, tiles)
+        nexts[row, goal_id] = goal_id
+        nexts[row, tiles] = tiles
+    for _ in range(tiles.bit_length()):
+        nexts = np.take_along_axis(nexts, nexts, axis=1)
+    return nexts[:, :tiles] == goal_ids[:, None]
+
+# -- Checkpoint log --
+# Header: magic, version, width and height in tiles, map hash.
+# Then a record per finished goal, appended in the order they finished: goal, chunk size and crc32 of the chunk, then the chunk.
+# A record cut short by a crash fails its check and is dropped when the log is opened again
+LOG_MAGIC = b'QLOG'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct(f'<4sHHH{POLICY_HASH_SIZE}s')
+LOG_RECORD = struct.Struct('<iII')
+
+class PolicyLog:
+    """
+    Checkpoint of a training run. The rows of the finished goals are appended to a log,
+    and the state of the goal in progress is kept in a small cursor file replaced at once
+    """
+    def __init__(self, path: str, width: int, height: int, map_hash: bytes):
+        self.path = path
+        self.cursor_path = f'{path}.cursor'
+        self.width = width
+        self.height = height
+        self.rows: dict[int, np.ndarray] = {}
+        if os.path.exists(path):
+            self.load(map_hash)
+        else:
+            with open(path, 'wb') as f:
+                f.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, width, height, map_hash))
+
+    def load(self, map_hash: bytes):
+        tiles = self.width * self.height
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if len(data) < LOG_HEADER.size:
+            raise ValueError(f'{self.path} is not a checkpoint log')
+        magic, version, width, height, file_hash = LOG_HEADER.unpack_from(data)
+        if magic != LOG_MAGIC or version != LOG_VERSION or (width, height) != (self.width, self.height):
+            raise ValueError(f'{self.path} is not a checkpoint log of version {LOG_VERSION} for this map size')
+        if file_hash != map_hash:
+            raise ValueError(f'{self.path} was trained on another map')
+        end = LOG_HEADER.size
+        while end + LOG_RECORD.size <= len(data):
+            goal_id, size, crc = LOG_RECORD.unpack_from(data, end)
+            chunk = data[end + LOG_RECORD.size:end + LOG_RECORD.size + size]
+            if len(chunk) < size or zlib.crc32(chunk) != crc or not 0 <= goal_id < tiles:
+                break
+            self.rows[goal_id] = unpack_row(np.frombuffer(chunk, dtype=np.uint8), tiles)
+            end += LOG_RECORD.size + size
+        if end < len(data):
+            # Drop the record the last run was writing when it stopped
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+
+    def append(self, goal_id: int, row: np.ndarray):
+        chunk = pack_row(row)
+        with open(self.path, 'ab') as f:
+            f.write(LOG_RECORD.pack(goal_id, len(chunk), zlib.crc32(chunk)) + chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        self.rows[goal_id] = row
+
+    def get_cursor(self) -> dict:
+        if os.path.exists(self.cursor_path):
+            with open(self.cursor_path, 'rb') as f:
+                return pickle.load(f)
+        return {}
+
+    def set_cursor(self, **cursor):
+        temp = f'{self.cursor_path}.tmp'
+        with open(temp, 'wb') as f:
+            pickle.dump(cursor, f)
+        os.replace(temp, self.cursor_path)
+
+    def to_policy(self) -> QPolicy:
+        actions = np.full((self.width * self.height, self.width * self.height), UNKNOWN, dtype=np.int8)
+        for goal_id, row in self.rows.items():
+            actions[goal_id] = row
+        return QPolicy(actions, self.width, self.height)
+
+    def remove(self):
+        for path in (self.path, self.cursor_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+def rollout(policy: QPolicy | None, starts: np.ndarray, goals: np.ndarray, rng: np.random.Generator, steps: int = Q_ROLLOUT_STEPS) -> list[list[Point]]:
+    """
+    Follow the policy from every start tile toward its goal tile, all at once.
+    A rollout stops on a tile it has already walked, the goal counting as walked, or after the given steps.
+    A tile without a known action takes a random one.
+
+    The tiles of each path are in walking order, without the start
+    """
+    count = len(starts)
+    tiles = starts.astype(np.intp).copy()
+    goals = goals.astype(np.intp)
+    # Tiles outside the map can be walked, they get keys past the map
+    def get_keys(tiles: np.ndarray):
+        return (tiles[:, 1] + steps + 1) * (1 << 20) + tiles[:, 0] + steps + 1
+    walked = np.full((count, steps + 2), -1, dtype=np.int64)
+    walked[:, 0] = get_keys(goals)
+    keys = get_keys(tiles)
+    active = keys != walked[:, 0]
+    path = np.zeros((count, steps, 2), dtype=np.intp)
+    lengths = np.zeros(count, dtype=np.intp)
+    for step in range(steps):
+        if not active.any():
+            break
+        walked[active, step + 1] = keys[active]
+        actions = policy.lookup(tiles, goals) if policy is not None else np.full(count, UNKNOWN, dtype=np.int8)
+        unknown = active & (actions == UNKNOWN)
+        actions[unknown] = rng.choice(ACTION_VALUES, int(unknown.sum()))
+        tiles[active] += DIRECTIONS[actions[active]]
+        path[active, step] = tiles[active]
+        lengths[active] += 1
+        keys = get_keys(tiles)
+        active &= ~(walked == keys[:, None]).any(axis=1)
+    return [[(int(x), int(y)) for x, y in path[row, :lengths[row]]] for row in range(count)]
@@ -0,0 +1,132 @@
+from collections.abc import Callable
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+import heapq
+import math
+import numpy as np
+
+SQRT2 = math.sqrt(2)
+# (column, row, cost in cells) of the 8 neighbours of a cell
+NEIGHBOURS = ((1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0), (1, 1, SQRT2), (-1, 1, SQRT2), (1, -1, SQRT2), (-1, -1, SQRT2))
+Box = tuple[int, int, int, int]
+
+def pull_string(start: Point, points: list[Point], blocked: Callable[[Point, Point], bool]) -> list[Point]:
+    """
+    Drop the waypoints that can be skipped by walking straight. The last point is always kept
+    """
+    result: list[Point] = []
+    anchor = start
+    for point, after in zip(points, points[1:]):
+        if blocked(anchor, after):
+            result.append(point)
+            anchor = point
+    if points:
+        result.append(points[-1])
+    return result
+
+class WalkRaster:
+    """
+    The cells of the map an entity can stand on. A cell is blocked when its center is inside one of the
+    collisions inflated by the bounding box of the entity.
+
+    Cells are addressed by their flat index, row * width + column
+    """
+    def __init__(self, rects: np.ndarray, cell_size: int = RASTER_CELL):
+        self.cell_size = cell_size
+        self.width = max(int(math.ceil(rects[:, 2].max() / cell_size)) if len(rects) else 1, 1)
+        self.height = max(int(math.ceil(rects[:, 3].max() / cell_size)) if len(rects) else 1, 1)
+        self.walkable = np.ones((self.height, self.width), dtype=bool)
+        for left, top, right, bottom in (rects / cell_size - 0.5).tolist():
+            col0, col1 = max(math.floor(left) + 1, 0), min(math.ceil(right) - 1, self.width - 1)
+            row0, row1 = max(math.floor(top) + 1, 0), min(math.ceil(bottom) - 1, self.height - 1)
+            if col0 <= col1 and row0 <= row1:
+                self.walkable[row0:row1 + 1, col0:col1 + 1] = False
+        # The searches run in Python where indexing a list is much faster than indexing an array
+        self.cells: list[bool] = self.walkable.ravel().tolist()
+
+    def to_index(self, point: Point) -> int:
+        col = min(max(int(point[0] // self.cell_size), 0), self.width - 1)
+        row = min(max(int(point[1] // self.cell_size), 0), self.height - 1)
+        return row * self.width + col
+
+    def to_point(self, idx: int) -> Point:
+        row, col = divmod(idx, self.width)
+        return ((col + 0.5) * self.cell_size, (row + 0.5) * self.cell_size)
+
+    def nearest_walkable(self, point: Point, radius = 3) -> int | None:
+        """
+        Get the walkable cell of the point, or the closest walkable cell around it.
+        Entities pushed against a wall can stand on a blocked cell
+        """
+        idx = self.to_index(point)
+        if self.cells[idx]:
+            return idx
+        row, col = divmod(idx, self.width)
+        rows = slice(max(row - radius, 0), row + radius + 1)
+        cols = slice(max(col - radius, 0), col + radius + 1)
+        free_rows, free_cols = np.nonzero(self.walkable[rows, cols])
+        if len(free_rows) == 0:
+            return None
+        free_rows += rows.start
+        free_cols += cols.start
+        centers = (np.stack([free_cols, free_rows], axis=1) + 0.5) * self.cell_size
+        best = int(np.argmin(((centers - point) ** 2).sum(axis=1)))
+        return int(free_rows[best]) * self.width + int(free_cols[best])
+
+    def get_cost(self, a: int, b: int):
+        """
+        The octile distance between two cells, the shortest path when nothing is in the way
+        """
+        row_a, col_a = divmod(a, self.width)
+        row_b, col_b = divmod(b, self.width)
+        dx, dy = abs(col_a - col_b), abs(row_a - row_b)
+        return (max(dx, dy) + (SQRT2 - 1) * min(dx, dy)) * self.cell_size
+
+    def search(self, start: int, goal: int | None = None, box: Box | None = None) -> tuple[dict[int, float], dict[int, int]]:
+        """
+        A* from the start to the goal, or Dijkstra to every cell when there is no goal.
+        The search stays inside the box of (column, row, end column, end row).
+        Diagonal moves can't cut the corner of a blocked cell
+        """
+        width, cells, cell_size = self.width, self.cells, self.cell_size
+        col0, row0, col1, row1 = box or (0, 0, self.width, self.height)
+        goal_row, goal_col = divmod(goal, width) if goal is not None else (0, 0)
+        dist: dict[int, float] = {start: 0.0}
+        parent: dict[int, int] = {start: -1}
+        frontier = [(0.0, 0.0, start)]
+        while frontier:
+            _, curr, idx = heapq.heappop(frontier)
+            if idx == goal:
+                break
+            if curr > dist[idx]:
+                continue
+            row, col = divmod(idx, width)
+            for dc, dr, step in NEIGHBOURS:
+                ncol, nrow = col + dc, row + dr
+                if not (col0 <= ncol < col1 and row0 <= nrow < row1):
+                    continue
+                neighbour = idx + dr * width + dc
+                if not cells[neighbour] or (dc and dr and not (cells[idx + dc] and cells[idx + dr * width])):
+                    continue
+                new_dist = curr + step * cell_size
+                if new_dist < dist.get(neighbour, INF):
+                    dist[neighbour] = new_dist
+                    parent[neighbour] = idx
+                    heuristic = 0.0
+                    if goal is not None:
+                        dx, dy = abs(ncol - goal_col), abs(nrow - goal_row)
+                        heuristic = (max(dx, dy) + (SQRT2 - 1) * min(dx, dy)) * cell_size
+                    heapq.heappush(frontier, (new_dist + heuristic, new_dist, neighbour))
+        return dist, parent
+
+    def get_path(self, parent: dict[int, int], goal: int) -> list[int]:
+        """
+        Follow the parents from the goal, the path is in order from the start to the goal without the start
+        """
+        path: list[int] = []
+        idx = goal
+        while parent[idx] != -1:
+            path.append(idx)
+            idx = parent[idx]
+        path.reverse()
+        return path
@@ -1,5 +1,5 @@
 from enum import IntEnum
-from typing import Any, Iterable, overload
+from typing import Any, Iterable, Protocol, overload
 from SurvivalGame.components.abstract import SpriteComponent
 from SurvivalGame.const import *
 from SurvivalGame.typing import *
@@ -14,9 +14,14 @@ class LayerId(IntEnum):
     ABOVE = 4
     OVERLAY = 5
 
+class BlitSource(Protocol):
+    def get_blits(self, offset: pg.Vector2) -> Iterable[tuple[pg.Surface, Point]]: ...
+
 class LayeredRender:
     def __init__(self, scale = 1.0):
         self.sprites: dict[int, list[SpriteComponent]] = {}
+        # Drawn with one blits call each, over the sprites of their layer
+        self.batches: dict[int, list[BlitSource]] = {}
         self.offset = pg.Vector2()
         self.scale = float(scale)
         self.screen = pg.Surface((SCREEN_WIDTH / self.scale, SCREEN_HEIGHT / self.scale))
@@ -38,14 +43,19 @@ class LayeredRender:
         layer = spr.LAYER
         self.sprites[layer].remove(spr)
 
+    def add_batch(self, layer: int, source: BlitSource):
+        self.batches.setdefault(layer, []).append(source)
+
     def render(self, surface: pg.Surface):
         self.sprites.get(LayerId.OBJECT, []).sort(key=lambda spr: spr.rect.centery)
 
-        for layer in sorted(self.sprites.keys()):
+        for layer in sorted(self.sprites.keys() | self.batches.keys()):
             if layer == LayerId.OVERLAY:
                 continue
-            sprites = self.sprites[layer]
+            sprites = self.sprites.get(layer, [])
             self.screen.blits((spr.image, spr.rect.move(self.offset)) for spr in sprites)
+            for source in self.batches.get(layer, []):
+                self.screen.blits(source.get_blits(self.offset), doreturn=False)
             # if layer == LayerId.OBJECT:
             #     for spr in sprites:
             #         dst = spr.rect.move(self.offset)
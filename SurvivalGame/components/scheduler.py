@@ -0,0 +1,72 @@
+from math import dist
+from time import perf_counter
+from SurvivalGame.components.abstract import AbstractEntity, SpriteComponent
+from SurvivalGame.components.navgraph import Search
+from SurvivalGame.components.pathfind import MinimalPathFindBase
+from SurvivalGame.const import *
+
+class PathRequest:
+    def __init__(self, entity: AbstractEntity, frame: int):
+        self.entity = entity
+        self.frame = frame
+
+class PathScheduler:
+    """
+    Run the path requests of every entity within a time budget per frame.
+
+    Requests closer to their target and waiting for longer go first. A search that doesn't finish
+    in the budget is resumed on the next frame, the entity keeps following its old path until then
+    """
+    def __init__(self, budget_ms: float = PATH_BUDGET_MS):
+        self.budget = budget_ms / 1000
+        self.pending: dict[MinimalPathFindBase, PathRequest] = {}
+        self.current: tuple[MinimalPathFindBase, AbstractEntity, Search[None]] | None = None
+        self.frame = 0
+        self.completed = 0
+        self.elapsed = 0.0
+
+    def request(self, component: MinimalPathFindBase, entity: AbstractEntity):
+        if component not in self.pending:
+            self.pending[component] = PathRequest(entity, self.frame)
+
+    def is_pending(self, component: MinimalPathFindBase):
+        return component in self.pending or (self.current is not None and self.current[0] is component)
+
+    def cancel(self, entity: AbstractEntity):
+        """
+        Drop the requests of an entity removed from the scene
+        """
+        for component in [component for component, request in self.pending.items() if request.entity is entity]:
+            del self.pending[component]
+        if self.current is not None and self.current[1] is entity:
+            self.current[2].close()
+            self.current = None
+
+    def get_priority(self, component: MinimalPathFindBase, request: PathRequest):
+        distance = dist(request.entity.get_component(SpriteComponent).rect.center, component.target.get_component(SpriteComponent).rect.center)
+        return distance / (1 + self.frame - request.frame)
+
+    def start_next(self):
+        component = min(self.pending, key=lambda comp: self.get_priority(comp, self.pending[comp]))
+        entity = self.pending.pop(component).entity
+        # The entity has moved since the request, search from where it is now
+        start = entity.get_component(SpriteComponent).rect.center
+        end = component.target.get_component(SpriteComponent).rect.center
+        self.current = (component, entity, component.search(start, end, entity))
+
+    def update(self):
+        self.frame += 1
+        started = perf_counter()
+        deadline = started + self.budget
+        while perf_counter() < deadline:
+            if self.current is None:
+                if not self.pending:
+                    break
+                self.start_next()
+                assert self.current is not None
+            try:
+                next(self.current[2])
+            except StopIteration:
+                self.current = None
+                self.completed += 1
+        self.elapsed = perf_counter() - started
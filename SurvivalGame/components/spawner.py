@@ -1,13 +1,13 @@
 import os
 import pickle
-import pandas as pd
 import pygame as pg
 from random import choice
 from SurvivalGame.components.abstract import AbstractEntity, SpriteComponent, SupportsEntityOperation
 from SurvivalGame.components.camera import CameraComponent
 from SurvivalGame.components.entity import Enemy, EnemyType
 from SurvivalGame.components.map import TmxMap
-from SurvivalGame.components.pathfind import UninformedPathFind, InformedPathFind, LocalPathFind, AOSearching, BackTrackCSP, QLearningPathFind
+from SurvivalGame.components.pathfind import UninformedPathFind, InformedPathFind, LocalPathFind, AOSearching, BackTrackCSP, QLearningPathFind, FlowFieldPathFind, HPAPathFind, JPSPathFind
+from SurvivalGame.components.qpolicy import MappedQPolicy, QPolicy, policy_key
 from SurvivalGame.components.render import LayerId
 from SurvivalGame.components.state import StateComponent
 from SurvivalGame.components.text import AttachedText
@@ -22,11 +22,11 @@ ENEMY_TYPE_TO_SKIN = {
 } 
 
 ENEMY_TYPE_TO_PATHFIND: dict[EnemyType, list[type]] = {
-    EnemyType.WEAK_ZOMBIE: [UninformedPathFind, QLearningPathFind],
-    EnemyType.STRONG_ZOMBIE: [LocalPathFind],
+    EnemyType.WEAK_ZOMBIE: [UninformedPathFind, QLearningPathFind, FlowFieldPathFind],
+    EnemyType.STRONG_ZOMBIE: [LocalPathFind, JPSPathFind],
     EnemyType.WEAK_SKELETON: [BackTrackCSP],
     EnemyType.STRONG_SKELETON: [AOSearching],
-    EnemyType.GHOUL: [InformedPathFind]
+    EnemyType.GHOUL: [InformedPathFind, HPAPathFind]
 }
 
 ENEMY_TYPE_TO_STATS: dict[EnemyType, float] = {
@@ -44,10 +44,13 @@ ENEMY_TYPE_TO_NAME: dict[type, str] = {
     LocalPathFind: 'BEAM',
     AOSearching: 'AND_OR',
     BackTrackCSP: 'Backtrack',
-    QLearningPathFind: 'QLearning'    
+    QLearningPathFind: 'QLearning',
+    FlowFieldPathFind: 'FLOW',
+    HPAPathFind: 'HPA*',
+    JPSPathFind: 'JPS'
 }
 
-def pathfind_resolution(entity: AbstractEntity , pathfind_type: type[UninformedPathFind | InformedPathFind | LocalPathFind | AOSearching | BackTrackCSP | QLearningPathFind], **kwargs):
+def pathfind_resolution(entity: AbstractEntity , pathfind_type: type[UninformedPathFind | InformedPathFind | LocalPathFind | AOSearching | BackTrackCSP | QLearningPathFind | FlowFieldPathFind | HPAPathFind | JPSPathFind], **kwargs):
     if not issubclass(pathfind_type, QLearningPathFind):
         nav_map = kwargs['nav_map']
         target = kwargs['target']
@@ -73,12 +76,25 @@ class EnemySpawnPool:
         self.tmx_map = tmx_map
         self.context = context
 
+        self.qtable: QPolicy | None = None
+        if os.path.exists('qtable.qpol'):
+            try:
+                self.qtable = MappedQPolicy('qtable.qpol', policy_key(tmx_map.collisions, tmx_map.mapwidth, tmx_map.mapheight))
+            except ValueError as ex:
+                print('Warning:', ex)
+        # A policy file that doesn't match the map falls back to the pickled table like a missing one
+        if self.qtable is not None:
+            return
         if os.path.exists('qtable.pkl'):
+            print('Warning: qtable.pkl is loaded whole, convert it to qtable.qpol with qconvert.py')
             with open('qtable.pkl', "rb") as f:
-                self.qtable: pd.DataFrame | None = pickle.load(f)
+                self.qtable = QPolicy.from_dataframe(pickle.load(f), tmx_map.mapwidth, tmx_map.mapheight)
         else:
-            self.qtable = None
-            print('Warning: Missing qtable.pkl for QLearningPathFind')
+            print('Warning: Missing qtable.qpol for QLearningPathFind')
+
+    def close(self):
+        if isinstance(self.qtable, MappedQPolicy):
+            self.qtable.close()
 
     def spawn(self, etype: EnemyType):
         camera = self.player.get_component(CameraComponent).get_rect(self.player)
@@ -42,12 +42,19 @@ class SpriteSheetImage:
         self.sprites = sprites
         self.states = states
 
+    @staticmethod
+    def read_sheet(source) -> SpriteSheet:
+        """
+        Read the slices and states of a sprite sheet without loading its image
+        """
+        src_path = Path(source)
+        return yaml.load(src_path.with_name(src_path.name + '.spdt').open(), yaml.Loader)
+
     @staticmethod
     def from_yaml(source):
         if source not in SpriteSheetImage.LOADED:
-            src_path = Path(source)
-            sheet: SpriteSheet = yaml.load(src_path.with_name(src_path.name + '.spdt').open(), yaml.Loader)
-            image = pg.image.load(src_path)
+            sheet = SpriteSheetImage.read_sheet(source)
+            image = pg.image.load(source)
             sprites = {
                 spr.name: image.subsurface(spr.rect[0], image.height - spr.rect[1] - spr.rect[3], spr.rect[2], spr.rect[3])
                 for spr in sheet.sprites
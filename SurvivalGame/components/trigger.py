@@ -30,17 +30,26 @@ class PlayerTrigger(CollideTriggerComponent):
                 self.ignore_hits[ent] = remaining
 
 
+def bullet_hit(obj) -> bool:
+    """
+    Hit an entity or a rect of the map with a bullet, return whether the bullet is spent.
+    A living enemy is damaged, a rect stops the bullet, anything else lets it through
+    """
+    if isinstance(obj, EntityBase):
+        if 'enemy' in obj.tags:
+            enemy_state = obj.get_component(StateComponent)
+            if enemy_state.health <= 0:
+                return False
+            enemy_state.health -= 10
+            enemy_state.damage = True
+            return True
+        return False
+    return True
+
+
 class BulletTrigger(CollideTriggerComponent):
     def on_attach(self, entity: EntityBase):
         self.owner = entity
     def on_any_collided(self, obj):
-        if isinstance(obj, EntityBase):
-            if 'enemy' in obj.tags:
-                enemy_state = obj.get_component(StateComponent)
-                if enemy_state.health <= 0:
-                    return
-                enemy_state.health -= 10
-                enemy_state.damage = True
-                self.owner.add_tag('killing')
-        else:
-            self.owner.add_tag('killing')
\ No newline at end of file
+        if bullet_hit(obj):
+            self.owner.add_tag('killing')
@@ -0,0 +1,83 @@
+from collections import deque
+from collections.abc import Iterable
+from concurrent.futures import Future, ProcessPoolExecutor
+from time import perf_counter
+from typing import Any, Callable
+from SurvivalGame.components.map import NavigationTemplateMap
+from SurvivalGame.components.navgraph import SearchEngine
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+import multiprocessing
+import os
+import pygame as pg
+
+SEARCHES = {
+    'astar': SearchEngine.astar,
+    'bfs': SearchEngine.bfs,
+}
+
+def spawn_executor(workers: int, initializer: Callable[..., Any] | None = None, initargs: tuple = ()) -> ProcessPoolExecutor:
+    """
+    A process pool for the game's background work
+    """
+    # Workers are spawned rather than forked so the pool behaves the same on every platform
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    return ProcessPoolExecutor(workers, multiprocessing.get_context('spawn'), initializer, initargs)
+
+# The navigation map of a worker process, loaded once when the process starts
+_nav_map: NavigationTemplateMap | None = None
+
+def init_worker(rects: list[BaseRect], cache_dir: str | None, bounds: list[Point]):
+    global _nav_map
+    _nav_map = NavigationTemplateMap([pg.FRect(rect) for rect in rects], cache_dir=cache_dir)
+    _nav_map.preload(bounds)
+
+def worker_search(kind: str, bound: Point, start: Point, end: Point) -> list[Point]:
+    assert _nav_map is not None
+    query = _nav_map.get_query(bound, start, end)
+    return SEARCHES[kind](query.graph.engine, query) or []
+
+class PathWorkerPool:
+    """
+    Search paths in worker processes, each with its own copy of the navigation map.
+
+    The path finders submit a search and poll the future on the following updates.
+    The scene calls update once a frame to count the searches that came back
+    """
+    def __init__(self, nav_map: NavigationTemplateMap, workers: int = PATH_WORKERS, bounds: Iterable[Point] = (ENEMY_BOUND, )):
+        rects = [(rect.x, rect.y, rect.w, rect.h) for rect in nav_map.collisions]
+        self.executor = spawn_executor(workers, init_worker, (rects, nav_map.cache_dir, list(bounds)))
+        self.submitted = 0
+        self.completed = 0
+        # The searches in flight with the time they were submitted
+        self.pending: dict[Future[list[Point]], float] = {}
+        self.latencies: deque[float] = deque(maxlen=100)
+
+    @property
+    def queue_depth(self):
+        return self.submitted - self.completed
+
+    @property
+    def latency(self):
+        """Average round trip time of the last searches in seconds"""
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    def submit(self, kind: str, bound: Point, start: Point, end: Point) -> Future[list[Point]]:
+        future = self.executor.submit(worker_search, kind, bound, start, end)
+        self.pending[future] = perf_counter()
+        self.submitted += 1
+        return future
+
+    def update(self):
+        """
+        Count the searches done since the last frame, on the main thread so the round trip includes the wait for the frame
+        """
+        now = perf_counter()
+        for future in [future for future in self.pending if future.done()]:
+            self.latencies.append(now - self.pending.pop(future))
+            self.completed += 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.submitted -= len(self.pending)
+        self.pending.clear()
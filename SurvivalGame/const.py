@@ -18,12 +18,37 @@ PT_SPRITE = join(PT_ASSET, "sprites")
 PT_AUDIO = join(PT_ASSET, "audios")
 PT_IMAGE = join(PT_ASSET, "images")
 PT_MAP = join(PT_ASSET, "map")
+PT_CACHE = join("SurvivalGame", "cache")
 
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 600
 X_SCREEN_CENTER = SCREEN_WIDTH // 2
 Y_SCREEN_CENTER = SCREEN_HEIGHT // 2
 CELL_SIZE = 32
+NAV_CELL_SIZE = 128
+# Cell size of the walk raster in pixel, and the size of a HPA* cluster in cells
+RASTER_CELL = 8
+HPA_CLUSTER = 16
+ENEMY_BOUND = (10, 11)
+PATH_CACHE_SIZE = 256
+# Size in pixel of the cells the path cache keys the start and end with
+PATH_CACHE_CELL = 64
+PATH_BUDGET_MS = 2.0
+# Number of worker processes searching paths, 0 searches in the game process
+PATH_WORKERS = 0
+# Hard limits of one backtracking search, in assigned corners and milliseconds
+CSP_MAX_NODES = 4000
+CSP_BUDGET_MS = 4.0
+# Most tiles walked by a rollout of the Q-learning policy
+Q_ROLLOUT_STEPS = 18
+# Unpacked goal rows kept from a policy file
+Q_ROW_CACHE = 64
+# Pooled bullets: the most flying at once, their speed in pixel per second and their hitbox
+BULLET_CAPACITY = 1024
+BULLET_SPEED = 300
+BULLET_BOUND = (2, 2)
+# Rotated images of the bullet sprite, one for each slice of the circle
+BULLET_ROTATIONS = 64
 
 TICK_RATE = 120
 
@@ -33,5 +33,6 @@ class SurvivalGame:
                 self.statemgr.current.update(dt=dt, events=events)
                 self.statemgr.current.draw(self.screen)
             pg.display.update()
+        self.statemgr.close()
         pg.quit()
         pass
\ No newline at end of file
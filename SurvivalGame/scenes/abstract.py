@@ -4,4 +4,5 @@ from typing import Protocol
 class AbstractScene(Protocol):
     def __init__(self, game) -> None: ...
     def draw(self, surf: pg.Surface) -> list[pg.FRect | pg.Rect]: ...
-    def update(self, *args, **kwargs) -> None: ...
\ No newline at end of file
+    def update(self, *args, **kwargs) -> None: ...
+    def close(self) -> None: ...
\ No newline at end of file
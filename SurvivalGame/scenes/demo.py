@@ -1,13 +1,19 @@
+import math
 import pygame as pg
 from SurvivalGame.components.abstract import AbstractEntity, PhysicComponent, SpriteComponent
+from SurvivalGame.components.batch import PathBatch
 from SurvivalGame.components.camera import CameraComponent
 from SurvivalGame.components.debug import Debugger, Switches
 from SurvivalGame.components.grid import SpatialGrid
 from SurvivalGame.components.hud import HUD
 from SurvivalGame.components.map import TmxMap
+from SurvivalGame.components.physic import PhysicSystem
+from SurvivalGame.components.projectile import ProjectileSystem
 from SurvivalGame.components.render import LayerId, LayeredRender
+from SurvivalGame.components.scheduler import PathScheduler
 from SurvivalGame.components.spawner import EnemySpawnPool
 from SurvivalGame.components.sprites import BasicSprite
+from SurvivalGame.components.workers import PathWorkerPool
 from SurvivalGame.const import *
 from SurvivalGame.components.entity import Player
 
@@ -19,12 +25,19 @@ class Demo:
         self.rendering = LayeredRender(scale=2)
         self.entities: list[AbstractEntity] = []
         self.collide_grid = SpatialGrid()
+        self.path_scheduler = PathScheduler()
+        self.path_batch = PathBatch()
+        self.physic_system = PhysicSystem()
 
         self.map = TmxMap(path=join(PT_MAP, "map.tmx"), )
+        # A bullet lives long enough to cross the map, the ones that got out of it don't fill the pool
+        self.projectile_system = ProjectileSystem(lifetime=math.hypot(self.map.width, self.map.height) / BULLET_SPEED)
+        self.rendering.add_batch(LayerId.OBJECT, self.projectile_system)
         self.rendering.extend(self.map.map_sprites)
         self.entities.extend(self.map.entities)
         for rect in self.map.collisions:
             self.collide_grid.add(rect)
+        self.path_workers = PathWorkerPool(self.map.template_nav, PATH_WORKERS) if PATH_WORKERS > 0 else None
 
         player_spawn = next(iter(self.map.markers.get('Player', [])), (X_SCREEN_CENTER, Y_SCREEN_CENTER))
         self.player = Player(spawn=player_spawn, skin='Farmer 2')
@@ -51,11 +64,23 @@ class Demo:
             self.gametime += dt
             self.enemy_spawn.update(self.gametime, dt)
         for entity in self.entities.copy(): # copy in case the update add/remove entity
-            entity.update(scene=self, collide_grid=self.collide_grid, dt=dt, *args, **kwargs)
+            entity.update(scene=self, collide_grid=self.collide_grid, path_scheduler=self.path_scheduler, path_workers=self.path_workers, path_batch=self.path_batch, physic_system=self.physic_system, projectile_system=self.projectile_system, dt=dt, *args, **kwargs)
+        self.physic_system.update(self.collide_grid)
+        self.projectile_system.update(dt, self.collide_grid)
+        self.path_batch.update()
+        self.path_scheduler.update()
+        if self.path_workers is not None:
+            self.path_workers.update()
 
     def draw(self, surf: pg.Surface) -> list[pg.FRect | pg.Rect]:
         self.rendering.render(surf)
         return []
+
+    def close(self):
+        self.enemy_spawn.close()
+        if self.path_workers is not None:
+            self.path_workers.shutdown()
+            self.path_workers = None
     
     def add_entity(self, entity: AbstractEntity, **kwargs):
         self.rendering.extend(entity.get_components(SpriteComponent))
@@ -68,4 +93,7 @@ class Demo:
             self.rendering.remove(spr)
         if entity.get_component(PhysicComponent, None):
             self.collide_grid.remove(entity)
+        self.path_scheduler.cancel(entity)
+        self.path_batch.cancel(entity)
+        self.physic_system.cancel(entity)
         self.entities.remove(entity)
\ No newline at end of file
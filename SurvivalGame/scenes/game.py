@@ -22,3 +22,5 @@ class GameScene:
     def draw(self, surface: pg.Surface, _sub: list = []):
         pass
 
+    def close(self):
+        pass
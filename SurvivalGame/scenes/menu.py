@@ -16,4 +16,6 @@ class MenuScene(pg.sprite.Group):
             click=lambda: game.statemgr.setactive("game"),
             border_radius=5
             )
-        
\ No newline at end of file
+
+    def close(self):
+        pass
@@ -14,8 +14,17 @@ class StateManager():
 
     def setactive(self, name: str):
         if name in self.registered:
+            self.close()
             self.current = self.registered[name](game=self.game)
 
+    def close(self):
+        """
+        Release what the current scene holds, like its worker processes
+        """
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
 from SurvivalGame.scenes.game import GameScene
 from SurvivalGame.scenes.menu import MenuScene
 from SurvivalGame.scenes.demo import Demo
\ No newline at end of file
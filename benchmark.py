@@ -0,0 +1,285 @@
+import bisect
+import math
+import pygame as pg
+import sys
+import time
+from itertools import combinations
+from pathlib import Path
+from random import Random
+from SurvivalGame.components.abstract import EntityBase
+from SurvivalGame.components.grid import SpatialGrid, get_cells, get_rank, obj_get_rect, remove_by_identity, to_cell
+from SurvivalGame.components.map import NavigationTemplateMap, read_collisions, ray_intersect
+from SurvivalGame.components.pathfind import HPAPathFind, InformedPathFind, JPSPathFind, UninformedPathFind
+from SurvivalGame.components.physic import BoundingBoxCollider
+from SurvivalGame.components.sprites import BasicSprite
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def get_maps():
+    return sorted(Path(PT_MAP).glob('*.tmx'))
+
+def pairwise_edge_count(nav: NavigationTemplateMap):
+    """
+    Count the edges the way the navigation map used to be built, by testing every pair against every collision
+    """
+    count = 0
+    for edgeStart, edgeEnd in combinations(nav.get_collision_edges(), 2):
+        if not ray_intersect(edgeStart.point, edgeEnd.point, nav.collisions):
+            count += 1
+    return count
+
+def bench_navbuild():
+    print(f"{'map':<20}{'collisions':>12}{'edges':>10}{'build (ms)':>12}{'pairwise (ms)':>15}{'speedup':>10}")
+    for path in get_maps():
+        collisions = read_collisions(str(path))
+        nav, elapsed = timed(NavigationTemplateMap, collisions)
+        edges = sum(len(neighbours) for neighbours in nav.nav_map.values()) // 2
+        ref_edges, ref_elapsed = timed(pairwise_edge_count, nav)
+        if ref_edges != edges:
+            print('Warning:', path.name, 'has', edges, 'edges but the pairwise build has', ref_edges)
+        print(f"{path.name:<20}{len(collisions):>12}{edges:>10}{elapsed * 1000:>12.2f}{ref_elapsed * 1000:>15.2f}{ref_elapsed / max(elapsed, 1e-9):>10.2f}")
+
+def random_queries(collisions: list[Rect], count: int, seed = 0):
+    """
+    Pick random start and end points inside the area of the collisions
+    """
+    rng = Random(seed)
+    left, top = min(obj.left for obj in collisions), min(obj.top for obj in collisions)
+    right, bottom = max(obj.right for obj in collisions), max(obj.bottom for obj in collisions)
+    def random_point():
+        return (rng.uniform(left, right), rng.uniform(top, bottom))
+    return [(random_point(), random_point()) for _ in range(count)]
+
+def scattered_collisions(size = 1120, spacing = 48, obstacle = 16, fill = 0.6, seed = 0) -> list[Rect]:
+    """
+    A map of many small square obstacles on a jittered grid, where the navigation graph gets dense
+    """
+    rng = Random(seed)
+    collisions: list[Rect] = [pg.FRect(0, 0, size, obstacle), pg.FRect(0, size - obstacle, size, obstacle), pg.FRect(0, 0, obstacle, size), pg.FRect(size - obstacle, 0, obstacle, size)]
+    for x in range(spacing, size - spacing, spacing):
+        for y in range(spacing, size - spacing, spacing):
+            if rng.random() < fill:
+                jitter = spacing - obstacle * 2
+                collisions.append(pg.FRect(x + rng.randint(0, jitter), y + rng.randint(0, jitter), obstacle, obstacle))
+    return collisions
+
+def path_length(start: Point, path: list[Point]):
+    return sum(math.dist(a, b) for a, b in zip([start, *reversed(path)], reversed(path)))
+
+def bench_pathfind(count = 300):
+    """
+    Compare the path finding on the navigation map with the compiled graph.
+    The nodes expanded per second only count the search, not inserting the start and end point
+    """
+    entity = EntityBase()
+    entity.add_component(BoundingBoxCollider, ENEMY_BOUND)
+    print(f"{'map':<20}{'search':>8}{'dict (ms)':>12}{'compiled (ms)':>15}{'speedup':>10}{'nodes/s':>12}")
+    for path in get_maps():
+        collisions = read_collisions(str(path))
+        if not collisions:
+            continue
+        nav = NavigationTemplateMap(collisions)
+        nav.preload([ENEMY_BOUND])
+        engine = nav.get_bounded_graph(ENEMY_BOUND).engine
+        queries = random_queries(collisions, count)
+        for name, comp_type, search in (('A*', InformedPathFind, engine.astar), ('BFS', UninformedPathFind, engine.bfs)):
+            dict_comp, compiled_comp = comp_type(nav, entity, compiled=False), comp_type(nav, entity)
+            dict_elapsed = compiled_elapsed = search_elapsed = 0.0
+            expanded = 0
+            for start, end in queries:
+                _, elapsed = timed(dict_comp.path_find, start, end, entity)
+                dict_elapsed += elapsed
+                _, elapsed = timed(compiled_comp.path_find, start, end, entity)
+                compiled_elapsed += elapsed
+                if name == 'A*' and not math.isclose(path_length(start, dict_comp.path), path_length(start, compiled_comp.path)):
+                    print('Warning:', path.name, 'has a different path from', start, 'to', end)
+                elif name == 'BFS' and dict_comp.path != compiled_comp.path:
+                    print('Warning:', path.name, 'has a different path from', start, 'to', end)
+                query = nav.get_query(ENEMY_BOUND, start, end)
+                before = engine.expanded
+                _, elapsed = timed(search, query)
+                search_elapsed += elapsed
+                expanded += engine.expanded - before
+            nodes = expanded / max(search_elapsed, 1e-9)
+            print(f"{path.name:<20}{name:>8}{dict_elapsed * 1000:>12.2f}{compiled_elapsed * 1000:>15.2f}{dict_elapsed / max(compiled_elapsed, 1e-9):>10.2f}{nodes:>12.0f}")
+
+def bench_hpa(count = 300):
+    """
+    Compare HPA* with A* on the navigation map. The HPA* path is fully refined to measure its length
+    """
+    entity = EntityBase()
+    entity.add_component(BoundingBoxCollider, ENEMY_BOUND)
+    print(f"{'map':<20}{'nodes':>8}{'build (ms)':>12}{'A* (ms)':>10}{'HPA* (ms)':>11}{'speedup':>10}{'found':>12}{'length':>10}")
+    for path in get_maps():
+        collisions = read_collisions(str(path))
+        if not collisions:
+            continue
+        nav = NavigationTemplateMap(collisions)
+        nav.preload([ENEMY_BOUND])
+        hpa, build_elapsed = timed(nav.get_bounded_hpa, ENEMY_BOUND)
+        astar, hpa_comp = InformedPathFind(nav, entity), HPAPathFind(nav, entity)
+        astar_elapsed = hpa_elapsed = 0.0
+        astar_found = hpa_found = 0
+        astar_length = hpa_length = 0.0
+        for start, end in random_queries(collisions, count):
+            _, elapsed = timed(astar.path_find, start, end, entity)
+            astar_elapsed += elapsed
+            _, elapsed = timed(hpa_comp.path_find, start, end, entity)
+            hpa_elapsed += elapsed
+            astar_found += bool(astar.path)
+            hpa_found += bool(hpa_comp.path)
+            if astar.path and hpa_comp.path:
+                astar_length += path_length(start, astar.path)
+                # Refine the rest of the path the way the entity would while walking it
+                position = start
+                while hpa_comp.path:
+                    hpa_comp.refine_next(position, hpa)
+                    point = hpa_comp.path.pop()
+                    hpa_length += math.dist(position, point)
+                    position = point
+        print(f"{path.name:<20}{len(hpa.nodes):>8}{build_elapsed * 1000:>12.2f}{astar_elapsed * 1000:>10.2f}{hpa_elapsed * 1000:>11.2f}{astar_elapsed / max(hpa_elapsed, 1e-9):>10.2f}{f'{hpa_found}/{astar_found}':>12}{hpa_length / max(astar_length, 1e-9):>10.3f}")
+
+def bench_jps(count = 300):
+    """
+    Compare Jump Point Search on the walk raster with BFS on the compiled navigation graph
+    """
+    entity = EntityBase()
+    entity.add_component(BoundingBoxCollider, ENEMY_BOUND)
+    print(f"{'map':<20}{'collisions':>12}{'edges':>10}{'BFS (ms)':>10}{'JPS (ms)':>10}{'speedup':>10}{'found':>12}{'length':>10}")
+    maps = [(path.name, read_collisions(str(path))) for path in get_maps()]
+    maps.append(('scattered', scattered_collisions()))
+    for name, collisions in maps:
+        if not collisions:
+            continue
+        nav = NavigationTemplateMap(collisions)
+        nav.preload([ENEMY_BOUND])
+        nav.get_bounded_jps(ENEMY_BOUND)
+        graph = nav.get_bounded_graph(ENEMY_BOUND)
+        bfs, jps = UninformedPathFind(nav, entity), JPSPathFind(nav, entity)
+        bfs_elapsed = jps_elapsed = 0.0
+        bfs_found = jps_found = 0
+        bfs_length = jps_length = 0.0
+        for start, end in random_queries(collisions, count):
+            _, elapsed = timed(bfs.path_find, start, end, entity)
+            bfs_elapsed += elapsed
+            _, elapsed = timed(jps.path_find, start, end, entity)
+            jps_elapsed += elapsed
+            bfs_found += bool(bfs.path)
+            jps_found += bool(jps.path)
+            if bfs.path and jps.path:
+                bfs_length += path_length(start, bfs.path)
+                jps_length += path_length(start, jps.path)
+        edges = len(graph.indices) // 2
+        print(f"{name:<20}{len(collisions):>12}{edges:>10}{bfs_elapsed * 1000:>10.2f}{jps_elapsed * 1000:>10.2f}{bfs_elapsed / max(jps_elapsed, 1e-9):>10.2f}{f'{jps_found}/{bfs_found}':>12}{jps_length / max(bfs_length, 1e-9):>10.3f}")
+
+class ListSpatialGrid:
+    """
+    The grid the way it used to be, a sorted list of objects per cell and a new hitbox for every object of every query
+    """
+    def __init__(self):
+        self.map: dict[Point, list] = dict()
+
+    def add(self, obj, /):
+        for cell in get_cells(obj_get_rect(obj)):
+            bisect.insort_right(self.map.setdefault(cell, []), obj, key=get_rank)
+
+    def remove(self, obj, /):
+        for cell in get_cells(obj_get_rect(obj)):
+            remove_by_identity(self.map[cell], obj)
+
+    def get_collidables(self, point: Point, /):
+        obj_set = set()
+        x, y = to_cell(point)
+        for i in range(x - 1, x + 2):
+            for j in range(y - 1, y + 2):
+                for obj in self.map.get((i, j), []):
+                    obj_rect = obj_get_rect(obj)
+                    if id(obj) in obj_set:
+                        continue
+                    obj_set.add(id(obj))
+                    yield obj_rect, (None if obj_rect is obj else obj)
+
+def bench_grid(count = 1000, ticks = 60, seed = 0):
+    """
+    Move bodies around the map and query the collidables around each of them every tick
+    """
+    rng = Random(seed)
+    print(f"{'grid':<20}{'bodies':>8}{'moves/s':>12}{'queries/s':>12}{'found':>10}")
+    collisions = read_collisions(join(PT_MAP, 'map.tmx'), include_hidden=False)
+    left, top = min(obj.left for obj in collisions), min(obj.top for obj in collisions)
+    right, bottom = max(obj.right for obj in collisions), max(obj.bottom for obj in collisions)
+    for name, grid_type in (('list', ListSpatialGrid), ('slots', SpatialGrid)):
+        bodies: list[EntityBase] = []
+        grid = grid_type()
+        for rect in collisions:
+            grid.add(rect)
+        rng.seed(seed)
+        for _ in range(count):
+            body = EntityBase()
+            body.add_component(BasicSprite, pg.Surface((18, 18)), center=(rng.uniform(left, right), rng.uniform(top, bottom)))
+            body.add_component(BoundingBoxCollider, ENEMY_BOUND)
+            grid.add(body)
+            bodies.append(body)
+        steps = [[(rng.uniform(-2, 2), rng.uniform(-2, 2)) for _ in range(count)] for _ in range(ticks)]
+        move_elapsed = query_elapsed = 0.0
+        found = 0
+        for step in steps:
+            start = time.perf_counter()
+            for body, offset in zip(bodies, step):
+                sprite = body.get_component(BasicSprite)
+                if grid_type is SpatialGrid:
+                    sprite.rect.center += pg.Vector2(offset)
+                    grid.move(body)
+                else:
+                    grid.remove(body)
+                    sprite.rect.center += pg.Vector2(offset)
+                    grid.add(body)
+            move_elapsed += time.perf_counter() - start
+            start = time.perf_counter()
+            for body in bodies:
+                found += sum(1 for _ in grid.get_collidables(body.get_component(BasicSprite).rect.center))
+            query_elapsed += time.perf_counter() - start
+        moves = count * ticks
+        print(f"{name:<20}{count:>8}{moves / max(move_elapsed, 1e-9):>12.0f}{moves / max(query_elapsed, 1e-9):>12.0f}{found // moves:>10}")
+
+def bench_los(count = 20000, seed = 0):
+    """
+    Test random segments for line of sight with the collision index and with the cells the grid walks along each segment
+    """
+    rng = Random(seed)
+    print(f"{'los':<20}{'segments':>10}{'segments/s':>12}{'blocked':>10}")
+    collisions = read_collisions(join(PT_MAP, 'map.tmx'), include_hidden=False)
+    index = NavigationTemplateMap(collisions).get_bounded_index(ENEMY_BOUND)
+    grid = SpatialGrid()
+    for rect in index.collisions:
+        grid.add(rect)
+    left, top = min(obj.left for obj in collisions), min(obj.top for obj in collisions)
+    right, bottom = max(obj.right for obj in collisions), max(obj.bottom for obj in collisions)
+    segments = [((rng.uniform(left, right), rng.uniform(top, bottom)), (rng.uniform(left, right), rng.uniform(top, bottom))) for _ in range(count)]
+    for name, segment_blocked in (('index', index.segment_blocked), ('grid', grid.segment_blocked)):
+        start = time.perf_counter()
+        blocked = sum(segment_blocked(a, b) for a, b in segments)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<20}{count:>10}{count / max(elapsed, 1e-9):>12.0f}{blocked:>10}")
+
+BENCHMARKS = {
+    'navbuild': bench_navbuild,
+    'pathfind': bench_pathfind,
+    'hpa': bench_hpa,
+    'jps': bench_jps,
+    'grid': bench_grid,
+    'los': bench_los,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark {name}, expected one of {', '.join(BENCHMARKS)}")
+        print('--', name, '--')
+        BENCHMARKS[name]()
@@ -0,0 +1,32 @@
+import argparse
+import time
+from pathlib import Path
+from SurvivalGame.components.map import NavigationTemplateMap, read_collisions
+from SurvivalGame.const import *
+from SurvivalGame.typing import *
+
+def parse_bound(text: str):
+    width, height = text.lower().split('x')
+    return (int(width), int(height))
+
+def prebuild(paths: list[Path], bounds: list[Point], clean: bool):
+    keep: set[str] = set()
+    for path in paths:
+        start = time.perf_counter()
+        nav = NavigationTemplateMap(read_collisions(str(path), include_hidden=False), cache_dir=PT_CACHE)
+        nav.preload(bounds)
+        keep.add(nav.key)
+        print(f'{path.name}: {nav.key} in {(time.perf_counter() - start) * 1000:.1f}ms')
+    if clean:
+        for cached in Path(PT_CACHE).glob('*.npy'):
+            if cached.stem.split('_')[0] not in keep:
+                print('Removing stale cache', cached.name)
+                cached.unlink()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Prebuild the navigation cache of the maps')
+    parser.add_argument('maps', nargs='*', type=Path, help=f'the maps to build, every map in {PT_MAP} by default')
+    parser.add_argument('--bound', action='append', type=parse_bound, help='an entity bound like 10x11, can be repeated')
+    parser.add_argument('--clean', action='store_true', help='remove the cache of maps that are not built')
+    args = parser.parse_args()
+    prebuild(args.maps or sorted(Path(PT_MAP).glob('*.tmx')), args.bound or [ENEMY_BOUND], args.clean)
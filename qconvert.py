@@ -0,0 +1,26 @@
+import argparse
+import pickle
+import time
+from pathlib import Path
+from pytmx.pytmx import TiledMap
+from SurvivalGame.components.map import read_objects
+from SurvivalGame.components.qpolicy import QPolicy, policy_key
+from SurvivalGame.const import *
+
+def convert(source: Path, target: Path, map_path: Path):
+    start = time.perf_counter()
+    map_data = TiledMap(str(map_path))
+    with open(source, 'rb') as f:
+        policy = QPolicy.from_dataframe(pickle.load(f), map_data.width, map_data.height)
+    # TmxMap skips the hidden layers, the hash has to match its collisions
+    map_hash = policy_key(read_objects(map_data).collisions, map_data.width, map_data.height)
+    policy.save(str(target), map_hash)
+    print(f'{source} -> {target}: {source.stat().st_size} -> {target.stat().st_size} bytes in {(time.perf_counter() - start) * 1000:.1f}ms')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert a pickled Q-table to a policy file')
+    parser.add_argument('source', nargs='?', type=Path, default=Path('qtable.pkl'), help='the pickled DataFrame, qtable.pkl by default')
+    parser.add_argument('target', nargs='?', type=Path, default=Path('qtable.qpol'), help='the policy file, qtable.qpol by default')
+    parser.add_argument('--map', type=Path, default=Path(PT_MAP, 'map.tmx'), help='the map the table was trained on')
+    args = parser.parse_args()
+    convert(args.source, args.target, args.map)
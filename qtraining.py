@@ -1,20 +1,24 @@
-import os
+import argparse
 import time
+from concurrent.futures import as_completed
 from typing import Callable, NamedTuple
-import pandas as pd
 import pygame as pg
 from SurvivalGame.components.abstract import SpriteComponent
 from SurvivalGame.components.camera import CameraComponent
 from SurvivalGame.components.entity import Enemy, EnemyType
 from SurvivalGame.components.grid import SpatialGrid
-from SurvivalGame.components.map import TmxMap
+from SurvivalGame.components.map import TmxMap, read_objects
+from SurvivalGame.components.qenv import GridEnv
 from SurvivalGame.components.render import LayerId, LayeredRender
+from SurvivalGame.components.sprites import SpriteSheetImage
+from SurvivalGame.components.workers import spawn_executor
 from SurvivalGame.components.physic import BoundingBoxCollider
-from SurvivalGame.components.pathfind import Action
+from SurvivalGame.components.qpolicy import ACTION_CODES, Action, MappedQPolicy, PolicyLog, QPolicy, UNKNOWN, get_reaching, policy_key
+from pytmx.pytmx import TiledMap
 from SurvivalGame.const import *
 from SurvivalGame.typing import *
+import numpy as np
 import random
-import pickle
 from typing import TypeVar
 
 # Typing
@@ -22,7 +26,6 @@ class State(NamedTuple):
     tile: Point
     goal: Point
 GTable = dict[Action, float]
-PostQTable = dict[State, Action]
 T = TypeVar('T')
 # Const
 ACTIONS = list(Action(value) for value in Action._value2member_map_)
@@ -36,8 +39,13 @@ ACTION_TO_DIRECTION = {
     Action.SW: (-1, 1),
     Action.SE: (1, 1)
 }
-SAVE_PROGESS_PATH = 'training.pkl'
-SAVE_PATH = 'qtable.pkl'
+SAVE_PROGESS_PATH = 'training.log'
+SAVE_PATH = 'qtable.qpol'
+SHARD_PATH = 'training.shard{shard}of{shards}.log'
+# Skin of the agent, its sprite size decides which goals get shorter episodes
+AGENT_SKIN = 'Enemy 0'
+# Goals trimmed at once, they take goals * tiles * 4 bytes
+TRIM_BATCH = 512
 # Functions
 def tile_to_pos(tile: Point):
     return ((tile[0] + 0.5) * map.tilewidth, (tile[1] + 0.5) * map.tileheight)
@@ -62,16 +70,11 @@ def update_screen():
         render.render(screen)
         pg.display.update()
 
-def save_progress(**kwarg):
-    with open(SAVE_PROGESS_PATH, "wb") as f:
-        pickle.dump(kwarg, f)
-
-def load_progress() -> dict:
-    if os.path.exists(SAVE_PROGESS_PATH):
-        print('Resume training from', SAVE_PROGESS_PATH)
-        with open(SAVE_PROGESS_PATH, "rb") as f:
-            return pickle.load(f)
-    return {}
+def open_log(path: str, width: int, height: int, map_hash: bytes):
+    log = PolicyLog(path, width, height, map_hash)
+    if log.rows:
+        print('Resume training from', path, 'with', len(log.rows), 'finished goal(s)')
+    return log
 
 def get_time():
     return time.strftime('%H:%M:%S', time.localtime())
@@ -123,60 +126,269 @@ def run_episode(state: State, reached_goal: Callable[[State], bool], scale: floa
             update_screen()
     return False
 
-def trim_table():
-    spawns = map.markers['Enemy']
-    can_reach = set()
-    for x in range(map.mapwidth):
-        for y in range(map.mapheight):
-            reached = set()
-            for spawn in spawns:
-                spawntile = pos_to_tile(spawn)
-                state = State(spawntile, (x, y))
-                reached.add(spawntile)
-                for _ in range(map.mapwidth * map.mapheight * len(ACTIONS)):
-                    best_action: Action | None = POST_Q.get(state)
-                    if best_action is None:
-                        break
-                    dir = ACTION_TO_DIRECTION[best_action]
-                    state = State((state.tile[0] + dir[0], state.tile[1] + dir[1]), state.goal)
-                    if state.tile in reached:
-                        break
-                    reached.add(state.tile)
-                    if state.tile == state.goal:
-                        break
-                if state.tile == state.goal:
-                    can_reach.add((x, y))
-                    break
-            else:
-                #print((x, y), 'was unreached')
-                pass
-    print('Reached', len(can_reach), 'tile(s)')
-    print('Before trimming', len(POST_Q))
-    new_q = {k: v for k, v in POST_Q.items() if k.goal in can_reach}
-    POST_Q.clear()
-    POST_Q.update(new_q)
-    print('After trimming', len(POST_Q))
+def trim_table(policy: QPolicy, spawn_tiles: list[Point]) -> QPolicy:
+    """
+    Drop the goals no spawn gets to by following the policy, with a report of the tiles that get to the goals
+    """
+    tiles = policy.width * policy.height
+    spawn_ids = np.unique(QPolicy.flat(np.array(spawn_tiles, dtype=np.intp).reshape(-1, 2), policy.width, policy.height))
+    spawn_ids = spawn_ids[spawn_ids >= 0]
+    goal_ids = np.array([goal_id for goal_id in range(tiles) if (policy.get_row(goal_id) != UNKNOWN).any()], dtype=np.intp)
+    actions = np.full((tiles, tiles), UNKNOWN, dtype=np.int8)
+    reaching = np.zeros(len(goal_ids), dtype=np.intp)
+    can_reach = np.zeros(len(goal_ids), dtype=bool)
+    spawn_reach = np.zeros(len(spawn_ids), dtype=np.intp)
+    for first in range(0, len(goal_ids), TRIM_BATCH):
+        batch = goal_ids[first:first + TRIM_BATCH]
+        reached = get_reaching(policy, batch)
+        reaching[first:first + len(batch)] = reached.sum(axis=1)
+        can_reach[first:first + len(batch)] = reached[:, spawn_ids].any(axis=1)
+        spawn_reach += reached[:, spawn_ids].sum(axis=0)
+    for goal_id in goal_ids[can_reach].tolist():
+        actions[goal_id] = policy.get_row(goal_id)
+    print('Reached', int(can_reach.sum()), 'of', len(goal_ids), 'goal(s) from', len(spawn_ids), 'spawn tile(s)')
+    for spawn_id, count in zip(spawn_ids.tolist(), spawn_reach.tolist()):
+        print(f'  spawn {(spawn_id % policy.width, spawn_id // policy.width)} reaches {count} goal(s)')
+    if can_reach.any():
+        kept = reaching[can_reach]
+        print(f'Tiles reaching a kept goal: {kept.mean():.1f} on average, {kept.min()} at least, {kept.max()} at most')
+    print('Before trimming', int((policy.actions != UNKNOWN).sum()))
+    print('After trimming', int((actions != UNKNOWN).sum()))
+    return QPolicy(actions, policy.width, policy.height)
+
+def trim_file(map_path: str, path: str):
+    """
+    Trim a policy file in place
+    """
+    map_data = TiledMap(map_path)
+    collisions, markers = read_objects(map_data)
+    map_hash = policy_key(collisions, map_data.width, map_data.height)
+    with MappedQPolicy(path, map_hash) as mapped:
+        policy = QPolicy(np.stack([mapped.get_row(goal_id) for goal_id in range(mapped.width * mapped.height)]), mapped.width, mapped.height)
+    start = time.perf_counter()
+    spawn_tiles = [(int(x // map_data.tilewidth), int(y // map_data.tileheight)) for x, y in markers.get('Enemy', [])]
+    trimmed = trim_table(policy, spawn_tiles)
+    print(f'Trimmed in {time.perf_counter() - start:.2f}s')
+    trimmed.save(path, map_hash)
+
+def is_blocked(center: Point, size: Point, collisions: list[Rect]):
+    """
+    Whether the agent sprite centered on a goal touches a collision
+    """
+    return pg.FRect((0, 0), size).move_to(center=center).collidelist(collisions) >= 0
+
+def get_agent_size() -> Point:
+    """
+    Size of the agent sprite, every frame of its sheet has the same, read without loading the image
+    """
+    rect = SpriteSheetImage.read_sheet(join(PT_SPRITE, f'{AGENT_SKIN}.png')).sprites[0].rect
+    return rect[2], rect[3]
 
-def q_to_dataframe(post_q: dict[State, Action]):
-    data: dict[Point, dict[Point, int]] = {}
-    goals = set()
-    tiles = set()
-    for state, action in post_q.items():
-        goal = (int(state.goal[0]), int(state.goal[1]))
-        tile = (int(state.tile[0]), int(state.tile[1]))
-        goals.add(goal)
-        tiles.add(tile)
-        data.setdefault(goal, {})[tile] = int(action)
-    return pd.DataFrame(data, index=list(tiles), columns=list(goals), dtype=pd.Int16Dtype())
-                
 def get_scale(tile):
-    pos = tile_to_pos(tile)
-    if (agent.get_component(SpriteComponent).rect.move_to(center=pos).collidelist(map.collisions) >= 0):
+    if is_blocked(tile_to_pos(tile), agent.get_component(SpriteComponent).rect.size, map.collisions):
         return 0.5
     else:
         return 1.0
 
+def load_headless(map_path: str) -> tuple[GridEnv, np.ndarray, list[Rect]]:
+    """
+    Get the grid environment of a map, its spawn tiles and its collisions
+    """
+    map_data = TiledMap(map_path)
+    width, height, tilewidth, tileheight = map_data.width, map_data.height, map_data.tilewidth, map_data.tileheight
+    collisions, markers = read_objects(map_data)
+    env = GridEnv(collisions, width, height, tilewidth, tileheight)
+    spawns = np.array([int(y // tileheight) * width + int(x // tilewidth) for x, y in markers.get('Enemy', [])], dtype=np.intp)
+    return env, spawns, collisions
+
+def train_goal(env: GridEnv, spawns: np.ndarray, collisions: list[Rect], goal: int, lanes: int, rng: np.random.Generator):
+    """
+    Train the policy row of one goal, return it with the episodes run and the time it took
+    """
+    goal_y, goal_x = divmod(goal, env.width)
+    # A goal inside a collision gets shorter episodes, like get_scale
+    blocked = is_blocked(((goal_x + 0.5) * env.tilewidth, (goal_y + 0.5) * env.tileheight), get_agent_size(), collisions)
+    max_steps = int(env.tile_count * len(ACTIONS) * (0.5 if blocked else 1.0))
+    start = time.perf_counter()
+    row, episodes = env.train(goal, spawns, EPISODES, lanes, rng, ALPHA, GAMMA, EPSILON, max_steps)
+    return row, episodes, time.perf_counter() - start
+
+def train_headless(map_path: str, lanes: int, seed: int | None):
+    """
+    Train on the tiles of the map with GridEnv instead of moving an Enemy, the policy is saved the same way
+    """
+    env, spawns, collisions = load_headless(map_path)
+    width, height = env.width, env.height
+    rng = np.random.default_rng(seed)
+    map_hash = policy_key(collisions, width, height)
+    log = open_log(SAVE_PROGESS_PATH, width, height, map_hash)
+    total_episodes, total_time = 0, 0.0
+    for goal_x in range(width):
+        for goal_y in range(height):
+            goal_tile = goal_x, goal_y
+            goal = goal_y * width + goal_x
+            if goal in log.rows:
+                continue
+            try:
+                row, episodes, elapsed = train_goal(env, spawns, collisions, goal, lanes, rng)
+            except KeyboardInterrupt:
+                print("Training paused. Progress saved.")
+                exit()
+            log.append(goal, row)
+            total_episodes += episodes
+            total_time += elapsed
+            print(get_time(), "Finished running for", goal_tile, f"{episodes} episodes, {episodes / max(elapsed, 1e-9):.0f} episodes/s")
+    print(f"Trained {total_episodes} episodes in {total_time:.1f}s, {total_episodes / max(total_time, 1e-9):.0f} episodes/s")
+    log.to_policy().save(SAVE_PATH, map_hash)
+    log.remove()
+
+# -- Sharded training --
+# The goals are dealt to the shards in turn, so every shard gets goals from all over the map.
+# A shard appends the row of each finished goal to its own checkpoint log
+def get_shard_path(shard: int, shards: int):
+    return SHARD_PATH.format(shard=shard, shards=shards)
+
+def get_shard_goals(shard: int, shards: int, tile_count: int):
+    return range(shard, tile_count, shards)
+
+def train_shard(map_path: str, shard: int, shards: int, lanes: int, seed: int | None) -> tuple[int, int, float, bool]:
+    """
+    Train the goals of a shard that its checkpoint doesn't have yet, in a worker process.
+    Return the goals, the episodes and the time trained, and whether every goal of the shard is trained
+    """
+    env, spawns, collisions = load_headless(map_path)
+    rng = np.random.default_rng(None if seed is None else (seed, shard))
+    log = PolicyLog(get_shard_path(shard, shards), env.width, env.height, policy_key(collisions, env.width, env.height))
+    goals, total_episodes, total_time = 0, 0, 0.0
+    try:
+        for goal in get_shard_goals(shard, shards, env.tile_count):
+            if goal in log.rows:
+                continue
+            row, episodes, elapsed = train_goal(env, spawns, collisions, goal, lanes, rng)
+            log.append(goal, row)
+            goals += 1
+            total_episodes += episodes
+            total_time += elapsed
+    except KeyboardInterrupt:
+        # The checkpoint already has every finished goal
+        return goals, total_episodes, total_time, False
+    return goals, total_episodes, total_time, True
+
+def merge_shards(map_path: str, shards: int):
+    """
+    Build the policy from the checkpoints of every shard, then remove them.
+    Nothing is merged or removed while a shard has goals left to train
+    """
+    env, _, collisions = load_headless(map_path)
+    map_hash = policy_key(collisions, env.width, env.height)
+    actions = np.full((env.tile_count, env.tile_count), UNKNOWN, dtype=np.int8)
+    logs = [PolicyLog(get_shard_path(shard, shards), env.width, env.height, map_hash) for shard in range(shards)]
+    missing = sum(goal not in log.rows for shard, log in enumerate(logs) for goal in get_shard_goals(shard, shards, env.tile_count))
+    if missing:
+        print(get_time(), "Not merging,", missing, "goal(s) are not trained yet. Progress saved in the shard checkpoints.")
+        return
+    for log in logs:
+        for goal, row in log.rows.items():
+            actions[goal] = row
+    QPolicy(actions, env.width, env.height).save(SAVE_PATH, map_hash)
+    for log in logs:
+        log.remove()
+    print(get_time(), "Merged", shards, "shard(s) into", SAVE_PATH)
+
+def train_sharded(map_path: str, workers: int, lanes: int, seed: int | None):
+    """
+    Train the shards in a pool of worker processes, one shard per worker
+    """
+    start = time.perf_counter()
+    goals, total_episodes, complete = 0, 0, True
+    executor = spawn_executor(workers)
+    try:
+        futures = {executor.submit(train_shard, map_path, shard, workers, lanes, seed): shard for shard in range(workers)}
+        for future in as_completed(futures):
+            shard_goals, episodes, elapsed, shard_complete = future.result()
+            complete &= shard_complete
+            goals += shard_goals
+            total_episodes += episodes
+            print(get_time(), "Shard", futures[future], "trained", shard_goals, f"goal(s), {episodes / max(elapsed, 1e-9):.0f} episodes/s")
+    except KeyboardInterrupt:
+        executor.shutdown(wait=True, cancel_futures=True)
+        print("Training paused. Progress saved in the shard checkpoints.")
+        exit()
+    executor.shutdown()
+    elapsed = time.perf_counter() - start
+    print(f"Trained {goals} goal(s), {total_episodes} episodes in {elapsed:.1f}s, {total_episodes / max(elapsed, 1e-9):.0f} episodes/s")
+    if not complete:
+        print("Training paused. Progress saved in the shard checkpoints.")
+        return
+    merge_shards(map_path, workers)
+
+# -- Exact policy --
+# Goals solved at once, their distances take goals * tiles * 2 bytes
+EXACT_BATCH = 256
+
+def train_exact(map_path: str, compare_path: str | None):
+    """
+    Compute the exact policy of every goal instead of learning it, and report how the learned policy disagrees with it
+    """
+    env, _, collisions = load_headless(map_path)
+    map_hash = policy_key(collisions, env.width, env.height)
+    learned = MappedQPolicy(compare_path, map_hash) if compare_path else None
+    start = time.perf_counter()
+    actions = np.full((env.tile_count, env.tile_count), UNKNOWN, dtype=np.int8)
+    # Pairs with both actions known, the same action, another shortest action, learned for an unreachable goal, missing in the learned policy
+    known = same = shortest = unreachable = missing = 0
+    for first in range(0, env.tile_count, EXACT_BATCH):
+        goals = np.arange(first, min(first + EXACT_BATCH, env.tile_count))
+        rows, dist = env.solve(goals)
+        actions[goals] = rows
+        if learned is None:
+            continue
+        for row, goal in enumerate(goals.tolist()):
+            exact, guess = rows[row], learned.get_row(goal)
+            both = (exact != UNKNOWN) & (guess != UNKNOWN)
+            tiles = np.flatnonzero(both)
+            after = env.next_tiles[tiles, ACTION_CODES[guess[tiles]]]
+            valid = (~env.stays[tiles, ACTION_CODES[guess[tiles]]] & (after >= 0)) | (after == goal)
+            known += len(tiles)
+            same += int((exact[tiles] == guess[tiles]).sum())
+            shortest += int((valid & (dist[row, after] == dist[row, tiles] - 1)).sum())
+            unreachable += int(((guess != UNKNOWN) & (dist[row] < 0)).sum())
+            missing += int(((exact != UNKNOWN) & (guess == UNKNOWN)).sum())
+    elapsed = time.perf_counter() - start
+    print(get_time(), f"Solved {env.tile_count} goal(s) in {elapsed:.2f}s, {int((actions != UNKNOWN).sum())} (tile, goal) pair(s) can reach their goal")
+    if learned is not None:
+        print(f"Compared with {compare_path} on {known} pair(s):")
+        print(f"  same action        {same:>10} ({same / max(known, 1):.1%})")
+        print(f"  another shortest   {shortest - same:>10} ({(shortest - same) / max(known, 1):.1%})")
+        print(f"  longer walk        {known - shortest:>10} ({(known - shortest) / max(known, 1):.1%})")
+        print(f"  unreachable goal   {unreachable:>10} pair(s) learned for a goal they can't reach")
+        print(f"  missing            {missing:>10} reachable pair(s) without a learned action")
+        learned.close()
+    QPolicy(actions, env.width, env.height).save(SAVE_PATH, map_hash)
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the Q-learning policy of the enemies')
+    parser.add_argument('--headless', action='store_true', help='train on the tile grid with NumPy, without pygame')
+    parser.add_argument('--lanes', type=int, default=64, help='episodes walking at once in headless mode')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the headless mode')
+    parser.add_argument('--workers', type=int, default=0, help='train the goals headless in this many processes, each with its own checkpoint')
+    parser.add_argument('--exact', action='store_true', help='compute the shortest walk policy instead of learning it')
+    parser.add_argument('--compare', default=None, help='policy file to compare with the exact policy')
+    parser.add_argument('--trim', action='store_true', help=f'drop the goals of {SAVE_PATH} no spawn gets to')
+    args = parser.parse_args()
+    if args.trim:
+        trim_file(join(PT_MAP, "map.tmx"), SAVE_PATH)
+        exit()
+    if args.exact:
+        train_exact(join(PT_MAP, "map.tmx"), args.compare)
+        exit()
+    if args.workers > 0:
+        train_sharded(join(PT_MAP, "map.tmx"), args.workers, args.lanes, args.seed)
+        exit()
+    if args.headless:
+        train_headless(join(PT_MAP, "map.tmx"), args.lanes, args.seed)
+        exit()
+
     pg.init()
     running = True
     screen = pg.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
@@ -189,7 +401,7 @@ if __name__ == '__main__':
     for spr in map.map_sprites:
         render.add(spr)
 
-    agent = Enemy(type_name=EnemyType.UNKNOWN, skin="Enemy 0", speed=map.tilewidth, spawn=(0, 0))
+    agent = Enemy(type_name=EnemyType.UNKNOWN, skin=AGENT_SKIN, speed=map.tilewidth, spawn=(0, 0))
     agent.add_component(CameraComponent, render)
     render.add(agent.get_component(SpriteComponent))
     agent_physic = agent.get_component(BoundingBoxCollider)
@@ -198,22 +410,24 @@ if __name__ == '__main__':
 
     # Q[(state, goal)][action] = value
     Q: dict[State, GTable] = {}
-    POST_Q: PostQTable = {}
 
-    session_data = load_progress()
-    last_x = session_data.get("x", 0)
-    last_y = session_data.get("y", 0)
-    last_ep = session_data.get("ep", 0)
-    Q.update(session_data.get("q_table", {}))
-    POST_Q.update(session_data.get('post_q', {}))
+    map_hash = policy_key(map.collisions, map.mapwidth, map.mapheight)
+    log = open_log(SAVE_PROGESS_PATH, map.mapwidth, map.mapheight, map_hash)
+    cursor = log.get_cursor()
 
     # Training loop
-    scale: float | None = session_data.get('scale', None)
-    for goal_x in range(last_x, map.mapwidth):
-        for goal_y in range(last_y, map.mapheight):
+    for goal_x in range(map.mapwidth):
+        for goal_y in range(map.mapheight):
             goal_tile = goal_x, goal_y
-            if last_ep == 0:
-                Q.clear()
+            goal_id = goal_y * map.mapwidth + goal_x
+            if goal_id in log.rows:
+                continue
+            Q.clear()
+            last_ep, scale = 0, None
+            # The goal the last run paused in
+            if cursor.get('goal') == goal_tile:
+                Q.update(cursor['q_table'])
+                last_ep, scale = cursor['ep'], cursor['scale']
             if scale is None:
                 scale = get_scale((goal_x, goal_y))
             for ep in range(last_ep, EPISODES):
@@ -238,23 +452,21 @@ if __name__ == '__main__':
                     print(ex)
                     running = False
                 if not running:
-                    save_progress(x=goal_x, y=goal_y, ep=ep, q_table=Q, scale=scale, post_q=POST_Q)
+                    log.set_cursor(goal=goal_tile, ep=ep, q_table=Q, scale=scale)
                     print("Training paused. Progress saved.")
                     pg.quit()
                     exit()
+            row = np.full(map.mapwidth * map.mapheight, UNKNOWN, dtype=np.int8)
             for state, gtable in Q.items():
                 best_action = max(gtable, key=gtable.__getitem__, default=None)
-                if best_action:
-                    POST_Q.setdefault(state, best_action)
-            scale = None
-            last_ep = 0
+                if best_action is not None:
+                    tile_x, tile_y = int(state.tile[0]), int(state.tile[1])
+                    if 0 <= tile_x < map.mapwidth and 0 <= tile_y < map.mapheight:
+                        row[tile_y * map.mapwidth + tile_x] = best_action
+            log.append(goal_id, row)
             print("Finished running for", goal_tile)
-        last_y = 0
     
     # Save
-    with open(SAVE_PATH, 'wb') as f:
-        pickle.dump(q_to_dataframe(POST_Q), f)
-
-    if os.path.exists(SAVE_PROGESS_PATH):
-        os.remove(SAVE_PROGESS_PATH)
+    log.to_policy().save(SAVE_PATH, map_hash)
+    log.remove()
     pg.quit()
\ No newline at end of file